@@ -0,0 +1,75 @@
+import json
+import click
+from frappe.commands import get_site, pass_context
+
+
+@click.command('gdp-forecast-daemon')
+@click.option('--socket', 'socket_path',
+    help='Unix socket to listen on (default: config/gdp_forecast/gdp_forecast.sock in the bench)')
+@click.option('--workers', type=int, help='Size of the warm fitting pool (default: gdp_forecast_workers or CPU count)')
+@pass_context
+def gdp_forecast_daemon(context, socket_path=None, workers=None):
+    "Run the warm GDP forecasting daemon for the --site sites (add it to the Procfile)"
+    from gdp_forecasting.forecast_scripts.forecast_daemon import serve
+
+    try:
+        serve(socket_path, workers, sites=context.sites)
+    except ValueError as e:
+        raise click.UsageError(str(e))
+
+
+@click.command('gdp-forecast-benchmark')
+@click.option('--sectors', type=float, default=1.0, help='Scale factor for the number of sectors')
+@click.option('--regions', type=float, default=1.0, help='Scale factor for the number of regions')
+@click.option('--years', type=float, default=1.0, help='Scale factor for the number of years')
+@click.option('--db', 'backend', type=click.Choice(['sqlite', 'mariadb']), default='sqlite',
+    help='sqlite: in-memory stand-in (default). mariadb: the site database, whose forecasting tables are replaced')
+@click.option('--forecaster', 'forecast_types', multiple=True, help='Forecast type to run (default: all)')
+@click.option('--engine', help='Holt-Winters engine (default: gdp_forecast_engine)')
+@click.option('--workers', type=int, help='Holt-Winters fitting processes')
+@click.option('--seed', type=int, default=0, help='Seed for the synthetic data')
+@click.option('--output', help='Result file (default: gdp_forecast_benchmark_<commit>_<time>.json)')
+@click.option('--compare', 'baseline', help='Earlier result file to compare against')
+@click.option('--yes', is_flag=True, help='Do not ask before replacing the site data with --db mariadb')
+@pass_context
+def gdp_forecast_benchmark(context, sectors, regions, years, backend, forecast_types, engine, workers, seed,
+        output, baseline, yes):
+    "Time ingest, forecasting and the report on synthetic data"
+    import frappe
+    from gdp_forecasting.gdp_forecasting.benchmark import compare_results, run_benchmark, save_result
+
+    if backend == 'mariadb' and not yes:
+        click.confirm('This replaces the GDP datasets and forecasts of the site. Continue?', abort=True)
+
+    frappe.init(site=get_site(context))
+    frappe.connect()
+    try:
+        result = run_benchmark(sectors, regions, years, backend, list(forecast_types) or None, engine, workers, seed)
+    finally:
+        frappe.destroy()
+
+    for name, stage in result['stages'].items():
+        click.echo(f"{name:40} {stage['seconds']:10.4f}s")
+    for forecast_type, timings in result['forecasters'].items():
+        if 'seconds' in timings:
+            click.echo(f"{forecast_type:40} {timings['seconds']:10.4f}s "
+                f"(load {timings['load_seconds']}s, fit {timings['fit_seconds']}s, write {timings['write_seconds']}s)")
+        else:
+            click.echo(f"{forecast_type:40} {timings.get('skipped') or timings.get('error')}")
+    for forecast_type, timings in result['backtests'].items():
+        if isinstance(timings, dict) and 'seconds' in timings:
+            click.echo(f"backtest {forecast_type:31} {timings['seconds']:10.4f}s "
+                f"({timings['series']} series x {timings['origins']} origins)")
+        else:
+            click.echo(f"backtest {forecast_type:31} {timings.get('error') if isinstance(timings, dict) else timings}")
+    click.echo(f"Saved {save_result(result, output)}")
+
+    if baseline:
+        with open(baseline) as f:
+            before = json.load(f)
+        click.echo(f"\nCompared with {before.get('commit')} ({before.get('started_at')}):")
+        for name, old, new, ratio in compare_results(before, result):
+            click.echo(f"{name:60} {old:10.4f}s -> {new:10.4f}s  x{ratio}")
+
+
+commands = [gdp_forecast_daemon, gdp_forecast_benchmark]
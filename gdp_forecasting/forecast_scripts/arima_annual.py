@@ -1,73 +1,29 @@
 import numpy as np
 import pandas as pd
+import frappe
 from pmdarima import auto_arima
 from sklearn.metrics import mean_absolute_error, mean_squared_error
 from statsmodels.tsa.stattools import adfuller
-from pathlib import Path
-import os
-from dotenv import load_dotenv
-from django.db import connection
-from django.conf import settings
-import django
+from gdp_forecasting.forecast_scripts.arima_orders import fit_with_order_memory
+from gdp_forecasting.forecast_scripts.data_access import forecast_run, get_sectors, load_dataset
+from gdp_forecasting.forecast_scripts.model_cache import cache_key, cached_fit, get_model_cache
+from gdp_forecasting.forecast_scripts.result_writer import forecast_frame, write_results
+from gdp_forecasting.gdp_forecasting.instrumentation import span
 
-# Initialize Django settings
-BASE_DIR = Path(__file__).resolve().parent.parent
-env_path = BASE_DIR.parent / '.env'
-load_dotenv(dotenv_path=env_path)
+# Function to load and clean the annual dataset
+def load_and_clean_data():
+    df = load_dataset('Annual', sectors=get_sectors('annual'), columns=['sector', 'year', 'gdp'])
 
-DB_USER = os.getenv('DB_USER')
-DB_PASSWORD = os.getenv('DB_PASSWORD')
-DB_HOST = os.getenv('DB_HOST')
-DB_PORT = os.getenv('DB_PORT')
-DB_NAME = os.getenv('DB_NAME')
+    with span('pivot', rows=len(df)) as fields:
+        # Aggregate GDP values for the same sector and year
+        df = df.groupby(['sector', 'year']).sum().reset_index()
 
-settings.configure(
-    DATABASES={
-        'default': {
-            'ENGINE': 'sql_server.pyodbc',
-            'NAME': DB_NAME,
-            'USER': DB_USER,
-            'PASSWORD': DB_PASSWORD,
-            'HOST': DB_HOST,
-            'PORT': DB_PORT,
-            'OPTIONS': {
-                'driver': 'ODBC Driver 17 for SQL Server',
-                'extra_params': 'TrustServerCertificate=yes;',
-            },
-        }
-    },
-    INSTALLED_APPS=[
-        'django.contrib.contenttypes',
-    ],
-    USE_TZ=True,
-    TIME_ZONE='UTC+3',
-)
+        # Pivot the dataset to have years as columns
+        df_pivot = df.pivot(index='sector', columns='year', values='gdp').reset_index()
 
-django.setup()
-
-# Function to load and clean data from SQL Server
-def load_and_clean_data_from_sql_server():
-    with connection.cursor() as cursor:
-        cursor.execute("SELECT * FROM annual_dataset")
-        rows = cursor.fetchall()
-        columns = [col[0] for col in cursor.description]
-        df = pd.DataFrame(rows, columns=columns)
-
-    # Keep only relevant columns and aggregate GDP values for the same sector and year
-    df = df[['sector', 'year', 'gdp']].groupby(['sector', 'year']).sum().reset_index()
-    relevant_sectors = [
-        'Agriculture, Forestry & Fishing', 'Mining & Quarrying', 'Manufacturing',
-        'Electricity, Gas and Water', 'Construction', 'Wholesale & Retail Trade, Restaurants & hotels',
-        'Transport, Storage & Communication', 'Finance, Insurance, Real Estate & Business Services',
-        'Community, Social & Personal Services', 'Government Activities', 'Gross Domestic Product', 'Total Riyadh GDP'
-    ]
-    df = df[df['sector'].isin(relevant_sectors)]
-
-    # Pivot the dataset to have years as columns
-    df_pivot = df.pivot(index='sector', columns='year', values='gdp').reset_index()
-
-    # Fill NaN values with 0 (or use any other method to handle missing data)
-    df_pivot = df_pivot.fillna(0)
+        # Fill NaN values with 0 (or use any other method to handle missing data)
+        df_pivot = df_pivot.fillna(0)
+        fields['sectors'] = len(df_pivot)
 
     return df_pivot
 
@@ -79,36 +35,53 @@ def make_stationary(series):
     return series
 
 # Function to forecast GDP using AUTO ARIMA and calculate accuracy metrics
-def forecast_gdp_auto_arima(data, start_year, end_year):
+def forecast_gdp_auto_arima(data, start_year, end_year, progress_callback=None, use_cache=True):
     forecast_years = np.arange(start_year, end_year + 1)
     forecasts = {}
     metrics = {}
     total_mae = []
     total_mse = []
     total_rmse = []
-
-    with connection.cursor() as cursor:
-        cursor.execute("TRUNCATE TABLE arima_annual")
-
-        for sector in data['sector']:
-            series = data.loc[data['sector'] == sector, 2015:2023].values.flatten()
-            series = make_stationary(series)  # Make the series stationary if needed
-            model = auto_arima(series, seasonal=True, stepwise=True, suppress_warnings=True)
-            forecast = model.predict(n_periods=len(forecast_years))
-            forecasts[sector] = forecast
-
-            # Calculate metrics
-            train_predictions = model.predict_in_sample()
-            mse = mean_squared_error(series, train_predictions)
-            rmse = np.sqrt(mse)
-            total_mse.append(mse)
-            total_rmse.append(rmse)
-            total_mae.append(mean_absolute_error(series, train_predictions))
-            for year, gdp in zip(forecast_years, forecast):
-                cursor.execute(
-                    "INSERT INTO arima_annual (sector, year, gdp, rmse) VALUES (%s, %s, %s, %s)",
-                    (sector, int(year), float(gdp), float(rmse))
-                )
+    rmse_values = {}
+    cache = get_model_cache() if use_cache else None
+    sectors = list(data['sector'])
+
+    for completed, sector in enumerate(sectors, start=1):
+        with span(f"fit {sector}", sector=sector):
+            levels = data.loc[data['sector'] == sector, 2015:2023].values.flatten()
+            series = make_stationary(levels)  # Make the series stationary if needed
+            key = cache_key(series, 'annual', 'auto_arima', {'seasonal': True, 'stepwise': True})
+            # Refit the sector's remembered order; the stepwise search only
+            # reruns when that order is stale or its fit has degraded
+            with span('fit', rows=len(series)):
+                model = cached_fit(cache, key, lambda: fit_with_order_memory(
+                    series, 'annual', sector,
+                    lambda: auto_arima(series, seasonal=True, stepwise=True, suppress_warnings=True)
+                ))
+            with span('forecast', steps=len(forecast_years)):
+                forecast = model.predict(n_periods=len(forecast_years))
+                # Forecasts of a differenced series are integrated back to
+                # GDP levels (as in backtest.arima_folds). Its one-step
+                # in-sample errors are the same on levels, so the metrics
+                # below stay on the fitted series.
+                if len(series) < len(levels):
+                    forecast = levels[-1] + np.cumsum(forecast)
+                forecasts[sector] = forecast
+
+                # Calculate metrics
+                train_predictions = model.predict_in_sample()
+        mse = mean_squared_error(series, train_predictions)
+        rmse = np.sqrt(mse)
+        total_mse.append(mse)
+        total_rmse.append(rmse)
+        total_mae.append(mean_absolute_error(series, train_predictions))
+        rmse_values[sector] = rmse
+        if progress_callback:
+            progress_callback(sector, completed, len(sectors))
+
+    # One set-based write for every sector's forecast
+    results = forecast_frame(forecasts, [int(year) for year in forecast_years], rmse_values, 'year')
+    write_results('arima_annual', results, columns=['sector', 'year', 'gdp', 'rmse'], key_columns=['sector', 'year'])
 
     metrics['mae'] = np.mean(total_mae)
     metrics['mse'] = np.mean(total_mse)
@@ -117,13 +90,11 @@ def forecast_gdp_auto_arima(data, start_year, end_year):
     return forecasts, metrics
 
 # Main function to run the entire forecasting process
-def main():
-    data = load_and_clean_data_from_sql_server()
+def main(progress_callback=None, use_cache=True):
+    with forecast_run():
+        data = load_and_clean_data()
     start_year = 2024
     end_year = 2030
-    forecasts, metrics = forecast_gdp_auto_arima(data, start_year, end_year)
+    forecasts, metrics = forecast_gdp_auto_arima(data, start_year, end_year, progress_callback, use_cache)
     print(forecasts)
     print(metrics)
-
-if __name__ == "__main__":
-    main()
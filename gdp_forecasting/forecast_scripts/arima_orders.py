@@ -0,0 +1,129 @@
+import json
+import os
+from datetime import datetime, timedelta
+import numpy as np
+import frappe
+from gdp_forecasting.forecast_scripts.model_cache import get_model_cache
+from gdp_forecasting.gdp_forecasting.instrumentation import note, optimizer_iterations
+
+# The (p,d,q)(P,D,Q,m) order auto_arima selects for a sector rarely changes
+# between releases, so it is remembered and refits use it directly. A full
+# stepwise search runs again once the stored order is older than the
+# re-search interval, or when a refit's RMSE degrades past the threshold
+# relative to the RMSE recorded when the order was searched.
+RESEARCH_INTERVAL_DAYS = 90
+DEGRADATION_THRESHOLD = 1.25
+ORDERS_FILE = 'arima_orders.json'
+
+
+class OrderStore:
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError):
+            # Corrupt store: start over, every sector is searched again
+            return {}
+
+    def save(self, orders):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(orders, f, indent=1, sort_keys=True)
+        os.replace(temp_path, self.path)
+
+    def get(self, frequency, sector):
+        return self.load().get(order_key(frequency, sector))
+
+    def put(self, frequency, sector, entry):
+        orders = self.load()
+        orders[order_key(frequency, sector)] = entry
+        self.save(orders)
+
+    # Forget one sector's order (or every order) so the next run searches again
+    def invalidate(self, frequency=None, sector=None):
+        orders = self.load()
+        if frequency and sector:
+            removed = [order_key(frequency, sector)] if order_key(frequency, sector) in orders else []
+        else:
+            removed = [key for key in orders if not frequency or key.startswith(f"{frequency}:")]
+        for key in removed:
+            del orders[key]
+        self.save(orders)
+        return len(removed)
+
+
+def order_key(frequency, sector):
+    return f"{frequency}:{sector}"
+
+
+# The store lives next to the model cache, so it follows the same site /
+# standalone location rules
+def get_order_store():
+    return OrderStore(os.path.join(get_model_cache().directory, ORDERS_FILE))
+
+
+def get_research_policy():
+    conf = frappe.conf or {}
+    interval = conf.get('gdp_forecast_arima_research_days') or RESEARCH_INTERVAL_DAYS
+    threshold = conf.get('gdp_forecast_arima_rmse_threshold') or DEGRADATION_THRESHOLD
+    return int(interval), float(threshold)
+
+
+def in_sample_rmse(model, series):
+    return float(np.sqrt(np.mean((np.asarray(series, dtype=np.float64) - model.predict_in_sample()) ** 2)))
+
+
+def order_entry(model, series, searched_at):
+    return {
+        'order': list(model.order),
+        'seasonal_order': list(model.seasonal_order),
+        'with_intercept': bool(model.with_intercept),
+        'rmse': in_sample_rmse(model, series),
+        'searched_at': searched_at.isoformat(),
+    }
+
+
+# Fit a sector's ARIMA model, reusing its stored order when it is still
+# fresh. `search` runs the full auto_arima search and returns the model; the
+# selected order is stored for the next run.
+def fit_with_order_memory(series, frequency, sector, search, store=None, now=None):
+    from pmdarima.arima import ARIMA
+
+    store = store or get_order_store()
+    now = now or datetime.now()
+    interval_days, threshold = get_research_policy()
+    entry = store.get(frequency, sector)
+
+    if entry and now - datetime.fromisoformat(entry['searched_at']) < timedelta(days=interval_days):
+        try:
+            model = ARIMA(
+                order=tuple(entry['order']), seasonal_order=tuple(entry['seasonal_order']),
+                with_intercept=entry['with_intercept'], suppress_warnings=True
+            ).fit(series)
+            note(iterations=optimizer_iterations(model), fits=1)
+            if in_sample_rmse(model, series) <= entry['rmse'] * threshold:
+                return model
+        except (ValueError, np.linalg.LinAlgError):
+            pass  # The stored order no longer fits this series; search again
+
+    model = search()
+    note(iterations=optimizer_iterations(model), searches=1)
+    store.put(frequency, sector, order_entry(model, series, now))
+    return model
+
+
+@frappe.whitelist()
+def get_arima_orders():
+    return get_order_store().load()
+
+
+@frappe.whitelist()
+def reset_arima_orders(frequency=None, sector=None):
+    frappe.only_for("System Manager")
+    return {'removed': get_order_store().invalidate(frequency, sector)}
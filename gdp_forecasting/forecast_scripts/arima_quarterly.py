@@ -1,48 +1,13 @@
 import pandas as pd
 import numpy as np
+import frappe
 from pmdarima import auto_arima
 from sklearn.metrics import mean_squared_error
-from pathlib import Path
-import os
-from dotenv import load_dotenv
-from django.db import connection
-from django.conf import settings
-import django
-
-# Initialize Django settings
-BASE_DIR = Path(__file__).resolve().parent.parent
-env_path = BASE_DIR.parent / '.env'
-load_dotenv(dotenv_path=env_path)
-
-DB_USER = os.getenv('DB_USER')
-DB_PASSWORD = os.getenv('DB_PASSWORD')
-DB_HOST = os.getenv('DB_HOST')
-DB_PORT = os.getenv('DB_PORT')
-DB_NAME = os.getenv('DB_NAME')
-
-settings.configure(
-    DATABASES={
-        'default': {
-            'ENGINE': 'sql_server.pyodbc',
-            'NAME': DB_NAME,
-            'USER': DB_USER,
-            'PASSWORD': DB_PASSWORD,
-            'HOST': DB_HOST,
-            'PORT': DB_PORT,
-            'OPTIONS': {
-                'driver': 'ODBC Driver 17 for SQL Server',
-                'extra_params': 'TrustServerCertificate=yes;',
-            },
-        }
-    },
-    INSTALLED_APPS=[
-        'django.contrib.contenttypes',
-    ],
-    USE_TZ=True,
-    TIME_ZONE='UTC+3',
-)
-
-django.setup()
+from gdp_forecasting.forecast_scripts.arima_orders import fit_with_order_memory
+from gdp_forecasting.forecast_scripts.data_access import forecast_run, get_sectors, load_dataset
+from gdp_forecasting.forecast_scripts.model_cache import cache_key, cached_fit, get_model_cache
+from gdp_forecasting.forecast_scripts.result_writer import quarter_columns, write_results
+from gdp_forecasting.gdp_forecasting.instrumentation import span
 
 # Custom parser for quarterly data
 def custom_quarterly_parser(year_q):
@@ -57,38 +22,42 @@ def date_to_quarter_string(date):
     quarter = (date.month - 1) // 3 + 1
     return f"{year}-Q{quarter}"
 
-# Load and prepare data from SQL Server
-def load_and_prepare_data_from_sql_server():
-    with connection.cursor() as cursor:
-        cursor.execute("SELECT * FROM quarterly_dataset")
-        rows = cursor.fetchall()
-        columns = [col[0] for col in cursor.description]
-        df = pd.DataFrame(rows, columns=columns)
-
-    # Create a column for time periods
-    df['Year_Quarter'] = df['year'].astype(str) + ' Q' + df['quarter'].astype(str)
-    
-    # Parse dates
-    df['Date'] = df['Year_Quarter'].apply(custom_quarterly_parser)
-    df.index = pd.to_datetime(df['Date'])
-    df.sort_index(inplace=True)
-    
+# Load and prepare the quarterly dataset
+def load_and_prepare_data():
+    df = load_dataset('Quarterly', sectors=get_sectors('quarterly'))
+
+    with span('pivot', rows=len(df)):
+        # Create a column for time periods
+        df['Year_Quarter'] = df['year'].astype(str) + ' Q' + df['quarter'].astype(str)
+
+        # Parse dates
+        df['Date'] = df['Year_Quarter'].apply(custom_quarterly_parser)
+        df.index = pd.to_datetime(df['Date'])
+        df.sort_index(inplace=True)
+
     return df
 
 # Apply AUTO ARIMA model to all sectors
-def apply_auto_arima_to_all_sectors(data, start_period, end_period):
+def apply_auto_arima_to_all_sectors(data, start_period, end_period, progress_callback=None, use_cache=True):
     forecast_results = pd.DataFrame()
     sectors = data['sector'].unique()
+    cache = get_model_cache() if use_cache else None
 
-    with connection.cursor() as cursor:
-        cursor.execute("TRUNCATE TABLE arima_quarterly")
-
-        for sector in sectors:
+    for completed, sector in enumerate(sectors, start=1):
+        with span(f"fit {sector}", sector=sector):
             sector_data = data[data['sector'] == sector]['gdp']
             log_sector_data = np.log1p(sector_data)  # Log-transform the data
-            model = auto_arima(log_sector_data, seasonal=True, m=4, stepwise=True, suppress_warnings=True)
+            key = cache_key(log_sector_data, 'quarterly', 'auto_arima', {'seasonal': True, 'm': 4, 'stepwise': True})
+            # Refit the sector's remembered order; the stepwise search only
+            # reruns when that order is stale or its fit has degraded
+            with span('fit', rows=len(log_sector_data)):
+                model = cached_fit(cache, key, lambda: fit_with_order_memory(
+                    log_sector_data, 'quarterly', sector,
+                    lambda: auto_arima(log_sector_data, seasonal=True, m=4, stepwise=True, suppress_warnings=True)
+                ))
             forecast_steps = (end_period - start_period + 1) * 4  # Quarterly data
-            forecast = model.predict(n_periods=forecast_steps)
+            with span('forecast', steps=forecast_steps):
+                forecast = model.predict(n_periods=forecast_steps)
             forecast_df = pd.DataFrame({'mean': forecast, 'Quarter': pd.date_range(start=sector_data.index[-1], periods=forecast_steps + 1, freq='Q')[1:]})
             forecast_df['Sector'] = sector
             forecast_df['mean'] = np.expm1(forecast_df['mean'])  # Reverse log-transform
@@ -99,15 +68,28 @@ def apply_auto_arima_to_all_sectors(data, start_period, end_period):
 
             forecast_df['RMSE'] = np.sqrt(mean_squared_error(sector_data, np.expm1(model.predict_in_sample())))
             forecast_df['Quarter'] = forecast_df['Quarter'].apply(date_to_quarter_string)
-            
-            for date, gdp in zip(forecast_df['Quarter'], forecast_df['mean']):
-                cursor.execute(
-                    "INSERT INTO arima_quarterly (sector, year_quarter, gdp, rmse) VALUES (%s, %s, %s, %s)",
-                    (sector, date, float(gdp), float(forecast_df['RMSE'][0]))
-                )
 
             forecast_results = pd.concat([forecast_results, forecast_df[['Sector', 'Quarter', 'mean', 'RMSE']]])
-    
+        if progress_callback:
+            progress_callback(sector, completed, len(sectors))
+
+    # One set-based write for every sector's forecast
+    if forecast_results.empty:
+        frappe.db.sql("TRUNCATE TABLE `arima_quarterly`")
+    else:
+        years, quarters = quarter_columns(forecast_results['Quarter'])
+        results = pd.DataFrame({
+            'sector': forecast_results['Sector'].to_numpy(),
+            'year': years,
+            'quarter': quarters,
+            'gdp': forecast_results['mean'].astype(float).to_numpy(),
+            'rmse': forecast_results['RMSE'].astype(float).to_numpy(),
+        })
+        write_results(
+            'arima_quarterly', results,
+            columns=['sector', 'year', 'quarter', 'gdp', 'rmse'], key_columns=['sector', 'year', 'quarter']
+        )
+
     return forecast_results
 
 # Save forecasts to a single CSV
@@ -115,13 +97,13 @@ def save_forecasts(forecasts, output_file):
     forecasts.to_csv(output_file, index=False)
 
 # Main function to run the entire forecasting process
-def main():
-    data = load_and_prepare_data_from_sql_server()
-    forecasts = apply_auto_arima_to_all_sectors(data, 2024, 2030)
+def main(progress_callback=None, use_cache=True):
+    with forecast_run():
+        data = load_and_prepare_data()
+    forecasts = apply_auto_arima_to_all_sectors(data, 2024, 2030, progress_callback, use_cache)
     # save_forecasts(forecasts, output_file)
+    return forecasts
 
 # # Parameters
 # output_file = 'Consolidated_GDP_Forecast_2024-2030_auto_arima.csv'
 
-# Run the script
-main()
@@ -0,0 +1,481 @@
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import frappe
+from statsmodels.tsa.holtwinters import ExponentialSmoothing
+from gdp_forecasting.forecast_scripts.batched_holt_winters import fit_sectors, get_engine
+from gdp_forecasting.forecast_scripts.data_access import forecast_run, get_sectors, load_dataset
+from gdp_forecasting.forecast_scripts.parallel_fit import get_worker_count, map_sectors
+from gdp_forecasting.forecast_scripts.result_writer import write_results
+from gdp_forecasting.gdp_forecasting.instrumentation import run_log, span
+
+# Rolling-origin backtests of the registered forecasters. Each forecast type
+# has a backtest model (BACKTESTS) that refits it on the history up to a
+# series of forecast origins and forecasts the next `horizon` periods, which
+# are compared with what was actually observed:
+#
+#   expanding   every fold trains on all periods before its origin
+#   rolling     every fold trains on the `min_train` periods before it
+#
+# The origins of a series are split into blocks of `refit_every`. A block
+# searches its model at its first origin and reuses it for the rest:
+# Holt-Winters keeps its smoothing parameters (only the initial states are
+# estimated again), ARIMA keeps its order and, with an expanding window, is
+# updated with the new observations instead of refitted. The (series, block)
+# tasks run in the process pool (see parallel_fit); the numpy engine fits
+# every series of an origin in one batch instead.
+#
+# MAE, RMSE and MAPE per series and horizon are stored in BACKTEST_TABLE,
+# replacing the forecast type's previous backtest. Hierarchical forecasts are
+# scored per node, for the base forecasts and every reconciliation method.
+BACKTEST_TABLE = 'gdp_backtest_results'
+WINDOWS = ('expanding', 'rolling')
+MODELS = ('holt_winters', 'arima', 'hierarchical')
+REFIT_EVERY = 4
+FIT_ERRORS = (ValueError, np.linalg.LinAlgError, ZeroDivisionError, OverflowError)
+
+# Default horizon and shortest training window (both in periods)
+FREQUENCIES = {
+    'annual': {'horizon': 3, 'min_train': 6},
+    'quarterly': {'horizon': 8, 'min_train': 16},
+}
+
+# Backtest model of each forecast type. Holt-Winters `params` are the
+# (trend, seasonal, seasonal_periods) of every sector, or None for the stored
+# search results (see hyperparameter_search.load_best_params).
+BACKTESTS = {
+    'annual_arima': {'frequency': 'annual', 'model': 'arima'},
+    'quarterly_arima': {'frequency': 'quarterly', 'model': 'arima'},
+    'Annual Forecast (Holt-Winters)': {'frequency': 'annual', 'model': 'holt_winters', 'params': None},
+    'Quarterly Forecast (Holt-Winters )': {'frequency': 'quarterly', 'model': 'holt_winters', 'params': ('add', 'add', 4)},
+    'Annual Forecast (Hierarchical)': {'frequency': 'annual', 'model': 'hierarchical'},
+    'Quarterly Forecast (Hierarchical)': {'frequency': 'quarterly', 'model': 'hierarchical'},
+}
+
+# auto_arima options of the ARIMA forecasters
+ARIMA_OPTIONS = {
+    'annual': {'seasonal': True},
+    'quarterly': {'seasonal': True, 'm': 4},
+}
+
+KEY_COLUMNS = ['forecast_type', 'method', 'sector', 'horizon']
+RESULT_COLUMNS = KEY_COLUMNS + [
+    'window_type', 'train_periods', 'first_origin', 'last_origin', 'folds', 'failed_folds',
+    'mae', 'rmse', 'mape', 'run_at',
+]
+
+
+# Backtest a forecast type registered with registry.register_forecaster
+def register_backtest(forecast_type, frequency, model, params=None):
+    if frequency not in FREQUENCIES:
+        raise ValueError(f"Unknown frequency {frequency!r}; expected one of {tuple(FREQUENCIES)}")
+    if model not in MODELS:
+        raise ValueError(f"Unknown backtest model {model!r}; expected one of {MODELS}")
+    BACKTESTS[forecast_type] = {'frequency': frequency, 'model': model, 'params': params}
+
+
+def get_backtest(forecast_type):
+    if forecast_type not in BACKTESTS:
+        raise ValueError(f"No backtest model for forecast type {forecast_type!r}; expected one of {tuple(BACKTESTS)}")
+    return BACKTESTS[forecast_type]
+
+
+# Sector series of a frequency: labels, period labels and the sector x
+# period GDP matrix
+def load_series(frequency):
+    if frequency == 'annual':
+        from gdp_forecasting.forecast_scripts.holt_winters_annual import load_annual_pivot
+
+        pivot = load_annual_pivot()
+        periods = [period_label(year) for year in pivot.columns]
+    else:
+        df = load_dataset('Quarterly', sectors=get_sectors('quarterly'), columns=['sector', 'year', 'quarter', 'gdp'])
+        if df.empty:
+            return [], [], np.zeros((0, 0))
+        with span('pivot', rows=len(df)):
+            pivot = df.pivot_table(index='sector', columns=['year', 'quarter'], values='gdp', aggfunc='sum').fillna(0)
+        periods = [period_label(period) for period in pivot.columns]
+    return list(pivot.index), periods, pivot.to_numpy(dtype=np.float64)
+
+
+# '2023' for a year, '2023-Q4' for a (year, quarter)
+def period_label(period):
+    if isinstance(period, tuple):
+        year, quarter = period
+        return f"{int(year)}-Q{int(quarter)}"
+    return str(int(period))
+
+
+# Every node of a hierarchy, e.g. "Total", "Construction" or
+# "Construction / Buildings"
+def node_labels(nodes, levels):
+    return [' / '.join(value for value in row if value) for row in nodes[levels].itertuples(index=False)]
+
+
+# Holt-Winters parameters of every backtested series
+def series_params(spec, labels):
+    if spec.get('params') is not None:
+        return dict.fromkeys(labels, tuple(spec['params']))
+    from gdp_forecasting.forecast_scripts.holt_winters_annual import DEFAULT_BEST_PARAMS
+    from gdp_forecasting.forecast_scripts.hyperparameter_search import load_best_params
+
+    # Like the forecaster, sectors without parameters are not forecast
+    best_params = load_best_params(DEFAULT_BEST_PARAMS)
+    return {label: best_params[label] for label in labels if label in best_params}
+
+
+# Forecast origins, as the index of each fold's first forecast period: from
+# the end of the shortest training window to the last observed period
+def fold_origins(n_periods, min_train, step=1):
+    return list(range(min_train, n_periods, max(1, int(step))))
+
+
+def origin_blocks(origins, refit_every):
+    refit_every = max(1, int(refit_every))
+    return [origins[i:i + refit_every] for i in range(0, len(origins), refit_every)]
+
+
+# `window` is the rolling window length, None for an expanding window
+def train_start(origin, window):
+    return 0 if window is None else max(0, origin - window)
+
+
+# Holt-Winters forecasts of one series from consecutive origins. The
+# smoothing parameters estimated at the first origin are kept for the rest.
+# Returns (forecasts (origins x horizon), in-sample RMSE per origin, errors);
+# a fold that fails to fit stays NaN and is listed in errors.
+def holt_winters_folds(ts, origins, horizon, window, trend, seasonal, seasonal_periods):
+    forecasts = np.full((len(origins), horizon), np.nan)
+    rmse = np.full(len(origins), np.nan)
+    errors = []
+    smoothing = None
+    for row, origin in enumerate(origins):
+        train = ts[train_start(origin, window):origin]
+        try:
+            model = ExponentialSmoothing(train, trend=trend, seasonal=seasonal, seasonal_periods=seasonal_periods)
+            fit = model.fit(**smoothing) if smoothing else model.fit()
+            forecast = np.asarray(fit.forecast(steps=horizon), dtype=np.float64)
+            if not np.all(np.isfinite(forecast)):
+                raise ValueError("non-finite forecast")
+        except FIT_ERRORS as e:
+            errors.append((origin, str(e)))
+            continue
+        if smoothing is None:
+            names = ['smoothing_level'] + (['smoothing_trend'] if trend else []) + (['smoothing_seasonal'] if seasonal else [])
+            smoothing = {name: float(fit.params[name]) for name in names}
+        forecasts[row] = forecast
+        rmse[row] = np.sqrt(np.mean((train - np.asarray(fit.fittedvalues)) ** 2))
+    return forecasts, rmse, errors
+
+
+# The series as the ARIMA forecasters fit it: quarterly GDP is
+# log-transformed, annual GDP is differenced when the ADF test finds it
+# non-stationary (see arima_annual.make_stationary)
+def arima_series(ts, frequency, differenced=False):
+    if frequency == 'quarterly':
+        return np.log1p(ts)
+    return np.diff(ts) if differenced else ts
+
+
+# ARIMA forecasts of one series from consecutive origins, fitted the way the
+# forecasters fit them. Annual series that make_stationary differences are
+# forecast as differences, then integrated back to levels from the last
+# training value so they can be scored. auto_arima only searches at the
+# first origin; later origins update that model with the new observations
+# (expanding window) or refit its order on the shifted window (rolling
+# window). Same return value as holt_winters_folds, without in-sample RMSE.
+def arima_folds(ts, origins, horizon, window, frequency):
+    from pmdarima import auto_arima
+    from pmdarima.arima import ARIMA
+    from gdp_forecasting.forecast_scripts.arima_annual import make_stationary
+
+    forecasts = np.full((len(origins), horizon), np.nan)
+    errors = []
+    model, differenced, previous = None, False, None
+    for row, origin in enumerate(origins):
+        train = ts[train_start(origin, window):origin]
+        try:
+            if model is None:
+                differenced = frequency == 'annual' and len(make_stationary(train)) < len(train)
+                model = auto_arima(
+                    arima_series(train, frequency, differenced), stepwise=True, suppress_warnings=True,
+                    **ARIMA_OPTIONS[frequency]
+                )
+            elif window is None:
+                model.update(arima_series(ts[previous - int(differenced):origin], frequency, differenced))
+            else:
+                model = ARIMA(
+                    order=model.order, seasonal_order=model.seasonal_order,
+                    with_intercept=model.with_intercept, suppress_warnings=True
+                ).fit(arima_series(train, frequency, differenced))
+            previous = origin
+            forecast = np.asarray(model.predict(n_periods=horizon), dtype=np.float64)
+            if frequency == 'quarterly':
+                forecast = np.expm1(forecast).clip(min=0)
+            elif differenced:
+                forecast = train[-1] + np.cumsum(forecast)
+            if not np.all(np.isfinite(forecast)):
+                raise ValueError("non-finite forecast")
+        except FIT_ERRORS as e:
+            # Search again at the next origin
+            model = None
+            errors.append((origin, str(e)))
+            continue
+        forecasts[row] = forecast
+    return forecasts, np.full(len(origins), np.nan), errors
+
+
+# Holt-Winters forecasts of every series from every origin with the numpy
+# engine: one batch per origin and parameter set (see fit_sectors)
+def batched_folds(series, params, origins, horizon, window, progress_callback=None, workers=None):
+    labels = list(series)
+    forecasts = np.full((len(labels), len(origins), horizon), np.nan)
+    rmse = np.full((len(labels), len(origins)), np.nan)
+    errors = {}
+    for column, origin in enumerate(origins):
+        start = train_start(origin, window)
+        try:
+            fitted = fit_sectors({label: series[label][start:origin] for label in labels}, params, horizon, workers=workers)
+        except FIT_ERRORS as e:
+            for label in labels:
+                errors.setdefault(label, []).append((origin, str(e)))
+            continue
+        for row, label in enumerate(labels):
+            forecast, in_sample = fitted[label]
+            if np.all(np.isfinite(forecast)):
+                forecasts[row, column], rmse[row, column] = forecast, in_sample
+            else:
+                errors.setdefault(label, []).append((origin, "non-finite forecast"))
+        if progress_callback:
+            progress_callback(origin, column + 1, len(origins))
+    return forecasts, rmse, errors
+
+
+# Forecasts (series x origins x horizon), in-sample RMSE (series x origins)
+# and fit errors ({label: [(origin, error)]}) of every series from every
+# origin
+def fold_forecasts(model, frequency, series, params, origins, horizon, window,
+                   refit_every=REFIT_EVERY, workers=None, engine=None, progress_callback=None):
+    if model != 'arima' and get_engine(engine) == 'numpy':
+        return batched_folds(series, params, origins, horizon, window, progress_callback, workers)
+
+    fold_fn = arima_folds if model == 'arima' else holt_winters_folds
+    tasks = [
+        ((label, block[0]), (values, block, horizon, window) + ((frequency,) if model == 'arima' else tuple(params[label])))
+        for label, values in series.items()
+        for block in origin_blocks(origins, refit_every)
+    ]
+    rows = {label: row for row, label in enumerate(series)}
+    columns = {origin: column for column, origin in enumerate(origins)}
+    forecasts = np.full((len(series), len(origins), horizon), np.nan)
+    rmse = np.full((len(series), len(origins)), np.nan)
+    errors = {}
+    for (label, first), (block_forecasts, block_rmse, block_errors) in map_sectors(
+        fold_fn, tasks, workers=workers, progress_callback=progress_callback
+    ):
+        row, column = rows[label], columns[first]
+        forecasts[row, column:column + len(block_forecasts)] = block_forecasts
+        rmse[row, column:column + len(block_rmse)] = block_rmse
+        if block_errors:
+            errors.setdefault(label, []).extend(block_errors)
+    return forecasts, rmse, errors
+
+
+# Reconcile the base forecasts of every origin with each method. A failed
+# base forecast leaves the MinT methods NaN for every node at that origin.
+def reconcile_folds(hierarchy, history, base, rmse, origins, window, methods):
+    from gdp_forecasting.forecast_scripts.hierarchical import reconcile
+
+    reconciled = {method: np.full_like(base, np.nan) for method in methods}
+    for column, origin in enumerate(origins):
+        train = history[:, train_start(origin, window):origin]
+        for method in methods:
+            with np.errstate(invalid='ignore', divide='ignore'):
+                reconciled[method][:, column] = reconcile(hierarchy, base[:, column], method, train, rmse[:, column])
+    return reconciled
+
+
+# MAE, RMSE and MAPE (%) per series and horizon step, each (series x
+# horizon). Folds whose target period is past the data, or whose fit failed,
+# are left out; MAPE also leaves out zero actuals.
+def horizon_metrics(Y, forecasts, origins):
+    actual = np.full_like(forecasts, np.nan)
+    for column, origin in enumerate(origins):
+        observed = Y[:, origin:origin + forecasts.shape[2]]
+        actual[:, column, :observed.shape[1]] = observed
+    errors = actual - forecasts
+    scored = np.isfinite(errors)
+    relative = scored & (actual != 0)
+    folds = scored.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mae = np.where(scored, np.abs(errors), 0).sum(axis=1) / folds
+        rmse = np.sqrt(np.where(scored, errors ** 2, 0).sum(axis=1) / folds)
+        mape = 100 * np.where(relative, np.abs(errors / actual), 0).sum(axis=1) / relative.sum(axis=1)
+    return {
+        'folds': folds,
+        'failed_folds': (np.isfinite(actual) & ~np.isfinite(forecasts)).sum(axis=1),
+        'mae': mae,
+        'rmse': rmse,
+        'mape': mape,
+    }
+
+
+# Long-form result rows of one method: one per series and horizon step
+def metrics_frame(forecast_type, method, labels, metrics, fields):
+    horizon = metrics['folds'].shape[1]
+    frame = pd.DataFrame({
+        'forecast_type': forecast_type,
+        'method': method,
+        'sector': np.repeat(labels, horizon),
+        'horizon': np.tile(np.arange(1, horizon + 1), len(labels)),
+    })
+    for name, values in metrics.items():
+        values = values.ravel()
+        # Metrics with no scored fold are stored as NULL
+        frame[name] = values if values.dtype.kind == 'i' else pd.Series(values).astype(object).where(np.isfinite(values), None)
+    for name, value in fields.items():
+        # Kept as Python objects: the DB driver does not accept pandas Timestamps
+        frame[name] = pd.Series([value] * len(frame), dtype=object)
+    return frame
+
+
+def save_results(forecast_type, frame):
+    frappe.db.sql(f"DELETE FROM `{BACKTEST_TABLE}` WHERE `forecast_type` = %s", (forecast_type,))
+    return write_results(BACKTEST_TABLE, frame, columns=RESULT_COLUMNS, key_columns=KEY_COLUMNS, truncate=False)
+
+
+# Backtest one forecast type and store its metrics. `horizon` and
+# `min_train` default to the frequency's (FREQUENCIES); `step` is the number
+# of periods between origins. Hierarchical forecast types are scored for the
+# base forecasts and each of `methods` (every method by default).
+def run_backtest(forecast_type, window='expanding', horizon=None, min_train=None, step=1,
+                 refit_every=REFIT_EVERY, workers=None, engine=None, methods=None, progress_callback=None):
+    spec = get_backtest(forecast_type)
+    frequency, model = spec['frequency'], spec['model']
+    if window not in WINDOWS:
+        raise ValueError(f"Unknown backtest window {window!r}; expected one of {WINDOWS}")
+    horizon = int(horizon or FREQUENCIES[frequency]['horizon'])
+    min_train = int(min_train or FREQUENCIES[frequency]['min_train'])
+    train_window = min_train if window == 'rolling' else None
+
+    if model == 'hierarchical':
+        from gdp_forecasting.forecast_scripts import hierarchical
+
+        methods = hierarchical.check_methods(methods)
+        levels = hierarchical.FREQUENCIES[frequency]['levels']
+        hierarchy, Y, observed = hierarchical.load_hierarchy(frequency)
+        labels = node_labels(hierarchy.nodes, levels)
+        periods = [period_label(period) for period in observed]
+        params = dict.fromkeys(labels, hierarchical.FREQUENCIES[frequency]['params'])
+    else:
+        labels, periods, Y = load_series(frequency)
+        params = series_params(spec, labels) if model == 'holt_winters' else dict.fromkeys(labels)
+        rows = [row for row, label in enumerate(labels) if label in params]
+        labels, Y = [labels[row] for row in rows], Y[rows]
+
+    origins = fold_origins(len(periods), min_train, step)
+    if not labels or not origins:
+        raise ValueError(
+            f"Cannot backtest {forecast_type}: {len(labels)} series of {len(periods)} periods, "
+            f"{min_train} of them needed for training"
+        )
+
+    series = {label: Y[row] for row, label in enumerate(labels)}
+    with span('fit folds', model=model, series=len(series), origins=len(origins)):
+        forecasts, rmse, errors = fold_forecasts(
+            'holt_winters' if model == 'hierarchical' else model, frequency, series, params, origins, horizon,
+            train_window, refit_every, workers, engine, progress_callback
+        )
+    scored = {'base' if model == 'hierarchical' else model: forecasts}
+    if model == 'hierarchical':
+        with span('reconcile folds', methods=len(methods)):
+            scored.update(reconcile_folds(hierarchy, Y, forecasts, rmse, origins, train_window, methods))
+
+    fields = {
+        'window_type': window,
+        'train_periods': min_train,
+        'first_origin': periods[origins[0] - 1],
+        'last_origin': periods[origins[-1] - 1],
+        'run_at': datetime.now(),
+    }
+    with span('metrics'):
+        frame = pd.concat(
+            [metrics_frame(forecast_type, method, labels, horizon_metrics(Y, values, origins), fields)
+             for method, values in scored.items()],
+            ignore_index=True,
+        )
+    stats = save_results(forecast_type, frame)
+
+    if errors:
+        frappe.logger("gdp_forecasting").info(
+            f"Backtest of {forecast_type}: {sum(len(failed) for failed in errors.values())} folds "
+            f"of {len(errors)} series failed to fit"
+        )
+    return {
+        'series': len(labels),
+        'origins': len(origins),
+        'rows': stats['rows'],
+        'failed_fits': sum(len(failed) for failed in errors.values()),
+    }
+
+
+# Background job: backtest each forecast type (every one in BACKTESTS by
+# default), each in its own run log under `run_id`. A forecast type that
+# fails is logged and the others still run.
+def run_backtests(forecast_types=None, run_id=None, profile=None, **kwargs):
+    results = {}
+    with forecast_run():
+        for forecast_type in forecast_types or list(BACKTESTS):
+            try:
+                with run_log('backtest', forecast_type, run_id=run_id, profile=profile,
+                             window=kwargs.get('window', 'expanding')) as fields:
+                    results[forecast_type] = run_backtest(forecast_type, **kwargs)
+                    fields['rows'] = results[forecast_type]['rows']
+            except Exception as e:
+                frappe.log_error(message=frappe.get_traceback(), title="Backtest Error")
+                results[forecast_type] = {'error': str(e)}
+    return results
+
+
+# Queue a backtest of some forecast types (a list, a JSON list or one name;
+# all of them by default). Returns the run id its run logs are filed under.
+@frappe.whitelist()
+def start_backtest(forecast_types=None, window='expanding', horizon=None, min_train=None, step=1,
+                   refit_every=REFIT_EVERY, profile=None):
+    from gdp_forecasting.gdp_forecasting.growth_scenarios import parse_list
+
+    forecast_types = parse_list(forecast_types)
+    unknown = [forecast_type for forecast_type in forecast_types or [] if forecast_type not in BACKTESTS]
+    if unknown:
+        frappe.throw(f"No backtest for {', '.join(unknown)}.", title="Error")
+    if window not in WINDOWS:
+        frappe.throw(f"Unknown backtest window {window}.", title="Error")
+    run_id = frappe.generate_hash(length=12)
+    frappe.enqueue(
+        "gdp_forecasting.forecast_scripts.backtest.run_backtests",
+        queue="long",
+        timeout=3600,
+        job_name="GDP forecast: backtest",
+        forecast_types=forecast_types,
+        run_id=run_id,
+        profile=profile,
+        window=window,
+        horizon=int(horizon) if horizon else None,
+        min_train=int(min_train) if min_train else None,
+        step=int(step),
+        refit_every=int(refit_every),
+    )
+    return {'run_id': run_id, 'workers': get_worker_count()}
+
+
+# Stored backtest metrics, optionally of one forecast type, method or sector
+@frappe.whitelist()
+def get_backtest_results(forecast_type=None, method=None, sector=None):
+    filters = {'forecast_type': forecast_type, 'method': method, 'sector': sector}
+    conditions = [f"`{column}` = %({column})s" for column, value in filters.items() if value]
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    return frappe.db.sql(
+        f"SELECT {', '.join(f'`{column}`' for column in RESULT_COLUMNS)} FROM `{BACKTEST_TABLE}` {where} "
+        f"ORDER BY `forecast_type`, `method`, `sector`, `horizon`",
+        filters, as_dict=True
+    )
@@ -0,0 +1,492 @@
+# Batched Holt-Winters engine. Runs the smoothing recursions as NumPy
+# operations over a (series x candidate-parameters) matrix, so one pass over
+# the time axis fits every series and every candidate at once. Parameters are
+# chosen per series by a coarse grid followed by a vectorized pattern search
+# on the one-step-ahead SSE.
+#
+# Conventions follow statsmodels' ExponentialSmoothing (non-damped):
+# alpha in (0, 1), beta <= alpha, gamma <= 1 - alpha.
+#
+# The initial states are estimated with the parameters, as statsmodels does:
+# for additive models they are solved by least squares between parameter
+# searches, then parameters and states are refined together by a batched
+# Levenberg-Marquardt search (the only estimation multiplicative models get,
+# their fitted values not being affine in the states). Multiplicative models
+# of series with too few observations for their parameters are fitted with
+# statsmodels instead (see is_batched and compare_with_statsmodels).
+import time
+from collections import namedtuple
+import numpy as np
+import frappe
+from gdp_forecasting.gdp_forecasting.instrumentation import note, span
+
+BatchedFit = namedtuple('BatchedFit', [
+    'trend', 'seasonal', 'seasonal_periods',
+    'alpha', 'beta', 'gamma',          # (S,) chosen parameters
+    'level', 'slope', 'season',        # final states: (S,), (S,), (S, m)
+    'fitted', 'sse', 'n_obs',          # (S, T) one-step-ahead fitted values, (S,) SSE
+])
+
+GRID_POINTS = 8
+REFINE_ROUNDS = 8
+# Alternations between initial-state solving and parameter refinement
+INIT_ROUNDS = 2
+# Joint Levenberg-Marquardt refinement: iterations, the damping factors tried
+# at once in each, and the relative forward-difference step of the Jacobian
+LM_ITERATIONS = 30
+LM_DAMPING = (0.1, 1.0, 10.0, 100.0)
+LM_STEP = 1e-6
+# Observations beyond the free parameters a multiplicative model needs to be
+# batched; shorter series are underdetermined and fitted with statsmodels
+MIN_SPARE_OBSERVATIONS = 3
+# Series are processed in blocks so the (series x candidates x season)
+# state arrays stay small
+CHUNK_SIZE = 2000
+PARAM_EPS = 1e-4
+
+ENGINES = ('statsmodels', 'numpy')
+
+
+def _combine(level, slope, trend):
+    if trend == 'add':
+        return level + slope
+    if trend == 'mul':
+        return level * slope
+    return level
+
+
+# Initial level, slope and seasonal states per series (heuristic: first
+# seasonal cycle for level/season, first two cycles for the slope)
+def initial_states(Y, trend, seasonal, m):
+    n_series, n_obs = Y.shape
+    steps_to_start = 1.0
+    if seasonal:
+        first = Y[:, :m].mean(axis=1)
+        if n_obs >= 2 * m:
+            second = Y[:, m:2 * m].mean(axis=1)
+            add_slope, mul_slope = (second - first) / m, (second / first) ** (1.0 / m)
+        else:
+            add_slope = (Y[:, -1] - Y[:, 0]) / max(n_obs - 1, 1)
+            mul_slope = (Y[:, -1] / Y[:, 0]) ** (1.0 / max(n_obs - 1, 1))
+        # The cycle mean sits at time (m - 1) / 2; the level state is at t = -1
+        steps_to_start = (m + 1) / 2.0
+    else:
+        first = Y[:, 0]
+        add_slope = Y[:, 1] - Y[:, 0]
+        mul_slope = Y[:, 1] / Y[:, 0]
+
+    if trend == 'add':
+        slope = add_slope
+        level = first - slope * steps_to_start if seasonal else first - slope
+    elif trend == 'mul':
+        slope = mul_slope
+        level = first / slope ** steps_to_start if seasonal else first / slope
+    else:
+        slope = np.zeros(n_series)
+        level = first
+
+    season = None
+    if seasonal:
+        offsets = np.arange(1, m + 1)
+        if trend == 'add':
+            base = level[:, None] + slope[:, None] * offsets
+        elif trend == 'mul':
+            base = level[:, None] * slope[:, None] ** offsets
+        else:
+            base = np.repeat(level[:, None], m, axis=1)
+        season = Y[:, :m] - base if seasonal == 'add' else Y[:, :m] / base
+    return level, slope, season
+
+
+# Run the recursions for every series (rows of Y) and every candidate
+# (columns of the parameter arrays, shape (S, K)). Returns the SSE per
+# (series, candidate), the final states and, if requested, fitted values.
+def smooth(Y, alpha, beta, gamma, trend, seasonal, m, level0, slope0, season0, keep_fitted=False):
+    n_series, n_obs = Y.shape
+    n_candidates = alpha.shape[1]
+    level = np.repeat(level0[:, None], n_candidates, axis=1)
+    slope = np.repeat(slope0[:, None], n_candidates, axis=1)
+    season = np.repeat(season0[:, None, :], n_candidates, axis=1) if seasonal else None
+    sse = np.zeros((n_series, n_candidates))
+    fitted = np.empty((n_series, n_candidates, n_obs)) if keep_fitted else None
+
+    with np.errstate(all='ignore'):
+        for t in range(n_obs):
+            y = Y[:, t, None]
+            base = _combine(level, slope, trend)
+            if seasonal:
+                s_old = season[:, :, t % m]
+                if seasonal == 'add':
+                    y_hat, deseasoned = base + s_old, y - s_old
+                else:
+                    y_hat, deseasoned = base * s_old, y / s_old
+            else:
+                y_hat, deseasoned = base, y
+
+            sse += (y - y_hat) ** 2
+            if keep_fitted:
+                fitted[:, :, t] = y_hat
+
+            new_level = alpha * deseasoned + (1 - alpha) * base
+            if trend == 'add':
+                slope = beta * (new_level - level) + (1 - beta) * slope
+            elif trend == 'mul':
+                slope = beta * (new_level / level) + (1 - beta) * slope
+            if seasonal == 'add':
+                season[:, :, t % m] = gamma * (y - base) + (1 - gamma) * s_old
+            elif seasonal == 'mul':
+                season[:, :, t % m] = gamma * (y / base) + (1 - gamma) * s_old
+            level = new_level
+
+    sse[~np.isfinite(sse)] = np.inf
+    return sse, level, slope, season, fitted
+
+
+# (alpha, beta, gamma) from the unit-cube parametrisation (a, u, v), which
+# keeps beta <= alpha and gamma <= 1 - alpha for any point in the cube
+def to_params(a, u, v):
+    return a, a * u, (1 - a) * v
+
+
+def _grid(trend, seasonal):
+    axis = np.linspace(PARAM_EPS, 1 - PARAM_EPS, GRID_POINTS)
+    u_axis = axis if trend else np.array([0.0])
+    v_axis = axis if seasonal else np.array([0.0])
+    a, u, v = np.meshgrid(axis, u_axis, v_axis, indexing='ij')
+    return a.ravel(), u.ravel(), v.ravel()
+
+
+# Best parameters per series by vectorized pattern search around `center`
+def _pattern_search(Y, trend, seasonal, m, init, center, step, rounds):
+    n_series = Y.shape[0]
+    rows = np.arange(n_series)
+    active = [True, bool(trend), bool(seasonal)]
+    offsets = np.array(np.meshgrid(*[[-1, 0, 1] if flag else [0] for flag in active], indexing='ij'))
+    offsets = offsets.reshape(3, -1).T  # (K, 3), includes the centre itself
+    for _ in range(rounds):
+        candidates = np.clip(center[:, None, :] + offsets[None, :, :] * step, PARAM_EPS, 1 - PARAM_EPS)
+        alpha, beta, gamma = to_params(candidates[:, :, 0], candidates[:, :, 1], candidates[:, :, 2])
+        sse = smooth(Y, alpha, beta, gamma, trend, seasonal, m, *init)[0]
+        center = candidates[rows, np.argmin(sse, axis=1)]
+        step = step / 2
+    note(iterations=rounds)
+    return center
+
+
+# Least-squares initial states for fixed smoothing parameters. With additive
+# components the one-step fitted values are affine in the initial states, so
+# the response to each unit initial state is computed in one batched pass
+# and the states are solved for per series (minimum-norm solution).
+def _least_squares_init(Y, trend, seasonal, m, center):
+    n_series, n_obs = Y.shape
+    n_states = 1 + bool(trend) + (m if seasonal else 0)
+    alpha, beta, gamma = (np.tile(p, n_states + 1)[:, None] for p in to_params(*center.T))
+
+    basis = np.zeros((n_states + 1, n_series, n_states))
+    basis[1:] = np.eye(n_states)[:, None, :]
+    basis = basis.reshape(-1, n_states)
+    stacked_y = np.concatenate([Y, np.zeros((n_series * n_states, n_obs))])
+    level0 = basis[:, 0]
+    slope0 = basis[:, 1] if trend else np.zeros(len(basis))
+    season0 = basis[:, n_states - m:] if seasonal else None
+
+    fitted = smooth(stacked_y, alpha, beta, gamma, trend, seasonal, m,
+                    level0, slope0, season0, keep_fitted=True)[4][:, 0, :]
+    offset = fitted[:n_series]
+    response = fitted[n_series:].reshape(n_states, n_series, n_obs).transpose(1, 2, 0)
+    states = np.einsum('skt,st->sk', np.linalg.pinv(response), Y - offset)
+    return (states[:, 0], states[:, 1] if trend else np.zeros(n_series),
+            states[:, n_states - m:] if seasonal else None)
+
+
+# Coarse grid shared by all series, then a per-series pattern search
+def _grid_search(Y, trend, seasonal, m, init):
+    grid_a, grid_u, grid_v = _grid(trend, seasonal)
+    shape = (Y.shape[0], grid_a.size)
+    alpha, beta, gamma = to_params(*(np.broadcast_to(axis, shape) for axis in (grid_a, grid_u, grid_v)))
+    sse = smooth(Y, alpha, beta, gamma, trend, seasonal, m, *init)[0]
+    best = np.argmin(sse, axis=1)
+    center = np.stack([grid_a[best], grid_u[best], grid_v[best]], axis=1)
+    step = np.full(3, 0.5 / (GRID_POINTS - 1))
+    return _pattern_search(Y, trend, seasonal, m, init, center, step, REFINE_ROUNDS)
+
+
+# Free parameters of a model: smoothing parameters plus initial states
+def free_parameters(trend, seasonal, m):
+    return (1 + bool(trend) + bool(seasonal)) + (1 + bool(trend) + (m if seasonal else 0))
+
+
+def _one_step_fitted(Y, trend, seasonal, m, center, init):
+    alpha, beta, gamma = to_params(center[:, 0], center[:, 1], center[:, 2])
+    return smooth(Y, alpha[:, None], beta[:, None], gamma[:, None], trend, seasonal, m, *init, keep_fitted=True)[4][:, 0, :]
+
+
+# Levenberg-Marquardt on the one-step SSE over the active smoothing
+# parameters and the initial states together. Each row of the unknowns is
+# one series; the Jacobian (forward differences) and the damped steps of all
+# series are evaluated in single smooth() passes. A series only moves when
+# its SSE drops.
+def _refine_jointly(Y, trend, seasonal, m, center, init):
+    n_series, n_obs = Y.shape
+    active = np.array([True, bool(trend), bool(seasonal)])
+    n_active = int(active.sum())
+    level, slope, season = init
+    x = np.column_stack([center[:, active], level] + ([slope] if trend else []) + ([season] if seasonal else []))
+    n_unknowns = x.shape[1]
+    rows = np.arange(n_series)
+
+    def fitted(X):
+        copies = len(X) // n_series
+        params = np.zeros((len(X), 3))
+        params[:, active] = np.clip(X[:, :n_active], PARAM_EPS, 1 - PARAM_EPS)
+        states = X[:, n_active:]
+        split = (states[:, 0], states[:, 1] if trend else np.zeros(len(X)), states[:, -m:] if seasonal else None)
+        return _one_step_fitted(np.tile(Y, (copies, 1)), trend, seasonal, m, params, split)
+
+    def sse_of(F):
+        copies = len(F) // n_series
+        sse = np.sum((F - np.tile(Y, (copies, 1))) ** 2, axis=1).reshape(copies, n_series)
+        sse[~np.isfinite(sse)] = np.inf
+        return sse
+
+    with np.errstate(all='ignore'):
+        current = fitted(x)
+        sse = sse_of(current)[0]
+        damping = np.full(n_series, 1e-3)
+        for iteration in range(LM_ITERATIONS):
+            step = LM_STEP * np.maximum(np.abs(x), 1e-2)
+            perturbed = np.concatenate([x + np.eye(n_unknowns)[k] * step[:, k:k + 1] for k in range(n_unknowns)])
+            jacobian = (fitted(perturbed).reshape(n_unknowns, n_series, n_obs) - current) / step.T[:, :, None]
+            jacobian = np.nan_to_num(jacobian.transpose(1, 2, 0), nan=0.0, posinf=0.0, neginf=0.0)
+            normal = np.einsum('stk,stl->skl', jacobian, jacobian)
+            gradient = np.einsum('stk,st->sk', jacobian, np.nan_to_num(Y - current))
+            scale = np.maximum(np.diagonal(normal, axis1=1, axis2=2), 1e-12)
+
+            lambdas = damping[:, None] * np.array(LM_DAMPING)
+            candidates = []
+            for k in range(len(LM_DAMPING)):
+                system = normal + lambdas[:, k, None, None] * (np.eye(n_unknowns) * scale[:, None, :])
+                try:
+                    delta = np.linalg.solve(system, gradient[:, :, None])[:, :, 0]
+                except np.linalg.LinAlgError:
+                    delta = np.einsum('skl,sl->sk', np.linalg.pinv(system), gradient)
+                candidate = x + np.nan_to_num(delta)
+                candidate[:, :n_active] = np.clip(candidate[:, :n_active], PARAM_EPS, 1 - PARAM_EPS)
+                candidates.append(candidate)
+            candidates = np.stack(candidates)
+            candidate_fitted = fitted(candidates.reshape(-1, n_unknowns))
+            candidate_sse = sse_of(candidate_fitted)
+            best = np.argmin(candidate_sse, axis=0)
+            improved = candidate_sse[best, rows] < sse * (1 - 1e-12)
+            if not improved.any():
+                break
+            x = np.where(improved[:, None], candidates[best, rows], x)
+            current = np.where(improved[:, None], candidate_fitted.reshape(-1, n_series, n_obs)[best, rows], current)
+            sse = np.where(improved, candidate_sse[best, rows], sse)
+            damping = np.where(improved, lambdas[rows, best], damping * 10)
+    note(iterations=iteration + 1)
+
+    center = np.zeros((n_series, 3))
+    center[:, active] = x[:, :n_active]
+    states = x[:, n_active:]
+    return center, (states[:, 0], states[:, 1] if trend else np.zeros(n_series), states[:, -m:] if seasonal else None)
+
+
+def _fit_chunk(Y, trend, seasonal, m):
+    init = initial_states(Y, trend, seasonal, m)
+    center = _grid_search(Y, trend, seasonal, m, init)
+
+    # Additive models: alternate between solving the initial states and
+    # re-searching the parameters, as statsmodels estimates both jointly
+    if 'mul' not in (trend, seasonal):
+        for _ in range(INIT_ROUNDS):
+            solved = _least_squares_init(Y, trend, seasonal, m, center)
+            if not all(state is None or np.all(np.isfinite(state)) for state in solved):
+                break
+            init = solved
+            center = _grid_search(Y, trend, seasonal, m, init)
+    center, init = _refine_jointly(Y, trend, seasonal, m, center, init)
+
+    alpha, beta, gamma = to_params(center[:, 0], center[:, 1], center[:, 2])
+    sse, level, slope, season, fitted = smooth(
+        Y, alpha[:, None], beta[:, None], gamma[:, None], trend, seasonal, m, *init, keep_fitted=True
+    )
+    return (alpha, beta, gamma, level[:, 0], slope[:, 0],
+            season[:, 0, :] if seasonal else None, fitted[:, 0, :], sse[:, 0])
+
+
+# Fit Holt-Winters to every row of Y (series x time, equal lengths)
+def fit_batch(Y, trend='add', seasonal='add', seasonal_periods=None, chunk_size=CHUNK_SIZE):
+    Y = np.asarray(Y, dtype=np.float64)
+    if Y.ndim == 1:
+        Y = Y[None, :]
+    m = int(seasonal_periods) if seasonal else 1
+    if seasonal and Y.shape[1] < m + 1:
+        raise ValueError("Series must be longer than one seasonal cycle.")
+    if not seasonal and Y.shape[1] < 2:
+        raise ValueError("Series must have at least two observations.")
+    if 'mul' in (trend, seasonal) and np.any(Y <= 0):
+        raise ValueError("Multiplicative components require strictly positive series.")
+
+    parts = [_fit_chunk(Y[start:start + chunk_size], trend, seasonal, m)
+             for start in range(0, Y.shape[0], chunk_size)]
+    joined = [None if part[0] is None else np.concatenate(part) for part in zip(*parts)]
+    alpha, beta, gamma, level, slope, season, fitted, sse = joined
+    return BatchedFit(trend, seasonal, m if seasonal else None, alpha, beta, gamma,
+                      level, slope, season, fitted, sse, Y.shape[1])
+
+
+# h-step forecasts for every fitted series, shape (S, steps)
+def forecast_batch(fit, steps):
+    h = np.arange(1, steps + 1)
+    if fit.trend == 'add':
+        base = fit.level[:, None] + fit.slope[:, None] * h
+    elif fit.trend == 'mul':
+        base = fit.level[:, None] * fit.slope[:, None] ** h
+    else:
+        base = np.repeat(fit.level[:, None], steps, axis=1)
+    if not fit.seasonal:
+        return base
+    m = fit.seasonal_periods
+    season = fit.season[:, (fit.n_obs + h - 1) % m]
+    return base + season if fit.seasonal == 'add' else base * season
+
+
+# In-sample RMSE of the one-step-ahead fitted values, per series
+def fitted_rmse(fit, Y):
+    return np.sqrt(np.mean((np.asarray(Y, dtype=np.float64) - fit.fitted) ** 2, axis=1))
+
+
+# Fit and forecast in one call; returns (forecasts (S, steps), rmse (S,))
+def fit_forecast_batch(Y, steps, trend='add', seasonal='add', seasonal_periods=None):
+    fit = fit_batch(Y, trend, seasonal, seasonal_periods)
+    return forecast_batch(fit, steps), fitted_rmse(fit, Y)
+
+
+# Forecasting engine: explicit argument, then the `gdp_forecast_engine` site
+# config key, then statsmodels
+def get_engine(engine=None):
+    if engine is None:
+        engine = frappe.conf.get("gdp_forecast_engine") if frappe.conf else None
+    engine = engine or 'statsmodels'
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown forecasting engine {engine!r}; expected one of {ENGINES}")
+    return engine
+
+
+# Whether the batched engine fits a model to series of `n_obs` values: all
+# but multiplicative models with barely more observations than parameters
+def is_batched(trend, seasonal, seasonal_periods, n_obs):
+    m = int(seasonal_periods) if seasonal else 1
+    return 'mul' not in (trend, seasonal) or n_obs >= free_parameters(trend, seasonal, m) + MIN_SPARE_OBSERVATIONS
+
+
+# Fit many sector series with as few batches as possible: sectors sharing a
+# series length and (trend, seasonal, seasonal_periods) are fitted together.
+# Models the engine does not batch (see is_batched) are fitted with
+# statsmodels in the process pool, through the model `cache`. `params` maps
+# each sector to its parameters. Returns {sector: (forecast, in-sample rmse)}.
+def fit_sectors(series, params, forecast_steps, progress_callback=None, workers=None, cache=None):
+    from gdp_forecasting.forecast_scripts.parallel_fit import map_sectors
+    from gdp_forecasting.forecast_scripts.sector_models import fit_forecast_series
+
+    groups = {}
+    for sector, values in series.items():
+        values = np.asarray(values, dtype=np.float64)
+        groups.setdefault((len(values),) + tuple(params[sector]), []).append((sector, values))
+
+    results, unbatched = {}, []
+    for (n_obs, trend, seasonal, seasonal_periods), members in groups.items():
+        if not is_batched(trend, seasonal, seasonal_periods, n_obs):
+            unbatched.extend(
+                (sector, (values, None, trend, seasonal, seasonal_periods, forecast_steps, cache))
+                for sector, values in members
+            )
+            continue
+        Y = np.vstack([values for _, values in members])
+        with span(f"fit batch {trend}/{seasonal}/{seasonal_periods}", sectors=len(members), rows=Y.size):
+            forecasts, rmse = fit_forecast_batch(Y, forecast_steps, trend, seasonal, seasonal_periods)
+        for row, (sector, _) in enumerate(members):
+            results[sector] = (forecasts[row], float(rmse[row]))
+            if progress_callback:
+                progress_callback(sector, len(results), len(series))
+
+    def unbatched_progress(sector, completed, total):
+        if progress_callback:
+            progress_callback(sector, len(results) + completed, len(series))
+
+    for sector, (forecast, rmse) in map_sectors(fit_forecast_series, unbatched, workers, unbatched_progress):
+        results[sector] = (forecast, float(rmse))
+    return results
+
+
+# Check the batched engine against statsmodels on the same series. Returns
+# the per-series ratio of in-sample RMSE (batched / statsmodels) and the
+# largest relative forecast difference. The engine is within tolerance when
+# the median RMSE ratio and every forecast difference are within `tolerance`.
+# Multiplicative models with few spare observations (see is_batched) are
+# underdetermined: both fits reach different optima, so they are not
+# compared.
+def compare_with_statsmodels(Y, steps, trend='add', seasonal='add', seasonal_periods=None, tolerance=0.05):
+    from statsmodels.tsa.holtwinters import ExponentialSmoothing
+
+    Y = np.asarray(Y, dtype=np.float64)
+    fit = fit_batch(Y, trend, seasonal, seasonal_periods)
+    ours = forecast_batch(fit, steps)
+    our_rmse = fitted_rmse(fit, Y)
+
+    rmse_ratio, forecast_diff = [], []
+    for row, series in enumerate(Y):
+        reference = ExponentialSmoothing(
+            series, trend=trend, seasonal=seasonal, seasonal_periods=seasonal_periods
+        ).fit()
+        reference_rmse = np.sqrt(np.mean((series - reference.fittedvalues) ** 2))
+        reference_forecast = np.asarray(reference.forecast(steps))
+        rmse_ratio.append(our_rmse[row] / reference_rmse if reference_rmse > 0 else 1.0)
+        forecast_diff.append(np.max(np.abs(ours[row] - reference_forecast) / np.maximum(np.abs(reference_forecast), 1e-12)))
+
+    rmse_ratio, forecast_diff = np.array(rmse_ratio), np.array(forecast_diff)
+    return {
+        'rmse_ratio': rmse_ratio,
+        'max_forecast_rel_diff': forecast_diff,
+        'within_tolerance': bool(np.median(rmse_ratio) <= 1 + tolerance and np.all(forecast_diff <= tolerance)),
+    }
+
+
+# Synthetic positive seasonal series with trend and noise, shape (n_series, length)
+def synthetic_series(n_series, length, seasonal_periods=4, seed=0):
+    rng = np.random.default_rng(seed)
+    t = np.arange(length)
+    level = rng.uniform(1e3, 1e5, size=(n_series, 1))
+    growth = rng.uniform(-0.002, 0.02, size=(n_series, 1))
+    amplitude = rng.uniform(0.01, 0.1, size=(n_series, 1))
+    pattern = np.sin(2 * np.pi * t / seasonal_periods)
+    noise = rng.normal(0, 0.01, size=(n_series, length))
+    return level * (1 + growth) ** t * (1 + amplitude * pattern + noise)
+
+
+# Fits per second of the batched engine (and optionally of statsmodels on a
+# sample of the same series)
+def benchmark(n_series=1000, length=40, seasonal_periods=4, trend='add', seasonal='add', statsmodels_sample=20):
+    Y = synthetic_series(n_series, length, seasonal_periods)
+    started = time.perf_counter()
+    fit_batch(Y, trend, seasonal, seasonal_periods)
+    batched_seconds = time.perf_counter() - started
+    result = {
+        'n_series': n_series,
+        'length': length,
+        'batched_seconds': round(batched_seconds, 4),
+        'batched_fits_per_second': round(n_series / batched_seconds, 1),
+    }
+
+    if statsmodels_sample:
+        from statsmodels.tsa.holtwinters import ExponentialSmoothing
+
+        sample = Y[:statsmodels_sample]
+        started = time.perf_counter()
+        for series in sample:
+            ExponentialSmoothing(series, trend=trend, seasonal=seasonal, seasonal_periods=seasonal_periods).fit()
+        statsmodels_seconds = time.perf_counter() - started
+        result['statsmodels_fits_per_second'] = round(len(sample) / statsmodels_seconds, 1)
+        result['speedup'] = round(result['batched_fits_per_second'] / result['statsmodels_fits_per_second'], 1)
+    return result
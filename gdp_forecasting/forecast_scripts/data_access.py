@@ -0,0 +1,175 @@
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+import frappe
+from gdp_forecasting.gdp_forecasting.dataset_snapshot import read_snapshot
+from gdp_forecasting.gdp_forecasting.delta_upload import DATASET_KEYS
+from gdp_forecasting.gdp_forecasting.instrumentation import span
+
+# Every forecaster loads its input through this module. Sector, region and
+# period filters are applied in SQL (or on the memory-mapped snapshot) so
+# only the needed rows and columns are materialized. Within a forecast_run()
+# scope, loads are memoized, so repeated loads in one run cost nothing.
+
+# Sectors the annual forecasts cover. Override with the
+# `gdp_forecast_sectors` site config key: either a list (annual only) or
+# {"annual": [...], "quarterly": [...]}. Quarterly forecasts cover every
+# sector unless configured.
+DEFAULT_SECTORS = {
+    'annual': [
+        'Agriculture, Forestry & Fishing', 'Mining & Quarrying', 'Manufacturing',
+        'Electricity, Gas and Water', 'Construction', 'Wholesale & Retail Trade, Restaurants & hotels',
+        'Transport, Storage & Communication', 'Finance, Insurance and Business services',
+        'Community, Social & Personal Services', 'Government Activities', 'Total Riyadh GDP',
+    ],
+    'quarterly': None,
+}
+
+# Typed columns of the uploaded datasets and the regional base tables
+COLUMN_DTYPES = {
+    'sector': object, 'sub_sector': object, 'Region': object, 'Output_Classification': object,
+    'year': np.int32, 'quarter': np.int32, 'YearNumber': np.int32, 'QuarterNumber': np.int32,
+    'gdp': np.float64, 'Value': np.float64,
+}
+
+# Regional base tables: their region and period columns
+BASE_TABLES = {
+    'gdp': {'region': 'Region', 'year': 'YearNumber', 'columns': ['Region', 'YearNumber', 'QuarterNumber', 'Value']},
+    'workforce': {
+        'region': 'Region', 'year': 'YearNumber',
+        'columns': ['Region', 'YearNumber', 'QuarterNumber', 'Output_Classification', 'Value'],
+    },
+}
+
+_run_memo = None
+
+
+def get_sectors(frequency='annual'):
+    configured = frappe.conf.get('gdp_forecast_sectors') if frappe.conf else None
+    if isinstance(configured, dict):
+        return configured.get(frequency, DEFAULT_SECTORS[frequency])
+    if configured and frequency == 'annual':
+        return list(configured)
+    return DEFAULT_SECTORS[frequency]
+
+
+# Memoize loads for the duration of one forecast run. Nested scopes share
+# the outer run's memo.
+@contextmanager
+def forecast_run():
+    global _run_memo
+    if _run_memo is not None:
+        yield _run_memo
+        return
+    _run_memo = {}
+    try:
+        yield _run_memo
+    finally:
+        _run_memo = None
+
+
+def memoized(key, load):
+    if _run_memo is None:
+        return load()
+    if key not in _run_memo:
+        _run_memo[key] = load()
+    # Shallow copy: callers may add columns or reindex without touching the
+    # memoized frame
+    return _run_memo[key].copy(deep=False)
+
+
+# Cast to the column dtypes, leaving columns that already match (such as
+# memory-mapped snapshot arrays) uncopied
+def typed(frame):
+    casts = {
+        column: COLUMN_DTYPES[column] for column in frame.columns
+        if column in COLUMN_DTYPES and frame[column].dtype != COLUMN_DTYPES[column]
+    }
+    return frame.astype(casts) if casts else frame
+
+
+# WHERE clause for optional IN / range filters: {column: values or (low, high)}
+def build_where(in_filters, range_filters):
+    conditions, values = [], {}
+    for column, allowed in in_filters.items():
+        if allowed is None:
+            continue
+        if not allowed:
+            conditions.append("1 = 0")
+        else:
+            conditions.append(f"`{column}` IN %({column})s")
+            values[column] = tuple(allowed)
+    for column, (low, high) in range_filters.items():
+        if low is not None:
+            conditions.append(f"`{column}` >= %({column}_from)s")
+            values[f"{column}_from"] = int(low)
+        if high is not None:
+            conditions.append(f"`{column}` <= %({column}_to)s")
+            values[f"{column}_to"] = int(high)
+    return (f"WHERE {' AND '.join(conditions)}" if conditions else ""), values
+
+
+def query(table, columns, in_filters, range_filters):
+    where, values = build_where(in_filters, range_filters)
+    column_sql = ", ".join(f"`{column}`" for column in columns)
+    rows = frappe.db.sql(f"SELECT {column_sql} FROM `{table}` {where}", values)
+    return typed(pd.DataFrame(list(rows), columns=columns))
+
+
+# The same filters applied to a snapshot frame with one boolean mask
+def filter_frame(frame, in_filters, range_filters):
+    mask = np.ones(len(frame), dtype=bool)
+    for column, allowed in in_filters.items():
+        if allowed is not None:
+            mask &= frame[column].isin(allowed).to_numpy()
+    for column, (low, high) in range_filters.items():
+        if low is not None:
+            mask &= frame[column].to_numpy() >= int(low)
+        if high is not None:
+            mask &= frame[column].to_numpy() <= int(high)
+    return frame if mask.all() else frame[mask].reset_index(drop=True)
+
+
+# Load an uploaded dataset ('Annual' or 'Quarterly') in long form. `sectors`
+# and the inclusive year bounds are optional; `columns` defaults to the key
+# and value columns.
+def load_dataset(dataset_type, sectors=None, from_year=None, to_year=None, columns=None):
+    spec = DATASET_KEYS[dataset_type]
+    columns = list(columns or spec['keys'] + [spec['value']])
+    in_filters = {'sector': list(sectors) if sectors is not None else None}
+    range_filters = {'year': (from_year, to_year)}
+
+    def load():
+        with span(f"load {dataset_type}") as fields:
+            # Filter columns have to be read even when they are not returned
+            needed = columns + [column for column in ('sector', 'year') if column not in columns]
+            frame = read_snapshot(dataset_type, needed)
+            if frame is None:
+                fields['source'] = 'database'
+                frame = query(spec['table'], columns, in_filters, range_filters)
+            else:
+                fields['source'] = 'snapshot'
+                frame = filter_frame(frame, in_filters, range_filters)
+                frame = typed(pd.DataFrame({column: frame[column] for column in columns}, copy=False))
+            fields['rows'] = len(frame)
+        return frame
+
+    key = ('dataset', dataset_type, tuple(columns), tuple(sectors) if sectors is not None else None, from_year, to_year)
+    return memoized(key, load)
+
+
+# Load one of the regional base tables (gdp, workforce) for some regions and
+# an inclusive year range
+def load_base_table(table, regions=None, from_year=None, to_year=None):
+    spec = BASE_TABLES[table]
+    in_filters = {spec['region']: list(regions) if regions is not None else None}
+    range_filters = {spec['year']: (from_year, to_year)}
+
+    def load():
+        with span(f"load {table}") as fields:
+            frame = query(table, spec['columns'], in_filters, range_filters)
+            fields['rows'] = len(frame)
+        return frame
+
+    key = ('base', table, tuple(regions) if regions is not None else None, from_year, to_year)
+    return memoized(key, load)
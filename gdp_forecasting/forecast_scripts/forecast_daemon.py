@@ -0,0 +1,237 @@
+import json
+import os
+import queue
+import secrets
+import threading
+import time
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+import frappe
+
+# A long-lived forecasting process for the whole bench. It imports every
+# forecaster and keeps a warm process pool, so a forecast handed to it starts
+# fitting immediately instead of paying the pandas / statsmodels / pmdarima
+# import and pool start-up cost on every run. Run it from the Procfile:
+#
+#   gdp_forecast_daemon: bench --site <site> gdp-forecast-daemon
+#
+# Requests arrive on a local Unix socket and are run one at a time (each run
+# already fans out over the pool). Job status is reported through the usual
+# forecast_jobs cache entries, so the forecast page polls it the same way.
+#
+# The socket lives in a directory only the bench user can open, and clients
+# must know the bench's secret key (config/gdp_forecast_daemon.key, created by
+# the daemon on first start). Messages are JSON, never pickles. The daemon
+# only runs jobs for the sites it was started for; a request for any other
+# site is rejected and the job goes to RQ.
+SOCKET_DIRECTORY = 'gdp_forecast'
+SOCKET_NAME = 'gdp_forecast.sock'
+AUTHKEY_FILE = 'gdp_forecast_daemon.key'
+CONNECT_TIMEOUT = 2
+MAX_MESSAGE_BYTES = 64 * 1024
+
+
+def get_config_path(*parts):
+    from frappe.utils import get_bench_path
+    return os.path.join(get_bench_path(), 'config', *parts)
+
+
+def get_socket_path(conf=None):
+    conf = conf if conf is not None else (frappe.conf or {})
+    if conf.get('gdp_forecast_daemon_socket'):
+        return conf['gdp_forecast_daemon_socket']
+    return get_config_path(SOCKET_DIRECTORY, SOCKET_NAME)
+
+
+# The bench's daemon key: `gdp_forecast_daemon_authkey` in
+# common_site_config.json, else the key file. With `create`, a missing key
+# file is created with a random key (readable by the bench user only).
+# Returns None when there is no key.
+def get_authkey(conf=None, create=False):
+    conf = conf if conf is not None else (frappe.conf or {})
+    if conf.get('gdp_forecast_daemon_authkey'):
+        return conf['gdp_forecast_daemon_authkey'].encode()
+    path = get_config_path(AUTHKEY_FILE)
+    if create and not os.path.exists(path):
+        descriptor = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(descriptor, 'w') as f:
+            f.write(secrets.token_hex(32))
+    try:
+        with open(path) as f:
+            return f.read().strip().encode() or None
+    except OSError:
+        return None
+
+
+def send_message(connection, message):
+    connection.send_bytes(json.dumps(message).encode())
+
+
+def receive_message(connection):
+    message = json.loads(connection.recv_bytes(MAX_MESSAGE_BYTES))
+    if not isinstance(message, dict):
+        raise ValueError("Expected a JSON object")
+    return message
+
+
+# Send one request and return the reply, or None when no daemon is running
+# or it cannot be reached
+def request_daemon(message):
+    address, authkey = get_socket_path(), get_authkey()
+    if not authkey or not os.path.exists(address):
+        return None
+    try:
+        with Client(address, family='AF_UNIX', authkey=authkey) as connection:
+            send_message(connection, message)
+            if connection.poll(CONNECT_TIMEOUT):
+                return receive_message(connection)
+    except (OSError, EOFError, ValueError, AuthenticationError) as e:
+        frappe.logger("gdp_forecasting").warning(f"Forecast daemon unreachable at {address}: {e}")
+    return None
+
+
+# Hand a queued forecast to the daemon. Returns False when no daemon is
+# running, it cannot be reached or it does not serve this site, so the
+# caller can fall back to RQ.
+def submit(job_id, forecast_type):
+    reply = request_daemon({'site': frappe.local.site, 'job_id': job_id, 'forecast_type': forecast_type})
+    return bool(reply) and reply.get('status') == 'accepted'
+
+
+@frappe.whitelist()
+def get_daemon_status():
+    reply = request_daemon({'command': 'status'})
+    return dict(reply, running=True) if reply else {'running': False}
+
+
+class ForecastDaemon:
+    def __init__(self, sites_path, address, authkey, sites, workers=None):
+        self.sites_path = sites_path
+        self.address = address
+        self.authkey = authkey
+        self.sites = set(sites)
+        self.workers = workers
+        self.requests = queue.Queue()
+        self.started_at = time.time()
+        self.completed = 0
+        self.current = None
+
+    # Import every forecaster and start the warm pool
+    def warm_up(self):
+        from gdp_forecasting.forecast_scripts import parallel_fit, registry
+
+        for forecast_type in registry.forecast_types():
+            try:
+                registry.get_forecaster(forecast_type)
+            except ImportError as e:
+                print(f"Forecaster {forecast_type!r} unavailable: {e}")
+        parallel_fit.start_shared_pool(self.workers)
+
+    def run_job(self, request):
+        from gdp_forecasting.gdp_forecasting.forecast_jobs import run_forecast_job
+
+        frappe.init(site=request['site'], sites_path=self.sites_path)
+        frappe.connect()
+        try:
+            run_forecast_job(request['job_id'], request['forecast_type'])
+        except Exception:
+            pass  # Already logged and reported failed by run_forecast_job
+        finally:
+            # Persist result writes as well as any Error Log entry
+            frappe.db.commit()
+            frappe.destroy()
+
+    def work(self):
+        while True:
+            request = self.requests.get()
+            self.current = request
+            try:
+                self.run_job(request)
+            finally:
+                self.current = None
+                self.completed += 1
+
+    def status(self):
+        return {
+            'pid': os.getpid(),
+            'sites': sorted(self.sites),
+            'uptime': round(time.time() - self.started_at, 1),
+            'queued': self.requests.qsize(),
+            'current': self.current,
+            'completed': self.completed,
+        }
+
+    # A request to queue, or the reason it is rejected
+    def check_request(self, request):
+        from gdp_forecasting.forecast_scripts import registry
+
+        if request.get('site') not in self.sites:
+            return f"site {request.get('site')!r} is not served by this daemon"
+        if not isinstance(request.get('job_id'), str) or request.get('forecast_type') not in registry.FORECASTERS:
+            return "malformed forecast request"
+        return None
+
+    def listen(self):
+        directory = os.path.dirname(self.address)
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        if os.path.exists(self.address):
+            os.remove(self.address)  # Stale socket from a previous run
+        # The socket is created owner-only rather than restricted after binding
+        umask = os.umask(0o077)
+        try:
+            return Listener(self.address, family='AF_UNIX', authkey=self.authkey)
+        finally:
+            os.umask(umask)
+
+    def serve_forever(self):
+        with self.listen() as listener:
+            threading.Thread(target=self.work, daemon=True).start()
+            print(f"GDP forecast daemon listening on {self.address}")
+            while True:
+                try:
+                    connection = listener.accept()
+                except (OSError, EOFError, AuthenticationError) as e:
+                    print(f"Rejected connection: {e}")
+                    continue
+                with connection:
+                    try:
+                        request = receive_message(connection)
+                    except (OSError, EOFError, ValueError) as e:
+                        print(f"Unreadable request: {e}")
+                        continue
+                    if request.get('command') == 'status':
+                        send_message(connection, self.status())
+                        continue
+                    error = self.check_request(request)
+                    if error:
+                        print(f"Rejected request: {error}")
+                        send_message(connection, {'status': 'rejected', 'error': error})
+                        continue
+                    self.requests.put({key: request[key] for key in ('site', 'job_id', 'forecast_type')})
+                    send_message(connection, {'status': 'accepted', 'position': self.requests.qsize()})
+
+
+def read_common_config(sites_path):
+    try:
+        with open(os.path.join(sites_path, 'common_site_config.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+# Entry point of `bench --site <site> gdp-forecast-daemon`; bench runs
+# commands from the sites directory. `sites` are the sites the daemon runs
+# jobs for, else `gdp_forecast_daemon_sites` from common_site_config.json.
+def serve(socket_path=None, workers=None, sites_path='.', sites=None):
+    conf = read_common_config(sites_path)
+    sites = list(sites or conf.get('gdp_forecast_daemon_sites') or [])
+    if not sites:
+        raise ValueError(
+            "No site to serve: pass --site, or set gdp_forecast_daemon_sites in common_site_config.json"
+        )
+    address = socket_path or get_socket_path(conf)
+    # Resolved here: there is no site (and so no frappe.conf) at start-up
+    workers = workers or conf.get('gdp_forecast_workers') or os.cpu_count() or 1
+    daemon = ForecastDaemon(os.path.abspath(sites_path), address, get_authkey(conf, create=True), sites, workers)
+    daemon.warm_up()
+    daemon.serve_forever()
@@ -0,0 +1,277 @@
+from collections import namedtuple
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from scipy.sparse.linalg import splu
+from gdp_forecasting.forecast_scripts.batched_holt_winters import fit_forecast_batch, get_engine
+from gdp_forecasting.forecast_scripts.data_access import forecast_run, get_sectors, load_dataset
+from gdp_forecasting.forecast_scripts.model_cache import get_model_cache
+from gdp_forecasting.forecast_scripts.parallel_fit import map_sectors
+from gdp_forecasting.forecast_scripts.result_writer import write_results
+from gdp_forecasting.forecast_scripts.sector_models import fit_forecast_series
+from gdp_forecasting.gdp_forecasting.instrumentation import span
+
+# Hierarchical forecasting: every node of the sector tree (the total, each
+# sector, each sector / sub-sector leaf) gets a Holt-Winters base forecast,
+# and the base forecasts are then reconciled so that every aggregate equals
+# the sum of its children.
+#
+# The tree is described by a sparse summing matrix S (nodes x leaves, 0/1):
+# S @ leaf_values gives every node's value. Nodes are ordered aggregates
+# first, leaves last, so S = [S_agg; I]. Reconciliation methods:
+#
+#   bottom_up   leaves' base forecasts summed up the tree
+#   top_down    the total's forecast split by the leaves' average historical
+#               shares
+#   ols, wls_struct, wls_var
+#               MinT with a diagonal W: identity, the number of leaves under
+#               each node, or each node's in-sample residual variance
+#
+# MinT is solved in its constrained form, y~ = y^ - W C' (C W C')^-1 C y^ with
+# C = [I, -S_agg], so the only system solved is (aggregates x aggregates) and
+# sparse. That keeps it practical for tens of thousands of leaves, as long as
+# the aggregates are fewer. (A full covariance W is not: it is dense in the
+# number of nodes.)
+METHODS = ('bottom_up', 'top_down', 'ols', 'wls_struct', 'wls_var')
+MINT_WEIGHTS = ('ols', 'wls_struct', 'wls_var')
+FORECAST_END_YEAR = 2030
+TOTAL = 'Total'
+# Rows of the uploaded sheets that are totals rather than leaves
+TOTAL_SECTORS = ('Total Riyadh GDP',)
+
+FREQUENCIES = {
+    'annual': {
+        'dataset': 'Annual',
+        'levels': ['sector', 'sub_sector'],
+        'periods': ['year'],
+        'periods_per_year': 1,
+        'params': ('add', 'add', 3),
+        'table': 'hierarchical_annual',
+    },
+    'quarterly': {
+        'dataset': 'Quarterly',
+        'levels': ['sector'],
+        'periods': ['year', 'quarter'],
+        'periods_per_year': 4,
+        'params': ('add', 'add', 4),
+        'table': 'hierarchical_quarterly',
+    },
+}
+
+# nodes: one row per node with its level (0 = total) and level columns;
+# S: sparse (nodes x leaves) summing matrix; n_leaves: leaves are the last
+# n_leaves nodes
+Hierarchy = namedtuple('Hierarchy', ['nodes', 'S', 'n_leaves'])
+
+
+# Build the hierarchy over the distinct `levels` paths in `leaves`
+def build_hierarchy(leaves, levels):
+    leaves = leaves[levels].drop_duplicates().sort_values(levels).reset_index(drop=True)
+    n_leaves = len(leaves)
+    leaf_index = np.arange(n_leaves)
+    node_frames, rows = [], []
+    offset = 0
+    for depth in range(len(levels) + 1):
+        if depth == 0:
+            codes, labels = np.zeros(n_leaves, dtype=np.int64), pd.DataFrame(index=[0])
+        elif depth == len(levels):
+            codes, labels = leaf_index, leaves.copy()
+        else:
+            keys = leaves[levels[:depth]]
+            # Groups numbered in order of appearance, as drop_duplicates keeps them
+            codes = keys.groupby(levels[:depth], sort=False).ngroup().to_numpy()
+            labels = keys.drop_duplicates().reset_index(drop=True)
+        for level in levels[depth:]:
+            labels[level] = TOTAL if depth == 0 and level == levels[0] else ''
+        labels.insert(0, 'level', depth)
+        node_frames.append(labels[['level'] + levels])
+        rows.append(codes + offset)
+        offset += len(labels)
+    S = sp.csr_matrix(
+        (np.ones(n_leaves * (len(levels) + 1)), (np.concatenate(rows), np.tile(leaf_index, len(levels) + 1))),
+        shape=(offset, n_leaves),
+    )
+    return Hierarchy(pd.concat(node_frames, ignore_index=True), S, n_leaves)
+
+
+# Leaf rows of a dataset: sheet totals and rows standing for a whole group
+# (an empty level whose siblings are named, e.g. a sector's own total row
+# next to its sub-sectors) are aggregates, not leaves
+def leaf_rows(frame, levels):
+    keep = ~frame[levels[0]].isin(TOTAL_SECTORS)
+    for depth in range(1, len(levels)):
+        empty = frame[levels[depth]].fillna('') == ''
+        named_siblings = (~empty).groupby([frame[level] for level in levels[:depth]]).transform('any')
+        keep &= ~(empty & named_siblings)
+    return frame[keep]
+
+
+# Leaves x periods matrix of the observed values
+def leaf_matrix(frame, hierarchy, spec):
+    levels = spec['levels']
+    pivot = frame.pivot_table(index=levels, columns=spec['periods'], values='gdp', aggfunc='sum')
+    leaves = hierarchy.nodes.iloc[-hierarchy.n_leaves:][levels]
+    pivot = pivot.reindex(pd.MultiIndex.from_frame(leaves) if len(levels) > 1 else leaves[levels[0]])
+    return pivot.fillna(0).to_numpy(dtype=np.float64), list(pivot.columns)
+
+
+# Base forecasts (nodes x steps) and in-sample RMSE (nodes) for every node
+def base_forecasts(Y, steps, params, engine=None, workers=None, use_cache=True, frequency='annual'):
+    trend, seasonal, seasonal_periods = params
+    if get_engine(engine) == 'numpy':
+        return fit_forecast_batch(Y, steps, trend, seasonal, seasonal_periods)
+    cache = get_model_cache() if use_cache else None
+    tasks = [(node, (Y[node], frequency, trend, seasonal, seasonal_periods, steps, cache)) for node in range(len(Y))]
+    fitted = map_sectors(fit_forecast_series, tasks, workers=workers)
+    forecasts = np.vstack([forecast for _, (forecast, _) in fitted]) if fitted else np.zeros((0, steps))
+    return forecasts, np.array([rmse for _, (_, rmse) in fitted])
+
+
+def bottom_up(hierarchy, base):
+    return hierarchy.S @ base[-hierarchy.n_leaves:]
+
+
+# Split the total by each leaf's average share of it over the history
+def top_down(hierarchy, base, history):
+    leaves = history[-hierarchy.n_leaves:]
+    totals = leaves.sum(axis=0)
+    valid = totals != 0
+    if valid.any():
+        shares = (leaves[:, valid] / totals[valid]).mean(axis=1)
+    else:
+        shares = np.full(hierarchy.n_leaves, 1.0 / max(hierarchy.n_leaves, 1))
+    return hierarchy.S @ np.outer(shares, base[0])
+
+
+# MinT with diagonal weights `w` (one per node)
+def mint(hierarchy, base, w):
+    n_agg = hierarchy.S.shape[0] - hierarchy.n_leaves
+    if n_agg == 0:
+        return base.copy()
+    S_agg = hierarchy.S[:n_agg]
+    w_agg, w_leaf = w[:n_agg], w[n_agg:]
+    # C W C' = W_agg + S_agg W_leaf S_agg'
+    system = (sp.diags(w_agg) + S_agg @ sp.diags(w_leaf) @ S_agg.T).tocsc()
+    incoherence = base[:n_agg] - S_agg @ base[n_agg:]
+    x = splu(system).solve(np.ascontiguousarray(incoherence))
+    return base - np.vstack([w_agg[:, None] * x, -w_leaf[:, None] * (S_agg.T @ x)])
+
+
+def mint_weights(hierarchy, method, rmse):
+    if method == 'ols':
+        return np.ones(hierarchy.S.shape[0])
+    if method == 'wls_struct':
+        return np.asarray(hierarchy.S.sum(axis=1), dtype=np.float64).ravel()
+    # Residual variances, floored so a perfectly fitted node cannot pin the
+    # solution
+    variance = np.nan_to_num(np.asarray(rmse, dtype=np.float64) ** 2, nan=np.inf)
+    finite = variance[np.isfinite(variance) & (variance > 0)]
+    floor = finite.min() * 1e-3 if finite.size else 1.0
+    return np.where(np.isfinite(variance), np.maximum(variance, floor), finite.max() if finite.size else 1.0)
+
+
+def reconcile(hierarchy, base, method, history=None, rmse=None):
+    if method == 'bottom_up':
+        return bottom_up(hierarchy, base)
+    if method == 'top_down':
+        return top_down(hierarchy, base, history)
+    if method in MINT_WEIGHTS:
+        return mint(hierarchy, base, mint_weights(hierarchy, method, rmse))
+    raise ValueError(f"Unknown reconciliation method {method!r}; expected one of {METHODS}")
+
+
+# Periods after the last observed one, up to the end of FORECAST_END_YEAR
+def forecast_periods(last_period, spec):
+    if spec['periods_per_year'] == 1:
+        return [(year,) for year in range(int(last_period) + 1, FORECAST_END_YEAR + 1)]
+    year, quarter = (int(part) for part in last_period)
+    periods = []
+    while True:
+        year, quarter = (year + 1, 1) if quarter == 4 else (year, quarter + 1)
+        if year > FORECAST_END_YEAR:
+            return periods
+        periods.append((year, quarter))
+
+
+# Long-form result rows: one per method, node and forecast period
+def result_frame(hierarchy, spec, periods, base, rmse, reconciled):
+    n_nodes, n_steps = base.shape
+    nodes = hierarchy.nodes.loc[hierarchy.nodes.index.repeat(n_steps)].reset_index(drop=True)
+    for position, column in enumerate(spec['periods']):
+        nodes[column] = np.tile([period[position] for period in periods], n_nodes)
+    nodes['base_gdp'] = base.ravel()
+    nodes['rmse'] = np.repeat(rmse, n_steps)
+    frames = []
+    for method, values in reconciled.items():
+        frame = nodes.copy()
+        frame.insert(0, 'method', method)
+        frame['gdp'] = values.ravel()
+        frames.append(frame)
+    return pd.concat(frames, ignore_index=True)
+
+
+def result_columns(spec):
+    return ['method', 'level'] + spec['levels'] + spec['periods'] + ['base_gdp', 'gdp', 'rmse']
+
+
+def check_methods(methods):
+    methods = list(methods or METHODS)
+    unknown = set(methods) - set(METHODS)
+    if unknown:
+        raise ValueError(f"Unknown reconciliation methods {sorted(unknown)}; expected some of {METHODS}")
+    return methods
+
+
+# The dataset's hierarchy, every node's history (nodes x periods) and the
+# observed periods
+def load_hierarchy(frequency):
+    spec = FREQUENCIES[frequency]
+    frame = load_dataset(spec['dataset'], sectors=get_sectors(frequency))
+    for level in spec['levels']:
+        frame[level] = frame[level].fillna('')
+    with span('pivot', rows=len(frame)) as fields:
+        frame = leaf_rows(frame, spec['levels'])
+        hierarchy = build_hierarchy(frame, spec['levels'])
+        leaf_history, observed = leaf_matrix(frame, hierarchy, spec)
+        history = hierarchy.S @ leaf_history
+        fields.update(nodes=hierarchy.S.shape[0], leaves=hierarchy.n_leaves, periods=len(observed))
+    return hierarchy, history, observed
+
+
+def run(frequency, progress_callback=None, workers=None, use_cache=True, engine=None, methods=None):
+    spec = FREQUENCIES[frequency]
+    methods = check_methods(methods)
+    columns = result_columns(spec)
+    hierarchy, history, observed = load_hierarchy(frequency)
+    if not hierarchy.n_leaves or not observed:
+        return write_results(spec['table'], pd.DataFrame(columns=columns), columns=columns, key_columns=columns[:-3])
+
+    periods = forecast_periods(observed[-1], spec)
+    with span('fit', engine=get_engine(engine), nodes=len(history)):
+        base, rmse = base_forecasts(history, len(periods), spec['params'], engine, workers, use_cache, frequency)
+    if progress_callback:
+        progress_callback('base forecasts', 1, 2)
+
+    reconciled = {}
+    for method in methods:
+        with span(f"reconcile {method}") as fields:
+            reconciled[method] = reconcile(hierarchy, base, method, history, rmse)
+            # Largest gap between an aggregate and the sum of its leaves
+            fields['incoherence'] = float(np.abs(
+                hierarchy.S @ reconciled[method][-hierarchy.n_leaves:] - reconciled[method]
+            ).max()) if len(base) else 0.0
+    if progress_callback:
+        progress_callback('reconciliation', 2, 2)
+
+    results = result_frame(hierarchy, spec, periods, base, rmse, reconciled)
+    return write_results(spec['table'], results, columns=columns, key_columns=columns[:-3])
+
+
+def main_annual(progress_callback=None, workers=None, use_cache=True, engine=None, methods=None):
+    with forecast_run():
+        return run('annual', progress_callback, workers, use_cache, engine, methods)
+
+
+def main_quarterly(progress_callback=None, workers=None, use_cache=True, engine=None, methods=None):
+    with forecast_run():
+        return run('quarterly', progress_callback, workers, use_cache, engine, methods)
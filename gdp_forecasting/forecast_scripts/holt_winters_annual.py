@@ -1,195 +1,128 @@
 import pandas as pd
-from statsmodels.tsa.holtwinters import ExponentialSmoothing
-from sklearn.metrics import mean_squared_error
-from math import sqrt
-from itertools import product
 import frappe
-
-def main_annual():
-    # Function to load data from the database
-    def load_data_from_db():
-        query = "SELECT * FROM `tabAnnual Dataset`"
-        query = frappe.db.sql(query, as_dict=True)
-        if query:
-            try:
-                # Replace None with empty strings or another placeholder
-                cleaned_data = [
-                    {k: (v if v is not None else "") for k, v in record.items()}
-                    for record in query
-                ]
-                df = pd.DataFrame(cleaned_data)
-                print(df.head())  # Check the DataFrame output
-            except Exception as e:
-                print("Error creating DataFrame:", e)
-        else:
-            print("No data found in `tabQuarterly Dataset`.")
-        relevant_sectors = [
-            'Agriculture, Forestry & Fishing', 'Mining & Quarrying', 'Manufacturing',
-            'Electricity, Gas and Water', 'Construction', 'Wholesale & Retail Trade, Restaurants & hotels',
-            'Transport, Storage & Communication', 'Finance, Insurance and Business services',
-            'Community, Social & Personal Services', 'Government Activities', 'Total Riyadh GDP'
-        ]
-        df = df[df['sector'].isin(relevant_sectors)]
-        return df
-
-    # Function to insert predictions and historical data into the database
-    def insert_predictions_to_db(predictions, rmse_values):
-        # Create table if it doesn't exist
-        frappe.db.sql("""
-            CREATE TABLE IF NOT EXISTS `tabHolt Winters Annual` (
-                `id` INT AUTO_INCREMENT PRIMARY KEY,
-                `name` VARCHAR(255) UNIQUE,
-                `sector` VARCHAR(255),
-                `year` INT,
-                `gdp` FLOAT,
-                `rmse` FLOAT
-            )
-        """)
-
-        # Clear existing data in the table
-        frappe.db.sql("TRUNCATE TABLE `tabHolt Winters Annual`")
-
-        # Load the dataset from the database to avoid re-reading if already loaded
-        df = load_data_from_db()
-
-        # Insert historical data
-        for sector in df['sector'].unique():
-            sector_data = df[df['sector'] == sector]
-            for index, row in sector_data.iterrows():
-                # Check if the record already exists in the table
-                existing_record = frappe.db.sql("""
-                    SELECT COUNT(*) FROM `tabHolt Winters Annual`
-                    WHERE name = %s
-                """, (f"{row['sector']}-{row['year']}",))
-
-                if existing_record[0][0] == 0:  # If no record exists
-                    frappe.db.sql(
-                        """
-                        INSERT INTO `tabHolt Winters Annual` (name, sector, year, gdp, rmse)
-                        VALUES (%s, %s, %s, %s, %s)
-                        """,
-                        (f"{row['sector']}-{row['year']}", row['sector'], int(row['year']), float(row['gdp']), 0)  # 0 for RMSE in historical data
-                    )
-
-        # Insert forecast data
-        for sector, forecast in predictions.items():
-            rmse = rmse_values.get(sector, 0)  # Default RMSE to 0 if not found
-            for year, gdp in zip(prediction_years, forecast):
-                # Check if the record already exists in the table
-                existing_record = frappe.db.sql("""
-                    SELECT COUNT(*) FROM `tabHolt Winters Annual`
-                    WHERE name = %s
-                """, (f"{sector}-{year}",))
-
-                if existing_record[0][0] == 0:  # If no record exists
-                    frappe.db.sql(
-                        """
-                        INSERT INTO `tabHolt Winters Annual` (name, sector, year, gdp, rmse)
-                        VALUES (%s, %s, %s, %s, %s)
-                        """,
-                        (f"{sector}-{year}", sector, int(year), float(gdp), float(rmse))
-                    )
-
-
-    # Pivoting the DataFrame
-    def calculate_rmse(actual, predicted):
-        return sqrt(mean_squared_error(actual, predicted))
-
-    # Initialize a dictionary to store RMSE values
-    def grid_search(train, test):
-        best_rmse = float('inf')
-        best_params = None
-        trend_options = ['add', 'mul', None]
-        seasonal_options = ['add', 'mul', None]
-        seasonal_periods_options = [3, 4, 5, 6]
-
-        for trend, seasonal, seasonal_periods in product(trend_options, seasonal_options, seasonal_periods_options):
-            if seasonal is None and trend is None:
-                continue  # skip invalid combination
-            try:
-                model = ExponentialSmoothing(train, trend=trend, seasonal=seasonal, seasonal_periods=seasonal_periods)
-                fit = model.fit()
-                forecast = fit.forecast(steps=len(test))
-                rmse = calculate_rmse(test, forecast)
-                if rmse < best_rmse:
-                    best_rmse = rmse
-                    best_params = (trend, seasonal, seasonal_periods)
-            except:
-                continue
-
-        return best_rmse, best_params
-
-    df = load_data_from_db()
-    print("Data loaded from the database.")
-    print(df.head())
+from gdp_forecasting.forecast_scripts.batched_holt_winters import fit_sectors, get_engine
+from gdp_forecasting.forecast_scripts.data_access import forecast_run, get_sectors, load_dataset
+from gdp_forecasting.forecast_scripts.hyperparameter_search import load_best_params
+from gdp_forecasting.forecast_scripts.model_cache import get_model_cache
+from gdp_forecasting.forecast_scripts.parallel_fit import map_sectors
+from gdp_forecasting.forecast_scripts.result_writer import forecast_frame, write_results
+from gdp_forecasting.forecast_scripts.sector_models import calculate_rmse, fit_annual_sector, holdout_rmse_annual
+from gdp_forecasting.gdp_forecasting.instrumentation import span
+
+# Load the annual rows of the configured sectors (see data_access.get_sectors)
+def load_data_from_db():
+    df = load_dataset('Annual', sectors=get_sectors('annual'), columns=['sector', 'year', 'gdp'])
+    if df.empty:
+        print("No data found in `tabAnnual Dataset`.")
+    return df
+
+
+# Load the annual dataset as a sector x year GDP matrix for the relevant sectors
+def load_annual_pivot(df=None):
+    df = load_data_from_db() if df is None else df
 
     # Pivot the DataFrame
     pivot_df = df.pivot_table(index='sector', columns='year', values='gdp', aggfunc='sum')
-    print("Pivoted DataFrame:")
-    print(pivot_df.head())
 
     # Fill NaN values with zeros
-    pivot_df = pivot_df.fillna(0)
-
-    relevant_sectors = [
-        'Agriculture, Forestry & Fishing', 'Mining & Quarrying', 'Manufacturing',
-        'Electricity, Gas and Water', 'Construction', 'Wholesale & Retail Trade, Restaurants & hotels',
-        'Transport, Storage & Communication', 'Finance, Insurance and Business services',
-        'Community, Social & Personal Services', 'Government Activities', 'Total Riyadh GDP'
-    ]
-    pivot_df = pivot_df[pivot_df.index.isin(relevant_sectors)]
-
-    # Calculate RMSE for each sector
-    rmse_values = {}
-    for sector in pivot_df.index:
-        ts = pivot_df.loc[sector].values
-        train_size = int(len(ts) * 0.8)
-        train, test = ts[:train_size], ts[train_size:]
-
-        # Initialize and fit the model on the training set
-        model = ExponentialSmoothing(train, trend='add', seasonal='add', seasonal_periods=3)
-        fit = model.fit()
-        forecast = fit.forecast(steps=len(test))
-
-        # Calculate RMSE for the sector
-        rmse = calculate_rmse(test, forecast)
-        rmse_values[sector] = rmse
-
-    # Define best parameters for each sector
-    best_params_dict = {
-        'Agriculture, Forestry & Fishing': ('mul', 'add', 3),
-        'Mining & Quarrying': ('mul', 'add', 3),
-        'Manufacturing': ('add', None, 3),
-        'Electricity, Gas and Water': ('mul', None, 3),
-        'Construction': ('mul', None, 3),
-        'Wholesale & Retail Trade, Restaurants & hotels': ('mul', 'mul', 3),
-        'Transport, Storage & Communication': ('mul', 'mul', 3),
-        'Finance, Insurance and Business services': ('mul', 'mul', 3),
-        'Community, Social & Personal Services': ('mul', 'mul', 3),
-        'Government Activities': ('mul', 'mul', 3),
-        # 'Total Riyadh GDP': ('mul', None, 3),
-    }
-
-    # Generate predictions using the fine-tuned parameters
-    prediction_years = list(range(2024, 2031))
-    fine_tuned_predictions = {}
-    rmse_values = {}
-
-    for sector, params in best_params_dict.items():
-        trend, seasonal, seasonal_periods = params
-
-        # Extract the time series data for the sector
-        ts = pivot_df.loc[sector].values
-
-        # Initialize and fit the model with the best parameters
-        model = ExponentialSmoothing(ts, trend=trend, seasonal=seasonal, seasonal_periods=seasonal_periods)
-        fit = model.fit()
+    return pivot_df.fillna(0)
+
+# Fallback parameters for sectors that have no stored search result yet
+DEFAULT_BEST_PARAMS = {
+    'Agriculture, Forestry & Fishing': ('mul', 'add', 3),
+    'Mining & Quarrying': ('mul', 'add', 3),
+    'Manufacturing': ('add', None, 3),
+    'Electricity, Gas and Water': ('mul', None, 3),
+    'Construction': ('mul', None, 3),
+    'Wholesale & Retail Trade, Restaurants & hotels': ('mul', 'mul', 3),
+    'Transport, Storage & Communication': ('mul', 'mul', 3),
+    'Finance, Insurance and Business services': ('mul', 'mul', 3),
+    'Community, Social & Personal Services': ('mul', 'mul', 3),
+    'Government Activities': ('mul', 'mul', 3),
+    # 'Total Riyadh GDP': ('mul', None, 3),
+}
+
+def main_annual(progress_callback=None, workers=None, use_cache=True, engine=None):
+    with forecast_run():
+        return run_annual(progress_callback, workers, use_cache, engine)
+
+
+def run_annual(progress_callback=None, workers=None, use_cache=True, engine=None):
+    # The dataset is loaded once and used for both the fits and the history
+    df = load_data_from_db()
 
-        # Forecast the GDP for the years 2024 to 2030
-        forecast = fit.forecast(steps=len(prediction_years))
+    # Function to insert predictions and historical data into the database
+    def insert_predictions_to_db(predictions, rmse_values):
+        # Historical rows first (RMSE 0), then forecasts (flagged with
+        # is_forecast); deduplicated on (sector, year) and written with one
+        # bulk upsert
+        history = pd.DataFrame({
+            'sector': df['sector'],
+            'year': df['year'].astype(int),
+            'gdp': df['gdp'].astype(float),
+            'rmse': 0.0,
+            'is_forecast': 0,
+        })
+        forecasts = forecast_frame(predictions, prediction_years, rmse_values, 'year')
+        forecasts['is_forecast'] = 1
+        results = pd.concat([history, forecasts], ignore_index=True)
+        results['name'] = results['sector'] + '-' + results['year'].astype(str)
+
+        write_results(
+            'tabHolt Winters Annual', results,
+            columns=['name', 'sector', 'year', 'gdp', 'rmse', 'is_forecast'], key_columns=['sector', 'year']
+        )
+
+    with span('pivot') as fields:
+        pivot_df = load_annual_pivot(df)
+        fields.update(rows=len(df), sectors=len(pivot_df))
+    engine = get_engine(engine)
+    # Unchanged sector series reuse their fitted model from the cache
+    cache = get_model_cache() if use_cache else None
+
+    # Best parameters per sector, as saved by the hyperparameter search
+    best_params_dict = load_best_params(DEFAULT_BEST_PARAMS)
+    best_params_dict = {sector: params for sector, params in best_params_dict.items() if sector in pivot_df.index}
+    prediction_years = list(range(2024, 2031))
 
-        # Store the predictions
-        fine_tuned_predictions[sector] = forecast
+    # Holdout RMSE of every forecast sector (additive model scored on the
+    # last 20% of its series), stored with the sector's forecast rows
+    with span('holdout', engine=engine):
+        if engine == 'numpy':
+            train_size = int(pivot_df.shape[1] * 0.8)
+            holdout = fit_sectors(
+                {sector: pivot_df.loc[sector].values[:train_size] for sector in best_params_dict},
+                dict.fromkeys(best_params_dict, ('add', 'add', 3)), pivot_df.shape[1] - train_size,
+                workers=workers, cache=cache
+            )
+            rmse_values = {
+                sector: calculate_rmse(pivot_df.loc[sector].values[train_size:], forecast)
+                for sector, (forecast, _) in holdout.items()
+            }
+        else:
+            holdout_tasks = [
+                (sector, (pivot_df.loc[sector].values, 'add', 'add', 3, cache)) for sector in best_params_dict
+            ]
+            rmse_values = dict(map_sectors(holdout_rmse_annual, holdout_tasks, workers=workers))
+
+    # Fit every sector with its best parameters and forecast the GDP for the
+    # years 2024 to 2030: batched by parameter set with the numpy engine,
+    # one model per sector in the process pool otherwise
+    with span('fit', engine=engine, sectors=len(best_params_dict)):
+        if engine == 'numpy':
+            batched = fit_sectors(
+                {sector: pivot_df.loc[sector].values for sector in best_params_dict},
+                best_params_dict, len(prediction_years), progress_callback, workers, cache
+            )
+            fine_tuned_predictions = {sector: forecast for sector, (forecast, _) in batched.items()}
+        else:
+            forecast_tasks = [
+                (sector, (pivot_df.loc[sector].values, trend, seasonal, seasonal_periods, len(prediction_years), cache))
+                for sector, (trend, seasonal, seasonal_periods) in best_params_dict.items()
+            ]
+            fine_tuned_predictions = dict(
+                map_sectors(fit_annual_sector, forecast_tasks, workers=workers, progress_callback=progress_callback)
+            )
 
     # Insert the predictions into the database
     insert_predictions_to_db(fine_tuned_predictions, rmse_values)
@@ -1,9 +1,13 @@
 import frappe
 import pandas as pd
 import numpy as np
-from statsmodels.tsa.holtwinters import ExponentialSmoothing
-from sklearn.metrics import mean_squared_error
-from math import sqrt
+from gdp_forecasting.forecast_scripts.batched_holt_winters import fit_sectors, get_engine
+from gdp_forecasting.forecast_scripts.data_access import forecast_run, get_sectors, load_dataset
+from gdp_forecasting.forecast_scripts.model_cache import get_model_cache
+from gdp_forecasting.forecast_scripts.parallel_fit import map_sectors
+from gdp_forecasting.forecast_scripts.result_writer import quarter_columns, write_results
+from gdp_forecasting.forecast_scripts.sector_models import calculate_rmse, fit_quarterly_sector
+from gdp_forecasting.gdp_forecasting.instrumentation import span
 import warnings
 warnings.filterwarnings("ignore", category=DeprecationWarning)
 
@@ -22,100 +26,101 @@ def date_to_quarter_string(date):
 
 # Load and prepare data from Frappe table
 def load_and_prepare_data_from_frappe():
-    # Create `holt_winters_quarterly` table if it doesn’t exist
-    frappe.db.sql("""
-        CREATE TABLE IF NOT EXISTS `holt_winters_quarterly` (
-            `id` INT AUTO_INCREMENT PRIMARY KEY,
-            `sector` VARCHAR(255),
-            `year_quarter` VARCHAR(50),
-            `gdp` FLOAT,
-            `rmse` FLOAT
-        );
-    """)
-    
-    # Load data from `quarterly_dataset` table
-    query_result = frappe.db.sql("SELECT * FROM `tabQuarterly Dataset`", as_dict=True)
-    if query_result:
-        try:
-            # Replace None with empty strings or another placeholder
-            cleaned_data = [
-                {k: (v if v is not None else "") for k, v in record.items()}
-                for record in query_result
-            ]
-            df = pd.DataFrame(cleaned_data)
-        except Exception as e:
-            print("Error creating DataFrame:", e)
-    else:
+    df = load_dataset('Quarterly', sectors=get_sectors('quarterly'))
+    if df.empty:
         print("No data found in `tabQuarterly Dataset`.")
-    # Create a column for time periods
-    df['Year_Quarter'] = df['year'].astype(str) + ' Q' + df['quarter'].astype(str)
-    
-    # Parse dates
-    df['Date'] = df['Year_Quarter'].apply(custom_quarterly_parser)
-    df.index = pd.to_datetime(df['Date'])
-    df.sort_index(inplace=True)
+    with span('pivot', rows=len(df)):
+        # Create a column for time periods
+        df['Year_Quarter'] = df['year'].astype(str) + ' Q' + df['quarter'].astype(str)
 
-    # Clear existing data in `holt_winters_quarterly`
-    frappe.db.sql("TRUNCATE TABLE `holt_winters_quarterly`")
+        # Parse dates
+        df['Date'] = df['Year_Quarter'].apply(custom_quarterly_parser)
+        df.index = pd.to_datetime(df['Date'])
+        df.sort_index(inplace=True)
 
-    # Insert initial data
-    for index, row in df.iterrows():
-        frappe.db.sql("""
-            INSERT INTO `holt_winters_quarterly` (sector, year_quarter, gdp, rmse)
-            VALUES (%s, %s, %s, %s)
-        """, (row['sector'], row['Date'], row['gdp'], 0))
-    
     return df
 
-# Define a function to calculate RMSE
-def calculate_rmse(actual, predicted):
-    return sqrt(mean_squared_error(actual, predicted))
-
-# Apply the Exponential Smoothing model to all sectors
-def apply_exponential_smoothing_to_all_sectors(data, start_period, end_period):
-    forecast_results = pd.DataFrame()
+# Apply the Exponential Smoothing model to all sectors. With the statsmodels
+# engine sectors are fitted in a process pool (see parallel_fit.map_sectors);
+# the numpy engine fits them all at once (see batched_holt_winters). History
+# plus forecasts are written in one batch once every fit has finished.
+def apply_exponential_smoothing_to_all_sectors(data, start_period, end_period, progress_callback=None, workers=None, use_cache=True, engine=None):
+    forecast_results = []
     sectors = data['sector'].unique()
     quarters = ["Q1", "Q2", "Q3", "Q4"]
 
-    for sector in sectors:
-        sector_data = data[data['sector'] == sector]['gdp']
-        model = ExponentialSmoothing(sector_data, trend='add', seasonal='add', seasonal_periods=4)
-        model_fit = model.fit()
-
-        # Forecasting the required number of steps (quarters)
-        forecast_steps = (end_period - start_period + 1) * 4  # Quarterly data
-        forecast = model_fit.forecast(steps=forecast_steps)
-        forecast_df = pd.DataFrame(forecast, columns=['mean'])
-        forecast_df['Sector'] = sector
-
-        # Generate sequential quarters based on start and end period
-        forecast_df['Quarter'] = [
-            f"{year}-{quarter}"
-            for year in range(start_period, end_period + 1)
-            for quarter in quarters
-        ][:forecast_steps]  # Truncate if overestimated
-
-        forecast_df['mean'] = forecast_df['mean'].clip(lower=0)  # Ensure non-negative values
-
-        # Calculate RMSE for each sector
-        rmse = calculate_rmse(sector_data, model_fit.fittedvalues)
-        forecast_df['RMSE'] = rmse
-        forecast_results = pd.concat([forecast_results, forecast_df[['Sector', 'Quarter', 'mean', 'RMSE']]])
-
-        # Insert forecast data into database
-        for date, gdp in zip(forecast_df['Quarter'], forecast_df['mean']):
-            frappe.db.sql("""
-                INSERT INTO `holt_winters_quarterly` (sector, year_quarter, gdp, rmse)
-                VALUES (%s, %s, %s, %s)
-            """, (sector, date, float(gdp), float(rmse)))
-
+    # Forecasting the required number of steps (quarters)
+    forecast_steps = (end_period - start_period + 1) * 4  # Quarterly data
+    # Generate sequential quarters based on start and end period
+    forecast_quarters = [
+        f"{year}-{quarter}"
+        for year in range(start_period, end_period + 1)
+        for quarter in quarters
+    ][:forecast_steps]  # Truncate if overestimated
+
+    engine = get_engine(engine)
+    with span('fit', engine=engine, sectors=len(sectors)):
+        if engine == 'numpy':
+            series = {sector: data[data['sector'] == sector]['gdp'] for sector in sectors}
+            batched = fit_sectors(series, dict.fromkeys(sectors, ('add', 'add', 4)), forecast_steps, progress_callback)
+            fitted = [(sector, batched[sector]) for sector in sectors]
+        else:
+            # Unchanged sector series reuse their fitted model from the cache
+            cache = get_model_cache() if use_cache else None
+            tasks = [
+                (sector, (data[data['sector'] == sector]['gdp'], forecast_steps, cache))
+                for sector in sectors
+            ]
+            fitted = map_sectors(fit_quarterly_sector, tasks, workers=workers, progress_callback=progress_callback)
+
+    with span('forecast', steps=forecast_steps) as fields:
+        for sector, (forecast, rmse) in fitted:
+            forecast_df = pd.DataFrame({'mean': forecast})
+            forecast_df['Sector'] = sector
+            forecast_df['Quarter'] = forecast_quarters
+            forecast_df['mean'] = forecast_df['mean'].clip(lower=0)  # Ensure non-negative values
+            forecast_df['RMSE'] = rmse
+            forecast_results.append(forecast_df[['Sector', 'Quarter', 'mean', 'RMSE']])
+        forecast_results = pd.concat(forecast_results) if forecast_results else pd.DataFrame()
+        fields['rows'] = len(forecast_results)
+
+    write_quarterly_results(data, forecast_results)
     return forecast_results
 
+# Replace `holt_winters_quarterly` with the historical data (RMSE 0) followed
+# by the forecasts (flagged with is_forecast), deduplicated on (sector, year,
+# quarter), in one bulk write
+def write_quarterly_results(data, forecast_results):
+    history = pd.DataFrame({
+        'sector': data['sector'].to_numpy(),
+        'year': data['year'].astype(int).to_numpy(),
+        'quarter': data['quarter'].astype(int).to_numpy(),
+        'gdp': data['gdp'].astype(float).to_numpy(),
+        'rmse': 0.0,
+        'is_forecast': 0,
+    })
+    frames = [history]
+    if not forecast_results.empty:
+        years, quarters = quarter_columns(forecast_results['Quarter'])
+        frames.append(pd.DataFrame({
+            'sector': forecast_results['Sector'].to_numpy(),
+            'year': years,
+            'quarter': quarters,
+            'gdp': forecast_results['mean'].astype(float).to_numpy(),
+            'rmse': forecast_results['RMSE'].astype(float).to_numpy(),
+            'is_forecast': 1,
+        }))
+    return write_results(
+        'holt_winters_quarterly', pd.concat(frames, ignore_index=True),
+        columns=['sector', 'year', 'quarter', 'gdp', 'rmse', 'is_forecast'], key_columns=['sector', 'year', 'quarter']
+    )
+
 # Save forecasts to a single CSV
 def save_forecasts(forecasts, output_file):
     forecasts.to_csv(output_file, index=False)
 
 # Main function to run the entire forecasting process
-def main():
-    data = load_and_prepare_data_from_frappe()
-    forecasts = apply_exponential_smoothing_to_all_sectors(data, 2024, 2030)
+def main(progress_callback=None, workers=None, use_cache=True, engine=None):
+    with forecast_run():
+        data = load_and_prepare_data_from_frappe()
+    forecasts = apply_exponential_smoothing_to_all_sectors(data, 2024, 2030, progress_callback, workers, use_cache, engine)
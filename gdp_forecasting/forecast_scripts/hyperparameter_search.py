@@ -0,0 +1,144 @@
+from datetime import datetime
+from itertools import product
+import numpy as np
+import frappe
+from gdp_forecasting.gdp_forecasting.bulk_ingest import bulk_insert
+from gdp_forecasting.forecast_scripts.parallel_fit import map_sectors
+from gdp_forecasting.forecast_scripts.sector_models import evaluate_candidate
+
+BEST_PARAMS_TABLE = 'tabHolt Winters Best Params'
+
+TREND_OPTIONS = ['add', 'mul', None]
+SEASONAL_OPTIONS = ['add', 'mul', None]
+SEASONAL_PERIOD_OPTIONS = [3, 4, 5, 6]
+
+# After each fold, candidates whose mean RMSE is more than this multiple of
+# the sector's best are dropped
+PRUNE_FACTOR = 1.5
+DEFAULT_FOLDS = 2
+
+
+# All (trend, seasonal, seasonal_periods) combinations worth fitting for a
+# series. Combinations statsmodels cannot fit, or that are identical to one
+# already listed, are skipped before any fitting happens.
+def candidate_grid(series, min_train_size):
+    has_non_positive = bool(np.any(np.asarray(series) <= 0))
+    seen = set()
+    for trend, seasonal, seasonal_periods in product(TREND_OPTIONS, SEASONAL_OPTIONS, SEASONAL_PERIOD_OPTIONS):
+        if trend is None and seasonal is None:
+            continue
+        # Multiplicative components need a strictly positive series
+        if has_non_positive and 'mul' in (trend, seasonal):
+            continue
+        if seasonal is None:
+            # The period is unused without a seasonal component
+            seasonal_periods = SEASONAL_PERIOD_OPTIONS[0]
+        elif seasonal_periods * 2 > min_train_size:
+            # Need two full seasons in the shortest training window
+            continue
+        candidate = (trend, seasonal, seasonal_periods)
+        if candidate not in seen:
+            seen.add(candidate)
+            yield candidate
+
+
+# Search the best Holt-Winters parameters for every sector (row) of a
+# sector x period matrix. Fold 0 is the usual 80/20 holdout; each further
+# fold moves the forecast origin one period back. Candidates are evaluated
+# fold by fold in the process pool and pruned between folds.
+def search_best_params(pivot_df, n_folds=DEFAULT_FOLDS, workers=None, prune_factor=PRUNE_FACTOR):
+    n_periods = pivot_df.shape[1]
+    train_size = int(n_periods * 0.8)
+    test_size = n_periods - train_size
+    n_folds = max(1, min(int(n_folds), train_size - 1))
+    min_train_size = train_size - (n_folds - 1)
+
+    series = {sector: pivot_df.loc[sector].values.astype(np.float64) for sector in pivot_df.index}
+    alive = {sector: list(candidate_grid(ts, min_train_size)) for sector, ts in series.items()}
+    evaluated = {sector: len(candidates) for sector, candidates in alive.items()}
+    scores = {}
+    failures = {}
+
+    for fold in range(n_folds):
+        split = train_size - fold
+        tasks = [
+            ((sector, candidate), (series[sector][:split], series[sector][split:split + test_size]) + candidate)
+            for sector, candidates in alive.items()
+            for candidate in candidates
+        ]
+        for (sector, candidate), (rmse, error) in map_sectors(evaluate_candidate, tasks, workers=workers):
+            if error:
+                failures.setdefault(sector, []).append((candidate, error))
+                alive[sector].remove(candidate)
+                scores.pop((sector, candidate), None)
+            else:
+                scores.setdefault((sector, candidate), []).append(rmse)
+
+        # Early stopping: keep only candidates within reach of the sector's best
+        for sector, candidates in alive.items():
+            if not candidates:
+                continue
+            means = {candidate: np.mean(scores[(sector, candidate)]) for candidate in candidates}
+            best = min(means.values())
+            alive[sector] = [candidate for candidate in candidates if means[candidate] <= best * prune_factor]
+
+    winners = {}
+    for sector, candidates in alive.items():
+        if not candidates:
+            continue
+        best = min(candidates, key=lambda candidate: np.mean(scores[(sector, candidate)]))
+        winners[sector] = {
+            'params': best,
+            'rmse': float(np.mean(scores[(sector, best)])),
+            'candidates_evaluated': evaluated[sector],
+        }
+
+    for sector, errors in failures.items():
+        frappe.logger("gdp_forecasting").info(
+            f"Hyperparameter search for {sector}: {len(errors)} candidates failed to fit"
+        )
+    return winners
+
+
+def save_best_params(winners):
+    searched_at = datetime.now()
+    rows = (
+        (sector, result['params'][0], result['params'][1], result['params'][2],
+         result['rmse'], result['candidates_evaluated'], searched_at)
+        for sector, result in winners.items()
+    )
+    columns = ['sector', 'trend', 'seasonal', 'seasonal_periods', 'rmse', 'candidates_evaluated', 'searched_at']
+    return bulk_insert(BEST_PARAMS_TABLE, rows, columns=columns, update_columns=columns[1:])
+
+
+# Stored search winners, layered over `defaults` for sectors never searched
+def load_best_params(defaults=None):
+    best_params = dict(defaults or {})
+    for sector, trend, seasonal, seasonal_periods in frappe.db.sql(
+        f"SELECT sector, trend, seasonal, seasonal_periods FROM `{BEST_PARAMS_TABLE}`"
+    ):
+        best_params[sector] = (trend, seasonal, int(seasonal_periods))
+    return best_params
+
+
+# Background job: search the annual dataset and store the winners
+def run_annual_search(n_folds=DEFAULT_FOLDS, workers=None):
+    from gdp_forecasting.forecast_scripts.data_access import forecast_run
+    from gdp_forecasting.forecast_scripts.holt_winters_annual import load_annual_pivot
+
+    with forecast_run():
+        winners = search_best_params(load_annual_pivot(), n_folds=n_folds, workers=workers)
+    save_best_params(winners)
+    return {sector: result['params'] for sector, result in winners.items()}
+
+
+@frappe.whitelist()
+def search_annual_hyperparameters(n_folds=DEFAULT_FOLDS):
+    frappe.enqueue(
+        "gdp_forecasting.forecast_scripts.hyperparameter_search.run_annual_search",
+        queue="long",
+        timeout=3600,
+        job_name="GDP forecast: annual hyperparameter search",
+        n_folds=int(n_folds),
+    )
+    return 'queued'
@@ -0,0 +1,139 @@
+import hashlib
+import json
+import os
+import pickle
+import numpy as np
+import frappe
+
+# Fitted models are stored on local disk, one pickle per key, and evicted
+# least-recently-used first once the directory grows past the size cap
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+CACHE_ENV_VAR = 'GDP_FORECAST_CACHE_DIR'
+
+
+# Content address of a fit: the series values plus everything that
+# determines the fitted model
+def cache_key(values, frequency, model_type, params=None):
+    digest = hashlib.sha256()
+    digest.update(np.ascontiguousarray(np.asarray(values, dtype=np.float64)).tobytes())
+    digest.update(json.dumps([frequency, model_type, params], sort_keys=True, default=str).encode())
+    return digest.hexdigest()
+
+
+class ModelCache:
+    # Only the directory and the cap are stored, so the cache can be handed
+    # to process-pool workers
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def path(self, key):
+        return os.path.join(self.directory, f"{key}.pkl")
+
+    def get(self, key):
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+            # Touch the entry so eviction sees it as recently used
+            os.utime(path)
+            return value
+        except FileNotFoundError:
+            return None
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+            # Unreadable or written by an incompatible library version
+            self.invalidate(key)
+            return None
+
+    def put(self, key, value):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(key)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, 'wb') as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, path)
+        self.evict()
+
+    def entries(self):
+        entries = []
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return entries
+        for name in names:
+            if not name.endswith('.pkl'):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                continue  # Evicted concurrently by another worker
+            entries.append((stat.st_mtime, stat.st_size, name))
+        return entries
+
+    # Drop least recently used entries until the cache fits its cap
+    def evict(self):
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    # Remove one entry, or everything when no key is given
+    def invalidate(self, key=None):
+        names = [f"{key}.pkl"] if key else [name for _, _, name in self.entries()]
+        for name in names:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+        return len(names)
+
+    def stats(self):
+        entries = self.entries()
+        return {
+            'directory': self.directory,
+            'entries': len(entries),
+            'bytes': sum(size for _, size, _ in entries),
+            'max_bytes': self.max_bytes,
+        }
+
+
+# Return `fit()` from the cache, fitting and storing it on a miss
+def cached_fit(cache, key, fit):
+    if cache is None:
+        return fit()
+    result = cache.get(key)
+    if result is None:
+        result = fit()
+        cache.put(key, result)
+    return result
+
+
+# Cache under the site's private files when running inside Frappe, else
+# under $GDP_FORECAST_CACHE_DIR (used by the standalone ARIMA scripts)
+def get_model_cache():
+    if getattr(frappe.local, 'site', None):
+        directory = frappe.get_site_path('private', 'files', 'gdp_forecasting', 'model_cache')
+        max_mb = frappe.conf.get('gdp_forecast_cache_max_mb')
+    else:
+        directory = os.getenv(CACHE_ENV_VAR) or os.path.join(os.path.dirname(os.path.abspath(__file__)), '.model_cache')
+        max_mb = os.getenv('GDP_FORECAST_CACHE_MAX_MB')
+    max_bytes = int(float(max_mb) * 1024 * 1024) if max_mb else DEFAULT_MAX_BYTES
+    return ModelCache(directory, max_bytes)
+
+
+@frappe.whitelist()
+def clear_model_cache():
+    frappe.only_for("System Manager")
+    return {'removed': get_model_cache().invalidate()}
+
+
+@frappe.whitelist()
+def get_model_cache_stats():
+    frappe.only_for("System Manager")
+    return get_model_cache().stats()
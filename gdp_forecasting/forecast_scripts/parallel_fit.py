@@ -0,0 +1,94 @@
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import frappe
+from gdp_forecasting.gdp_forecasting import instrumentation
+
+# Workers are spawned rather than forked so they never inherit the parent's
+# database connection or RQ/gunicorn state
+START_METHOD = "spawn"
+
+# Long-lived pool kept by the forecasting daemon (see forecast_daemon), so
+# its workers stay warm across runs. None means one pool per map_sectors call.
+_shared_pool = None
+_shared_pool_size = 0
+
+
+# Number of worker processes: explicit argument, then the
+# `gdp_forecast_workers` site config key, then the CPU count
+def get_worker_count(workers=None):
+    if workers is None:
+        workers = frappe.conf.get("gdp_forecast_workers") if frappe.conf else None
+    if workers is None:
+        workers = os.cpu_count() or 1
+    return max(1, int(workers))
+
+
+# Imports the model libraries and touches BLAS in a pool worker
+def warm_worker(_=None):
+    import numpy as np
+    import gdp_forecasting.forecast_scripts.sector_models  # noqa: F401
+    np.dot(np.ones((64, 64)), np.ones((64, 64)))
+    return os.getpid()
+
+
+def start_shared_pool(workers=None):
+    global _shared_pool, _shared_pool_size
+    if _shared_pool is None:
+        _shared_pool_size = get_worker_count(workers)
+        context = multiprocessing.get_context(START_METHOD)
+        _shared_pool = ProcessPoolExecutor(max_workers=_shared_pool_size, mp_context=context)
+        list(_shared_pool.map(warm_worker, range(_shared_pool_size)))
+    return _shared_pool
+
+
+def shutdown_shared_pool():
+    global _shared_pool, _shared_pool_size
+    if _shared_pool is not None:
+        _shared_pool.shutdown()
+        _shared_pool, _shared_pool_size = None, 0
+
+
+# Run `fit_fn(*args)` for every (sector, args) task, in a process pool when
+# more than one worker is available. Results come back in task order, so the
+# output is the same as a serial loop over the tasks. Inside a run log each
+# task is recorded as a "fit <sector>" span.
+def map_sectors(fit_fn, tasks, workers=None, progress_callback=None):
+    tasks = list(tasks)
+    if _shared_pool is not None:
+        workers = _shared_pool_size
+    workers = min(get_worker_count(workers), len(tasks)) if tasks else 1
+    results = {}
+
+    if workers <= 1:
+        for completed, (sector, args) in enumerate(tasks, start=1):
+            with instrumentation.span(f"fit {sector}", sector=sector):
+                results[sector] = fit_fn(*args)
+            if progress_callback:
+                progress_callback(sector, completed, len(tasks))
+    elif _shared_pool is not None:
+        collect(_shared_pool, fit_fn, tasks, results, progress_callback)
+    else:
+        context = multiprocessing.get_context(START_METHOD)
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            collect(pool, fit_fn, tasks, results, progress_callback)
+
+    return [(sector, results[sector]) for sector, _ in tasks]
+
+
+# Workers return their spans with the result when a run is being logged
+def collect(pool, fit_fn, tasks, results, progress_callback):
+    logged = instrumentation.active()
+    futures = {
+        (pool.submit(instrumentation.run_task, fit_fn, args) if logged else pool.submit(fit_fn, *args)): sector
+        for sector, args in tasks
+    }
+    for completed, future in enumerate(as_completed(futures), start=1):
+        sector = futures[future]
+        if logged:
+            results[sector], spans = future.result()
+            instrumentation.add_task_spans(f"fit {sector}", spans, sector=sector)
+        else:
+            results[sector] = future.result()
+        if progress_callback:
+            progress_callback(sector, completed, len(tasks))
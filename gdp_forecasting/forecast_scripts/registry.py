@@ -0,0 +1,118 @@
+import importlib
+import json
+import subprocess
+import sys
+import frappe
+from gdp_forecasting.gdp_forecasting.instrumentation import span
+
+# Forecasters by forecast type, as "module.function" paths. A forecaster's
+# module (and with it pandas / statsmodels / pmdarima) is imported only the
+# first time that forecast type is run. Every forecaster takes
+# `progress_callback` as a keyword argument.
+FORECASTERS = {
+    'annual_arima': 'gdp_forecasting.forecast_scripts.arima_annual.main',
+    'quarterly_arima': 'gdp_forecasting.forecast_scripts.arima_quarterly.main',
+    'Annual Forecast (Holt-Winters)': 'gdp_forecasting.forecast_scripts.holt_winters_annual.main_annual',
+    'Quarterly Forecast (Holt-Winters )': 'gdp_forecasting.forecast_scripts.holt_winters_quarterly.main',
+    'Annual Forecast (Hierarchical)': 'gdp_forecasting.forecast_scripts.hierarchical.main_annual',
+    'Quarterly Forecast (Hierarchical)': 'gdp_forecasting.forecast_scripts.hierarchical.main_quarterly',
+}
+
+# Modules on the request path (the forecast and upload endpoints). They must
+# import without loading any of HEAVY_LIBRARIES.
+ENDPOINT_MODULES = [
+    'gdp_forecasting.gdp_forecasting.gdp_forecasting',
+    'gdp_forecasting.gdp_forecasting.forecast_jobs',
+    'gdp_forecasting.forecast_scripts.registry',
+]
+HEAVY_LIBRARIES = ['pandas', 'numpy', 'statsmodels', 'sklearn', 'pmdarima', 'scipy']
+
+_loaded = {}
+
+
+def register_forecaster(forecast_type, path):
+    FORECASTERS[forecast_type] = path
+    _loaded.pop(forecast_type, None)
+
+
+def forecast_types():
+    return tuple(FORECASTERS)
+
+
+def get_forecaster(forecast_type):
+    if forecast_type not in FORECASTERS:
+        raise KeyError(forecast_type)
+    if forecast_type not in _loaded:
+        module_name, function_name = FORECASTERS[forecast_type].rsplit('.', 1)
+        with span('import', module=module_name):
+            _loaded[forecast_type] = getattr(importlib.import_module(module_name), function_name)
+    return _loaded[forecast_type]
+
+
+def run_forecaster(forecast_type, progress_callback=None, **kwargs):
+    return get_forecaster(forecast_type)(progress_callback=progress_callback, **kwargs)
+
+
+# Runs in a fresh interpreter: import one module and report how long it took,
+# how much resident memory it added and which heavy libraries it pulled in
+_PROBE = """
+import json, resource, sys, time
+heavy = {heavy!r}
+rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+started = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - started
+rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({{
+    'seconds': seconds,
+    'rss_mb': (rss_after - rss_before) / 1024.0,
+    'heavy_loaded': [name for name in heavy if name in sys.modules],
+}}))
+"""
+
+
+# Cold-start import cost of one module, measured in a subprocess so nothing
+# already imported here skews the numbers. A module that fails to import is
+# reported with the last line of its traceback under 'error'.
+def measure_import(module):
+    process = subprocess.run(
+        [sys.executable, '-c', _PROBE.format(module=module, heavy=HEAVY_LIBRARIES)],
+        capture_output=True, text=True,
+    )
+    if process.returncode:
+        lines = process.stderr.strip().splitlines()
+        return {'module': module, 'error': lines[-1] if lines else f"exit status {process.returncode}"}
+    result = json.loads(process.stdout.strip().splitlines()[-1])
+    result['module'] = module
+    return result
+
+
+# Cold-start cost of every endpoint module and every registered forecaster
+def measure_cold_start():
+    results = [dict(measure_import(module), kind='endpoint') for module in ENDPOINT_MODULES]
+    for forecast_type, path in FORECASTERS.items():
+        result = measure_import(path.rsplit('.', 1)[0])
+        results.append(dict(result, kind='forecaster', forecast_type=forecast_type))
+    return results
+
+
+# Regression check for import cost, e.g. from CI:
+#   bench --site <site> execute gdp_forecasting.forecast_scripts.registry.check_import_budget
+# Fails when an endpoint module pulls in a heavy library, or when any module
+# exceeds the `gdp_forecast_import_budget_seconds` site config key (if set).
+def check_import_budget(max_seconds=None):
+    if max_seconds is None:
+        max_seconds = frappe.conf.get('gdp_forecast_import_budget_seconds') if frappe.conf else None
+    results = measure_cold_start()
+    failures = []
+    for result in results:
+        if result.get('error'):
+            failures.append(f"{result['module']} failed to import: {result['error']}")
+            continue
+        if result['kind'] == 'endpoint' and result['heavy_loaded']:
+            failures.append(f"{result['module']} imports {', '.join(result['heavy_loaded'])}")
+        if max_seconds and result['seconds'] > float(max_seconds):
+            failures.append(f"{result['module']} took {result['seconds']:.2f}s to import (budget {max_seconds}s)")
+    if failures:
+        raise AssertionError("Import cost regression:\n" + "\n".join(failures))
+    return results
@@ -0,0 +1,43 @@
+import pandas as pd
+import frappe
+from gdp_forecasting.gdp_forecasting.bulk_ingest import bulk_insert
+from gdp_forecasting.gdp_forecasting.dataset_parser import iter_rows
+from gdp_forecasting.gdp_forecasting.instrumentation import span
+
+
+# Deduplicate a result frame on its key and return the rows to write, as
+# native Python tuples in `columns` order. The first row per key wins, so
+# historical rows placed before forecasts take precedence.
+def prepare_results(frame, columns, key_columns):
+    frame = frame.drop_duplicates(subset=key_columns, keep='first')
+    return list(iter_rows(frame[columns]))
+
+
+# Write a complete result set (history plus forecasts) in one set-based
+# pass: optional TRUNCATE, then a bulk upsert on the table's unique key
+def write_results(table, frame, columns, key_columns, truncate=True):
+    with span(f"write {table}") as fields:
+        if truncate:
+            frappe.db.sql(f"TRUNCATE TABLE `{table}`")
+        rows = prepare_results(frame, columns, key_columns)
+        update_columns = [column for column in columns if column not in key_columns]
+        stats = bulk_insert(table, rows, columns=columns, update_columns=update_columns)
+        fields['rows'] = stats['rows']
+    return stats
+
+
+# Long-form frame of forecast rows: one row per (sector, period)
+def forecast_frame(predictions, periods, rmse_values, period_column):
+    records = [
+        (sector, period, float(value), float(rmse_values.get(sector, 0)))
+        for sector, forecast in predictions.items()
+        for period, value in zip(periods, forecast)
+    ]
+    return pd.DataFrame(records, columns=['sector', period_column, 'gdp', 'rmse'])
+
+
+# Split 'YYYY-Qn' labels into numeric year and quarter arrays, the columns
+# quarterly result tables are keyed on
+def quarter_columns(labels):
+    parts = pd.Series(labels).astype(str).str.split('-Q', expand=True).astype(int)
+    return parts[0].to_numpy(), parts[1].to_numpy()
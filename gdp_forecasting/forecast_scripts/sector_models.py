@@ -0,0 +1,77 @@
+# Per-sector model fits. These run inside process-pool workers, so they only
+# take plain data (arrays / Series and hyperparameters), never touch the DB,
+# and return plain results that are cheap to pickle back to the parent.
+import numpy as np
+from statsmodels.tsa.holtwinters import ExponentialSmoothing
+from sklearn.metrics import mean_squared_error
+from math import sqrt
+from gdp_forecasting.forecast_scripts.model_cache import cache_key, cached_fit
+from gdp_forecasting.gdp_forecasting.instrumentation import note, optimizer_iterations, span
+
+
+def calculate_rmse(actual, predicted):
+    return sqrt(mean_squared_error(actual, predicted))
+
+
+# Fit (or reuse from `cache`) an ExponentialSmoothing model
+def fit_exponential_smoothing(ts, frequency, trend, seasonal, seasonal_periods, cache=None):
+    key = cache_key(ts, frequency, 'holt_winters',
+                    {'trend': trend, 'seasonal': seasonal, 'seasonal_periods': seasonal_periods})
+
+    def fit():
+        result = ExponentialSmoothing(ts, trend=trend, seasonal=seasonal, seasonal_periods=seasonal_periods).fit()
+        note(iterations=optimizer_iterations(result), fits=1)
+        return result
+
+    with span('fit', rows=len(ts)):
+        return cached_fit(cache, key, fit)
+
+
+# Quarterly Holt-Winters: additive trend and season, in-sample RMSE
+def fit_quarterly_sector(sector_data, forecast_steps, cache=None):
+    model_fit = fit_exponential_smoothing(sector_data, 'quarterly', 'add', 'add', 4, cache)
+    with span('forecast', steps=forecast_steps):
+        forecast = np.asarray(model_fit.forecast(steps=forecast_steps), dtype=np.float64)
+        rmse = calculate_rmse(sector_data, model_fit.fittedvalues)
+    return forecast, rmse
+
+
+# Holt-Winters of any series with the given parameters: forecast and
+# in-sample RMSE
+def fit_forecast_series(ts, frequency, trend, seasonal, seasonal_periods, forecast_steps, cache=None):
+    fit = fit_exponential_smoothing(ts, frequency, trend, seasonal, seasonal_periods, cache)
+    with span('forecast', steps=forecast_steps):
+        forecast = np.asarray(fit.forecast(steps=forecast_steps), dtype=np.float64)
+        rmse = calculate_rmse(ts, fit.fittedvalues)
+    return forecast, rmse
+
+
+# Annual Holt-Winters with sector-specific parameters
+def fit_annual_sector(ts, trend, seasonal, seasonal_periods, forecast_steps, cache=None):
+    fit = fit_exponential_smoothing(ts, 'annual', trend, seasonal, seasonal_periods, cache)
+    with span('forecast', steps=forecast_steps):
+        return np.asarray(fit.forecast(steps=forecast_steps), dtype=np.float64)
+
+
+# Hold out the last 20% of the series and score an additive model on it
+def holdout_rmse_annual(ts, trend='add', seasonal='add', seasonal_periods=3, cache=None):
+    train_size = int(len(ts) * 0.8)
+    train, test = ts[:train_size], ts[train_size:]
+    fit = fit_exponential_smoothing(train, 'annual', trend, seasonal, seasonal_periods, cache)
+    forecast = fit.forecast(steps=len(test))
+    return calculate_rmse(test, forecast)
+
+
+# Score one hyperparameter candidate on a train/test split. Failed fits are
+# reported back (not raised) so one bad combination cannot stop a search.
+def evaluate_candidate(train, test, trend, seasonal, seasonal_periods):
+    try:
+        model = ExponentialSmoothing(train, trend=trend, seasonal=seasonal, seasonal_periods=seasonal_periods)
+        fit = model.fit()
+        forecast = fit.forecast(steps=len(test))
+        rmse = calculate_rmse(test, forecast)
+    except (ValueError, np.linalg.LinAlgError, ZeroDivisionError, OverflowError) as e:
+        return float('inf'), str(e)
+    if not np.isfinite(rmse):
+        return float('inf'), "non-finite forecast"
+    return rmse, None
@@ -0,0 +1,71 @@
+import csv
+import hashlib
+import io
+from contextlib import contextmanager
+from datetime import datetime
+import frappe
+
+# Manifest of the base dataset files last loaded into each base table: the
+# file's SHA-256, where it came from, the table the rows went to and how many
+# rows that table held afterwards. upload_base_datasets skips a table whose
+# new file has the same hash, as long as the target table still holds that
+# many rows (a table emptied or edited by hand is reloaded).
+MANIFEST_TABLE = 'tabGDP Base Dataset Manifest'
+BLOCK_SIZE = 1024 * 1024
+
+
+# SHA-256 of a base dataset source, and the source in the form open_rows
+# reads: a file path is hashed in blocks and read again while loading, an
+# uploaded file object is read once and kept as bytes
+def source_digest(source):
+    if isinstance(source, str):
+        digest = hashlib.sha256()
+        with open(source, 'rb') as f:
+            for block in iter(lambda: f.read(BLOCK_SIZE), b''):
+                digest.update(block)
+        return digest.hexdigest(), source
+    content = source.read()
+    content = content.encode('utf-8') if isinstance(content, str) else content
+    return hashlib.sha256(content).hexdigest(), content
+
+
+# CSV reader over a source returned by source_digest, header row included
+@contextmanager
+def open_rows(source):
+    if isinstance(source, str):
+        f = open(source, newline='', encoding='utf-8')
+    else:
+        f = io.TextIOWrapper(io.BytesIO(source), encoding='utf-8', newline='')
+    with f:
+        yield csv.reader(f)
+
+
+def source_name(source):
+    return source if isinstance(source, str) else getattr(source, 'filename', None) or getattr(source, 'name', None)
+
+
+def load_manifest():
+    rows = frappe.db.sql(
+        f"SELECT `base_table`, `sha256`, `row_count`, `target_table` FROM `{MANIFEST_TABLE}`", as_dict=True
+    )
+    return {row['base_table']: row for row in rows}
+
+
+def table_row_count(table):
+    return frappe.db.sql(f"SELECT COUNT(*) FROM `{table}`")[0][0]
+
+
+def is_unchanged(entry, digest):
+    return bool(entry) and entry['sha256'] == digest and table_row_count(entry['target_table']) == entry['row_count']
+
+
+def record_load(base_table, digest, target_table, source):
+    row_count = table_row_count(target_table)
+    frappe.db.sql(f"""
+        INSERT INTO `{MANIFEST_TABLE}` (`base_table`, `sha256`, `row_count`, `target_table`, `source`, `loaded_at`)
+        VALUES (%s, %s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE `sha256` = VALUES(`sha256`), `row_count` = VALUES(`row_count`),
+            `target_table` = VALUES(`target_table`), `source` = VALUES(`source`), `loaded_at` = VALUES(`loaded_at`)
+    """, (base_table, digest, row_count, target_table, (source_name(source) or '')[:255], datetime.now()))
+    frappe.db.commit()
+    return row_count
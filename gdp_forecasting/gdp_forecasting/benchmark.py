@@ -0,0 +1,528 @@
+import csv
+import inspect
+import json
+import os
+import platform
+import re
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from contextlib import ExitStack, contextmanager
+from datetime import datetime
+from importlib import metadata
+from unittest.mock import patch
+import numpy as np
+import frappe
+
+# End-to-end benchmark of the forecasting pipeline on synthetic data:
+#
+#   bench --site <site> gdp-forecast-benchmark --sectors 4 --years 2
+#
+# Every stage is timed on its own: parsing the uploaded sheets, ingesting
+# them (and the regional base tables) into the database, each forecaster's
+# load / fit / write and backtest, the report's execute() and the growth
+# scenario paths.
+# By default the database is an in-memory SQLite stand-in and nothing on the
+# site is touched. With `--db mariadb` the site's own forecasting tables are
+# used and REPLACED, so only do that on a scratch site. Results are saved as JSON; pass an earlier
+# file as `--compare` to see the change per stage.
+RESULT_FORMAT = 1
+
+# Size of the data at scale factor 1, roughly what the app is used with
+BASE_SCALE = {'sectors': 11, 'sub_sectors': 3, 'regions': 14, 'years': 14}
+LAST_YEAR = 2023
+# Growth-rate scenarios and their yearly rates, as in the uploaded sheets
+GROWTH_RATES = {'LOW': 0.0215, 'MEDIUM': 0.035, 'HIGH': 0.05, 'STEADY STATE': 0.03}
+SCENARIO_END_YEAR = 2030
+
+
+def scaled_counts(sectors=1, regions=1, years=1):
+    return {
+        'sectors': max(int(round(BASE_SCALE['sectors'] * sectors)), 1),
+        'sub_sectors': BASE_SCALE['sub_sectors'],
+        'regions': max(int(round(BASE_SCALE['regions'] * regions)), 1),
+        'years': max(int(round(BASE_SCALE['years'] * years)), 4),
+    }
+
+
+def sector_names(count):
+    return [f"Sector {index:04d}" for index in range(count)]
+
+
+def region_names(count):
+    return ['KSA'] + [f"Region {index:04d}" for index in range(1, count)]
+
+
+# Positive series with growth, seasonality of `period` and noise, one row
+# per series
+def synthetic_values(rng, n_series, length, period):
+    steps = np.arange(length)
+    level = rng.uniform(1e3, 1e5, (n_series, 1))
+    growth = 1 + rng.uniform(0, 0.04, (n_series, 1))
+    values = level * growth ** (steps / period)
+    if period > 1:
+        phase = rng.uniform(0, 2 * np.pi, (n_series, 1))
+        values *= 1 + 0.05 * np.sin(2 * np.pi * steps / period + phase)
+    return np.round(values * rng.normal(1, 0.02, (n_series, length)), 1)
+
+
+def write_csv(path, header, rows):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(rows)
+
+
+# Write the annual and quarterly upload sheets plus the four base tables'
+# CSVs (same layouts as the real files) into `directory`
+def generate_datasets(directory, counts, seed=0):
+    rng = np.random.default_rng(seed)
+    sectors, regions = sector_names(counts['sectors']), region_names(counts['regions'])
+    years = list(range(LAST_YEAR - counts['years'] + 1, LAST_YEAR + 1))
+    quarters = [(year, quarter) for year in years for quarter in range(1, 5)]
+    labels = [f"{year}-Q{quarter}" for year, quarter in quarters]
+    paths = {name: os.path.join(directory, f"{name}.csv") for name in (
+        'annual', 'quarterly', 'gdp', 'workforce', 'Annual_GrowthRates', 'Quarterly_GrowthRates'
+    )}
+
+    pairs = [(sector, f"Sub-sector {index}") for sector in sectors for index in range(counts['sub_sectors'])]
+    values = synthetic_values(rng, len(pairs), len(years), 1)
+    # Thousands separators, as in exported sheets
+    write_csv(paths['annual'], ['Sector', 'Sub-Sector'] + [str(year) for year in years], (
+        [sector, sub_sector] + [f"{value:,.1f}" for value in row] for (sector, sub_sector), row in zip(pairs, values)
+    ))
+    values = synthetic_values(rng, len(sectors), len(quarters), 4)
+    write_csv(paths['quarterly'], ['Sector'] + [label.replace('-', ' ') for label in labels], (
+        [sector] + [f"{value:,.1f}" for value in row] for sector, row in zip(sectors, values)
+    ))
+
+    values = synthetic_values(rng, len(regions), len(quarters), 4)
+    write_csv(paths['gdp'], ['id', 'Region', 'Quarter', 'Value', 'YearNumber', 'QuarterNumber'], (
+        [index * len(quarters) + position + 1, region, labels[position], value, *quarters[position]]
+        for index, (region, row) in enumerate(zip(regions, values)) for position, value in enumerate(row)
+    ))
+    pairs = [(region, sector) for region in regions for sector in sectors]
+    values = synthetic_values(rng, len(pairs), len(quarters), 4)
+    write_csv(paths['workforce'], ['id', 'GOSI_classification', 'OutPut Classification', 'Quarter', 'Region', 'Value'], (
+        [index * len(quarters) + position + 1, f"{sector} activities", sector, labels[position], region, value]
+        for index, ((region, sector), row) in enumerate(zip(pairs, values)) for position, value in enumerate(row)
+    ))
+
+    # Growth-rate sheets: the actual values repeated for every scenario, then
+    # each scenario compounding the last of them up to SCENARIO_END_YEAR
+    projected = range(1, SCENARIO_END_YEAR - LAST_YEAR + 1)
+    values = synthetic_values(rng, len(sectors), len(years), 1)
+    write_csv(paths['Annual_GrowthRates'], ['Sector', 'Growth Rate', 'Year', 'Value'], (
+        [sector, name, year, value]
+        for sector, row in zip(sectors, values) for name, rate in GROWTH_RATES.items()
+        for year, value in [*zip(years, row), *((LAST_YEAR + step, round(row[-1] * (1 + rate) ** step, 1)) for step in projected)]
+    ))
+    values = synthetic_values(rng, len(sectors), len(quarters), 4)
+    future = [f"{LAST_YEAR + (step - 1) // 4 + 1}-Q{(step - 1) % 4 + 1}" for step in range(1, 4 * len(projected) + 1)]
+    write_csv(paths['Quarterly_GrowthRates'], ['Sector', 'Growth Rate', 'YearQuarter', 'Value'], (
+        [sector, name, label, value]
+        for sector, row in zip(sectors, values) for name, rate in GROWTH_RATES.items()
+        for label, value in [
+            *zip(labels, row),
+            *((label, round(row[-1] * (1 + rate / 4) ** step, 1)) for step, label in enumerate(future, 1)),
+        ]
+    ))
+    return paths
+
+
+# In-memory SQLite database answering the app's MySQL-dialect queries
+# through the frappe.db.sql interface
+class SQLiteDatabase:
+    def __init__(self, path=':memory:'):
+        self.connection = sqlite3.connect(path)
+        self.create_tables()
+
+    def create_tables(self):
+        from gdp_forecasting.gdp_forecasting.schema import TABLES
+
+        for table in TABLES:
+            self.create_table(table)
+
+    # Create `table` as defined in schema.TABLES, under `name` if given
+    def create_table(self, table, name=None):
+        from gdp_forecasting.gdp_forecasting.schema import TABLES
+
+        spec = TABLES[table]
+        name = name or table
+        lines = []
+        auto_increment = None
+        for column, definition in spec['columns'].items():
+            if 'AUTO_INCREMENT' in definition:
+                auto_increment = column
+                lines.append(f"`{column}` INTEGER PRIMARY KEY")
+                continue
+            definition = re.sub(
+                r"CONCAT\((.*)\)", lambda match: " || ".join(part.strip() for part in match.group(1).split(',')),
+                definition
+            )
+            lines.append(f"`{column}` {definition}")
+        if spec['primary_key'] != [auto_increment]:
+            lines.append(f"PRIMARY KEY ({', '.join(f'`{column}`' for column in spec['primary_key'])})")
+        for columns in spec.get('unique', {}).values():
+            lines.append(f"UNIQUE ({', '.join(f'`{column}`' for column in columns)})")
+        self.connection.execute(f"CREATE TABLE `{name}` ({', '.join(lines)})")
+        for index, columns in spec['indexes'].items():
+            self.connection.execute(
+                f"CREATE INDEX `{name}__{index}` ON `{name}` ({', '.join(f'`{column}`' for column in columns)})"
+            )
+
+    # MySQL statement and pyformat parameters -> SQLite statement and
+    # parameters. Sequence parameters (IN %(x)s) are expanded in place.
+    @staticmethod
+    def translate(query, values):
+        query = re.sub(r"^\s*TRUNCATE\s+TABLE", "DELETE FROM", query, flags=re.IGNORECASE)
+        query = re.sub(r"INSERT\s+IGNORE", "INSERT OR IGNORE", query, flags=re.IGNORECASE)
+        match = re.search(r"ON\s+DUPLICATE\s+KEY\s+UPDATE\s+(.*)$", query, flags=re.IGNORECASE | re.DOTALL)
+        if match:
+            assignments = re.sub(r"VALUES\((`?\w+`?)\)", r"excluded.\1", match.group(1))
+            query = query[:match.start()] + "ON CONFLICT DO UPDATE SET " + assignments
+
+        params = {} if isinstance(values, dict) else []
+        if isinstance(values, dict):
+            def named(match):
+                name, value = match.group(1), values[match.group(1)]
+                if isinstance(value, (list, tuple)):
+                    params.update({f"{name}_{index}": item for index, item in enumerate(value)})
+                    return "(" + ", ".join(f":{name}_{index}" for index in range(len(value))) + ")"
+                params[name] = value
+                return f":{name}"
+            query = re.sub(r"%\((\w+)\)s", named, query)
+        elif values:
+            remaining = iter(values)
+
+            def positional(match):
+                value = next(remaining)
+                if isinstance(value, (list, tuple)):
+                    params.extend(value)
+                    return "(" + ", ".join("?" * len(value)) + ")"
+                params.append(value)
+                return "?"
+            query = re.sub(r"%s", positional, query)
+        return query, params
+
+    def sql(self, query, values=None, as_dict=False, **kwargs):
+        query, params = self.translate(query, values)
+        cursor = self.connection.execute(query, params)
+        if cursor.description is None:
+            return ()
+        rows = cursor.fetchall()
+        if as_dict:
+            columns = [column[0] for column in cursor.description]
+            return [frappe._dict(zip(columns, row)) for row in rows]
+        return tuple(rows)
+
+    def commit(self):
+        self.connection.commit()
+
+    def rollback(self):
+        self.connection.rollback()
+
+
+# Stands in for frappe.cache() so the report cache is cold and private
+class MemoryCache:
+    def __init__(self):
+        self.values = {}
+
+    def get_value(self, key):
+        return self.values.get(key)
+
+    def set_value(self, key, value, expires_in_sec=None):
+        self.values[key] = value
+
+    def delete_keys(self, prefix):
+        for key in [key for key in self.values if key.startswith(prefix)]:
+            del self.values[key]
+
+
+# Point everything the pipeline writes outside the database (snapshots,
+# ARIMA orders, report cache) into `directory`, and configure the synthetic
+# sectors as the annual forecast sectors (with Holt-Winters parameters, see
+# seed_best_params)
+@contextmanager
+def sandbox(db, directory, sectors):
+    from gdp_forecasting.forecast_scripts import arima_orders
+    from gdp_forecasting.gdp_forecasting import dataset_snapshot
+
+    conf = frappe._dict(getattr(frappe.local, 'conf', None) or {})
+    conf['gdp_forecast_sectors'] = {'annual': sectors, 'quarterly': None}
+    saved = {name: getattr(frappe.local, name, None) for name in ('db', 'conf')}
+    cache = MemoryCache()
+    with ExitStack() as stack:
+        stack.enter_context(patch.object(
+            dataset_snapshot, 'snapshot_root', lambda dataset_type: os.path.join(directory, 'snapshots', dataset_type.lower())
+        ))
+        stack.enter_context(patch.object(
+            arima_orders, 'get_order_store', lambda: arima_orders.OrderStore(os.path.join(directory, arima_orders.ORDERS_FILE))
+        ))
+        stack.enter_context(patch.object(frappe, 'cache', lambda: cache))
+        frappe.local.db, frappe.local.conf = db, conf
+        try:
+            seed_best_params(sectors)
+            yield
+        finally:
+            frappe.local.db, frappe.local.conf = saved['db'], saved['conf']
+
+
+# The annual Holt-Winters forecast only fits sectors with parameters, and
+# none of the synthetic sectors has search results: give each one the
+# default parameters of a real sector, in turn
+def seed_best_params(sectors):
+    from gdp_forecasting.forecast_scripts.holt_winters_annual import DEFAULT_BEST_PARAMS
+    from gdp_forecasting.forecast_scripts.hyperparameter_search import save_best_params
+
+    params = list(DEFAULT_BEST_PARAMS.values())
+    save_best_params({
+        sector: {'params': params[index % len(params)], 'rmse': None, 'candidates_evaluated': 0}
+        for index, sector in enumerate(sectors)
+    })
+
+
+def timed(stages, name, function, *args, **kwargs):
+    started = time.perf_counter()
+    result = function(*args, **kwargs)
+    stages[name] = {'seconds': round(time.perf_counter() - started, 4)}
+    return result
+
+
+# Accumulate the time spent in `names` of `module` while the context is open
+@contextmanager
+def time_calls(module, names, totals):
+    with ExitStack() as stack:
+        for name in names:
+            if not hasattr(module, name):
+                continue
+            original = getattr(module, name)
+
+            def wrapper(*args, _original=original, _name=name, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return _original(*args, **kwargs)
+                finally:
+                    totals[_name] += time.perf_counter() - started
+            stack.enter_context(patch.object(module, name, wrapper))
+        yield totals
+
+
+def run_ingest(stages, paths, db):
+    from gdp_forecasting.gdp_forecasting.bulk_ingest import bulk_insert, upsert_columns
+    from gdp_forecasting.gdp_forecasting.dataset_parser import iter_rows
+    from gdp_forecasting.gdp_forecasting.dataset_snapshot import write_snapshot
+    from gdp_forecasting.gdp_forecasting.gdp_forecasting import (
+        GROWTH_RATE_FILES, insert_data, process_annual_file, process_quarterly_file
+    )
+    from gdp_forecasting.gdp_forecasting.productivity import refresh_productivity_cube
+
+    timestamp = datetime.now()
+    parsed = {}
+    for dataset_type, process in (('Annual', process_annual_file), ('Quarterly', process_quarterly_file)):
+        parsed[dataset_type], _ = timed(stages, f"parse_{dataset_type.lower()}", process, paths[dataset_type.lower()])
+        table = f"tab{dataset_type} Dataset"
+        db.sql(f"TRUNCATE TABLE `{table}`")
+        stats = timed(stages, f"ingest_{dataset_type.lower()}", bulk_insert, table,
+            iter_rows(parsed[dataset_type], timestamp), update_columns=upsert_columns(table))
+        stages[f"ingest_{dataset_type.lower()}"].update(rows=stats['rows'], rows_per_second=stats['rows_per_second'])
+        timed(stages, f"snapshot_{dataset_type.lower()}", write_snapshot, parsed[dataset_type], dataset_type, timestamp)
+
+    for table in ('gdp', 'workforce', 'Annual_GrowthRates', 'Quarterly_GrowthRates'):
+        if table not in GROWTH_RATE_FILES:
+            db.sql(f"DELETE FROM `{table}`")
+        with open(paths[table], newline='', encoding='utf-8') as f:
+            reader = csv.reader(f)
+            next(reader)
+            stats = timed(stages, f"ingest_{table}", insert_data, table, reader)
+        stages[f"ingest_{table}"].update(rows=stats['rows'], rows_per_second=stats['rows_per_second'])
+    stats = timed(stages, 'refresh_productivity', refresh_productivity_cube)
+    stages['refresh_productivity'].update(stats)
+    return {dataset_type: len(frame) for dataset_type, frame in parsed.items()}
+
+
+# Load the base tables again, all at once (see concurrent_ingest). The workers
+# open connections of their own, so this only runs against MariaDB.
+def run_concurrent_ingest(stages, paths):
+    from gdp_forecasting.gdp_forecasting.concurrent_ingest import ingest_concurrently
+
+    sources = {table: paths[table] for table in ('gdp', 'workforce', 'Annual_GrowthRates', 'Quarterly_GrowthRates')}
+    results = timed(stages, 'ingest_base_concurrent', ingest_concurrently, sources, len(sources))
+    stages['ingest_base_concurrent']['rows'] = sum(stats['rows'] for stats in results.values())
+
+
+# Run each forecaster with the model cache off, split into load, fit and
+# write time (fit is everything that is not loading input or writing results).
+# A forecaster whose fit covered no sector fails: its timings would be
+# meaningless.
+def run_forecasters(forecast_types=None, engine=None, workers=None):
+    from gdp_forecasting.forecast_scripts import registry
+    from gdp_forecasting.gdp_forecasting.instrumentation import recorded_spans, run_log
+
+    results = {}
+    for forecast_type in forecast_types or registry.forecast_types():
+        try:
+            forecaster = registry.get_forecaster(forecast_type)
+        except ImportError as e:
+            results[forecast_type] = {'skipped': str(e)}
+            continue
+        parameters = inspect.signature(forecaster).parameters
+        kwargs = {'use_cache': False}
+        if 'engine' in parameters:
+            kwargs['engine'] = engine
+        if 'workers' in parameters:
+            kwargs['workers'] = workers
+
+        totals = defaultdict(float)
+        started = time.perf_counter()
+        try:
+            with run_log('benchmark', forecast_type):
+                with time_calls(sys.modules[forecaster.__module__], ('load_dataset', 'write_results'), totals):
+                    forecaster(**kwargs)
+                seconds = time.perf_counter() - started
+                spans = recorded_spans()
+            fit_sectors = [entry['sectors'] for entry in spans if entry['path'] == 'fit' and 'sectors' in entry]
+            if fit_sectors and not any(fit_sectors):
+                raise RuntimeError("the fit covered no sectors")
+        except Exception as e:
+            results[forecast_type] = {'error': f"{type(e).__name__}: {e}"}
+            continue
+        results[forecast_type] = {
+            'seconds': round(seconds, 4),
+            'load_seconds': round(totals['load_dataset'], 4),
+            'fit_seconds': round(seconds - totals['load_dataset'] - totals['write_results'], 4),
+            'write_seconds': round(totals['write_results'], 4),
+        }
+    return results
+
+
+# Backtest each forecast type with its default origins and horizon
+def run_backtests(forecast_types=None, engine=None, workers=None):
+    try:
+        from gdp_forecasting.forecast_scripts import backtest
+    except ImportError as e:
+        return {'skipped': str(e)}
+
+    results = {}
+    for forecast_type in forecast_types or list(backtest.BACKTESTS):
+        if forecast_type not in backtest.BACKTESTS:
+            continue
+        started = time.perf_counter()
+        try:
+            summary = backtest.run_backtest(forecast_type, workers=workers, engine=engine)
+        except Exception as e:
+            results[forecast_type] = {'error': f"{type(e).__name__}: {e}"}
+            continue
+        results[forecast_type] = dict(summary, seconds=round(time.perf_counter() - started, 4))
+    return results
+
+
+# First page of each report view, cold (cache cleared) and warm
+def run_report(stages):
+    from gdp_forecasting.gdp_forecasting.report.gdp_forecasting.gdp_forecasting import clear_report_cache, execute
+
+    for forecast_type in ('Annual', 'Quarterly'):
+        clear_report_cache()
+        filters = {'forecast_type': forecast_type}
+        _, data, _ = timed(stages, f"report_{forecast_type.lower()}_cold", execute, filters)
+        stages[f"report_{forecast_type.lower()}_cold"]['rows'] = len(data)
+        timed(stages, f"report_{forecast_type.lower()}_warm", execute, filters)
+
+
+# Every scenario path of each frequency, cold (cache cleared) and warm
+def run_scenarios(stages):
+    from gdp_forecasting.gdp_forecasting.growth_scenarios import clear_scenario_cache, get_scenario_paths
+
+    for frequency in ('annual', 'quarterly'):
+        clear_scenario_cache()
+        rows = timed(stages, f"scenarios_{frequency}_cold", get_scenario_paths, frequency)
+        stages[f"scenarios_{frequency}_cold"]['rows'] = len(rows)
+        timed(stages, f"scenarios_{frequency}_warm", get_scenario_paths, frequency)
+
+
+def environment():
+    versions = {'python': platform.python_version()}
+    for package in ('numpy', 'pandas', 'statsmodels', 'pmdarima', 'frappe'):
+        try:
+            versions[package] = metadata.version(package)
+        except metadata.PackageNotFoundError:
+            versions[package] = None
+    return versions
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(sectors=1, regions=1, years=1, backend='sqlite', forecast_types=None, engine=None, workers=None, seed=0):
+    from gdp_forecasting.gdp_forecasting.schema import create_tables
+
+    counts = scaled_counts(sectors, regions, years)
+    result = {
+        'format': RESULT_FORMAT,
+        'commit': git_commit(),
+        'started_at': datetime.now().isoformat(timespec='seconds'),
+        'backend': backend,
+        'engine': engine,
+        'scale': {'factors': {'sectors': sectors, 'regions': regions, 'years': years}, 'counts': counts},
+        'environment': environment(),
+        'stages': {},
+    }
+    with tempfile.TemporaryDirectory(prefix='gdp_forecast_benchmark_') as directory:
+        paths = timed(result['stages'], 'generate', generate_datasets, directory, counts, seed)
+        if backend == 'sqlite':
+            db = SQLiteDatabase()
+        else:
+            db = frappe.local.db
+            create_tables()
+        with sandbox(db, directory, sector_names(counts['sectors'])):
+            result['rows'] = run_ingest(result['stages'], paths, db)
+            if backend != 'sqlite':
+                run_concurrent_ingest(result['stages'], paths)
+            result['forecasters'] = run_forecasters(forecast_types, engine, workers)
+            result['backtests'] = run_backtests(forecast_types, engine, workers)
+            run_report(result['stages'])
+            run_scenarios(result['stages'])
+            db.commit()
+    return result
+
+
+# Flatten a result into {"stages.parse_annual": seconds, ...}
+def stage_seconds(result):
+    seconds = {f"stages.{name}": stage['seconds'] for name, stage in result.get('stages', {}).items()}
+    for forecast_type, timings in result.get('forecasters', {}).items():
+        for key in ('seconds', 'load_seconds', 'fit_seconds', 'write_seconds'):
+            if key in timings:
+                seconds[f"forecasters.{forecast_type}.{key}"] = timings[key]
+    for forecast_type, timings in result.get('backtests', {}).items():
+        if isinstance(timings, dict) and 'seconds' in timings:
+            seconds[f"backtests.{forecast_type}.seconds"] = timings['seconds']
+    return seconds
+
+
+# Per-stage timings of two results (e.g. two commits): (name, baseline,
+# current, current / baseline)
+def compare_results(baseline, current):
+    before, after = stage_seconds(baseline), stage_seconds(current)
+    return [
+        (name, before[name], after[name], round(after[name] / before[name], 3) if before[name] else None)
+        for name in before if name in after
+    ]
+
+
+def save_result(result, path=None):
+    if not path:
+        stamp = datetime.now().strftime('%Y%m%d%H%M%S')
+        path = f"gdp_forecast_benchmark_{result['commit'] or 'unknown'}_{stamp}.json"
+    with open(path, 'w') as f:
+        json.dump(result, f, indent=1, default=str)
+    return path
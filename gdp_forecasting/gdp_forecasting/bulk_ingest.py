@@ -0,0 +1,105 @@
+import time
+import frappe
+from gdp_forecasting.gdp_forecasting import schema
+
+# Rows per multi-row INSERT statement (and per commit)
+DEFAULT_BATCH_SIZE = 5000
+
+# Column lists and CSV row converters for every table we ingest into.
+# Quarterly labels ('YYYY-Qn') in the CSVs are stored as numeric year and
+# quarter columns (see schema.py).
+TABLE_COLUMNS = {
+    'tabAnnual Dataset': ['sector', 'sub_sector', 'year', 'gdp', 'upload_timestamp'],
+    'tabQuarterly Dataset': ['sector', 'year', 'quarter', 'gdp', 'upload_timestamp'],
+    'gdp': ['Region', 'YearNumber', 'QuarterNumber', 'Value'],
+    'workforce': ['id', 'GOSI_classification', 'Output_Classification', 'YearNumber', 'QuarterNumber', 'Region', 'Value'],
+}
+
+
+# '2019-Q1' -> (2019, 1)
+def split_quarter(label):
+    year, quarter = label.strip().split('-Q')
+    return int(year), int(quarter)
+
+
+# The growth-rate sheets are not stored row for row: growth_scenarios reduces
+# their converted rows to base values and scenario rates
+CSV_ROW_CONVERTERS = {
+    'gdp': lambda row: (row[1], *split_quarter(row[2]), float(row[3])),
+    'workforce': lambda row: (int(row[0]), row[1], row[2], *split_quarter(row[3]), row[4], float(row[5])),
+    'Annual_GrowthRates': lambda row: (row[0], row[1], int(row[2]), float(row[3])),
+    'Quarterly_GrowthRates': lambda row: (row[0], row[1], *split_quarter(row[2]), float(row[3])),
+}
+
+
+# Build a single INSERT statement covering `row_count` rows
+def build_insert_query(table, columns, row_count, update_columns=None):
+    column_sql = ", ".join(f"`{column}`" for column in columns)
+    placeholders = "(" + ", ".join(["%s"] * len(columns)) + ")"
+    query = f"INSERT INTO `{table}` ({column_sql}) VALUES " + ", ".join([placeholders] * row_count)
+    if update_columns:
+        query += " ON DUPLICATE KEY UPDATE " + ", ".join(
+            f"`{column}` = VALUES(`{column}`)" for column in update_columns
+        )
+    return query
+
+
+# Load an iterable of row tuples into `table` in large multi-row batches,
+# committing once per batch (or not at all with commit=False, leaving the
+# rows to the caller's transaction). Returns ingest statistics including
+# rows/second.
+def bulk_insert(table, rows, columns=None, batch_size=DEFAULT_BATCH_SIZE, update_columns=None, commit=True):
+    columns = columns or TABLE_COLUMNS[table]
+    started = time.perf_counter()
+    total_rows = 0
+    batches = 0
+    batch = []
+
+    def flush():
+        frappe.db.sql(
+            build_insert_query(table, columns, len(batch), update_columns),
+            [value for row in batch for value in row]
+        )
+        if commit:
+            frappe.db.commit()
+
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            flush()
+            total_rows += len(batch)
+            batches += 1
+            batch = []
+
+    if batch:
+        flush()
+        total_rows += len(batch)
+        batches += 1
+
+    elapsed = time.perf_counter() - started
+    stats = {
+        'table': table,
+        'rows': total_rows,
+        'batches': batches,
+        'seconds': round(elapsed, 4),
+        'rows_per_second': round(total_rows / elapsed, 1) if elapsed > 0 else float(total_rows),
+    }
+    frappe.logger("gdp_forecasting").info(
+        f"Bulk ingest into {table}: {total_rows} rows in {batches} batches, "
+        f"{stats['rows_per_second']} rows/s"
+    )
+    return stats
+
+
+# Convert raw CSV rows for one of the base tables and bulk load them, into
+# the table itself or into `target` (a copy with the same columns). A row
+# repeating an existing key overwrites it (the last row in the file wins).
+def bulk_insert_csv_rows(table, reader, batch_size=DEFAULT_BATCH_SIZE, target=None, commit=True):
+    convert = CSV_ROW_CONVERTERS[table]
+    return bulk_insert(target or table, (convert(row) for row in reader), columns=TABLE_COLUMNS[table],
+        batch_size=batch_size, update_columns=upsert_columns(table), commit=commit)
+
+
+# Non-key columns of `table` that appear in its ingest column list
+def upsert_columns(table):
+    return [column for column in schema.update_columns(table) if column in TABLE_COLUMNS[table]]
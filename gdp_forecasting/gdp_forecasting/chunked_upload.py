@@ -0,0 +1,349 @@
+import csv
+import io
+import json
+import os
+from datetime import datetime, timedelta
+import frappe
+from frappe import _
+from frappe.utils import cint, get_datetime
+from gdp_forecasting.gdp_forecasting.bulk_ingest import TABLE_COLUMNS, bulk_insert, bulk_insert_csv_rows, upsert_columns
+from gdp_forecasting.gdp_forecasting.concurrent_ingest import STAGING_SUFFIX, drop_staging, swap_in
+from gdp_forecasting.gdp_forecasting.instrumentation import run_log, span
+from gdp_forecasting.gdp_forecasting.schema import create_table_sql
+
+# Chunked, resumable uploads of the dataset and base dataset CSVs
+# (www/upload.js). The client opens an upload session, sends the file in
+# fixed-size chunks with their byte offsets, and completes the session:
+#
+#   start_upload(dataset, file_name, file_size)   -> upload_id, received, chunk_size
+#   upload_chunk(upload_id, offset, <chunk>)      -> received
+#   complete_upload(upload_ids, upload_mode)      -> the upload_file response
+#
+# Each chunk is appended to a spool file under private/files and the complete
+# lines received so far are parsed and bulk loaded into a staging copy of the
+# target table, so a request never holds more than one chunk. Completing
+# swaps the staging copy in (or, for an incremental upload, applies its
+# difference to the dataset) and loads the base datasets.
+#
+# The session (`tabGDP Upload Session`) records how many bytes were received
+# and how far they were parsed. A chunk at another offset is not written; the
+# reply carries the offset the server expects, and start_upload for the same
+# file returns the open session, so an interrupted upload resumes where it
+# stopped. The rows parsed from a chunk are committed in the same
+# transaction as the session's new `parsed` offset, so after a crash no line
+# is loaded twice (gdp rows have a surrogate key, so a repeated line would
+# be a duplicate row, not an upsert).
+#
+# Growth-rate sheets are small and decomposed as a whole (see
+# growth_scenarios), so they are only spooled and loaded on completion.
+SESSION_TABLE = 'tabGDP Upload Session'
+DATASET_TABLES = {
+    'Annual': 'tabAnnual Dataset',
+    'Quarterly': 'tabQuarterly Dataset',
+    'gdp': 'gdp',
+    'workforce': 'workforce',
+    'Annual_GrowthRates': None,
+    'Quarterly_GrowthRates': None,
+}
+# upload_base_datasets argument for each base dataset
+BASE_DATASET_ARGUMENTS = {
+    'gdp': 'gdp_dataset',
+    'workforce': 'workforce_dataset',
+    'Annual_GrowthRates': 'annual_growth_rates_dataset',
+    'Quarterly_GrowthRates': 'quarterly_growth_rates_dataset',
+}
+DEFAULT_CHUNK_SIZE = 4 * 1024 * 1024
+# Open sessions untouched for this long are expired by the daily job
+SESSION_TTL = timedelta(days=2)
+ERROR_PREVIEW = 200
+
+
+# Bytes per chunk: the `gdp_upload_chunk_size` site config key or 4 MB
+def get_chunk_size():
+    return cint(frappe.conf.get("gdp_upload_chunk_size") if frappe.conf else None) or DEFAULT_CHUNK_SIZE
+
+
+def spool_path(upload_id):
+    return frappe.get_site_path('private', 'files', 'gdp_forecasting', 'uploads', f"{upload_id}.csv")
+
+
+def session_state(session):
+    return {
+        'upload_id': session['upload_id'],
+        'dataset': session['dataset'],
+        'file_size': session['file_size'],
+        'received': session['received'],
+        'rows': session['row_count'],
+        'status': session['status'],
+        'chunk_size': get_chunk_size(),
+    }
+
+
+# The caller's open session (its row locked until the next commit)
+def lock_session(upload_id):
+    rows = frappe.db.sql(
+        f"SELECT * FROM `{SESSION_TABLE}` WHERE `upload_id` = %s AND `owner` = %s FOR UPDATE",
+        (upload_id, frappe.session.user), as_dict=True
+    )
+    if not rows:
+        frappe.throw(_("Upload {0} not found").format(upload_id))
+    if rows[0]['status'] != 'Open':
+        frappe.throw(_("Upload {0} is {1}").format(upload_id, rows[0]['status'].lower()))
+    return rows[0]
+
+
+def update_session(session, **values):
+    session.update(values, modified=datetime.now())
+    assignments = ", ".join(f"`{column}` = %({column})s" for column in list(values) + ['modified'])
+    frappe.db.sql(f"UPDATE `{SESSION_TABLE}` SET {assignments} WHERE `upload_id` = %(upload_id)s", session)
+
+
+# Close a session and remove its spool file and, unless another open
+# session of the same dataset is using it, its staging table
+def close_session(session, status):
+    update_session(session, status=status)
+    try:
+        os.remove(spool_path(session['upload_id']))
+    except FileNotFoundError:
+        pass
+    table = DATASET_TABLES[session['dataset']]
+    if status != 'Completed' and table and not frappe.db.sql(
+        f"SELECT 1 FROM `{SESSION_TABLE}` WHERE `dataset` = %s AND `status` = 'Open' AND `upload_id` != %s",
+        (session['dataset'], session['upload_id'])
+    ):
+        drop_staging([table])
+
+
+# Open an upload session, or return the caller's open session for the same
+# file so the client can resume from `received`. A new session supersedes any
+# other open upload of the dataset (they share its staging table).
+@frappe.whitelist()
+def start_upload(dataset, file_name, file_size, file_modified=None):
+    if dataset not in DATASET_TABLES:
+        frappe.throw(_("Unknown dataset {0}").format(dataset))
+    file_size, file_modified = cint(file_size), cint(file_modified)
+    rows = frappe.db.sql(f"""
+        SELECT * FROM `{SESSION_TABLE}`
+        WHERE `owner` = %s AND `dataset` = %s AND `file_name` = %s AND `file_size` = %s
+            AND `file_modified` = %s AND `status` = 'Open'
+        ORDER BY `created` DESC LIMIT 1
+    """, (frappe.session.user, dataset, file_name, file_size, file_modified), as_dict=True)
+    if rows:
+        return session_state(rows[0])
+
+    for session in frappe.db.sql(
+        f"SELECT * FROM `{SESSION_TABLE}` WHERE `dataset` = %s AND `status` = 'Open'", (dataset,), as_dict=True
+    ):
+        close_session(session, 'Superseded')
+    now = datetime.now()
+    session = {
+        'upload_id': frappe.generate_hash(length=12), 'dataset': dataset, 'file_name': file_name[:255],
+        'file_size': file_size, 'file_modified': file_modified, 'received': 0, 'parsed': 0, 'line_count': 0,
+        'row_count': 0, 'header': None, 'parse_errors': 0, 'error_preview': None, 'status': 'Open',
+        'owner': frappe.session.user, 'created': now, 'modified': now,
+    }
+    path = spool_path(session['upload_id'])
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    open(path, 'wb').close()
+    table = DATASET_TABLES[dataset]
+    if table:
+        frappe.db.sql(f"DROP TABLE IF EXISTS `{table}{STAGING_SUFFIX}`")
+        frappe.db.sql(create_table_sql(table, name=table + STAGING_SUFFIX))
+    columns = list(session)
+    frappe.db.sql(f"""
+        INSERT INTO `{SESSION_TABLE}` ({", ".join(f"`{column}`" for column in columns)})
+        VALUES ({", ".join(f"%({column})s" for column in columns)})
+    """, session)
+    frappe.db.commit()
+    return session_state(session)
+
+
+# Store the chunk posted as `chunk` at `offset` and load its complete lines.
+# A chunk at any other offset than the next expected byte is ignored; the
+# reply's `received` tells the client where to continue.
+@frappe.whitelist()
+def upload_chunk(upload_id, offset):
+    chunk = frappe.request.files.get('chunk')
+    if chunk is None:
+        frappe.throw(_("No chunk in the request"))
+    content = chunk.stream.read(get_chunk_size() + 1)
+    if len(content) > get_chunk_size():
+        frappe.throw(_("Chunks are at most {0} bytes").format(get_chunk_size()))
+
+    session = lock_session(upload_id)
+    offset = cint(offset)
+    if offset != session['received']:
+        return session_state(session)
+    if offset + len(content) > session['file_size']:
+        frappe.throw(_("Chunk runs past the end of the file"))
+
+    with open(spool_path(upload_id), 'r+b') as f:
+        f.seek(offset)
+        f.write(content)
+        f.truncate()
+    session['received'] = offset + len(content)
+    try:
+        load_lines(session)
+    except Exception:
+        frappe.db.rollback()
+        session = lock_session(upload_id)
+        close_session(session, 'Failed')
+        frappe.db.commit()
+        raise
+    update_session(session, received=session['received'])
+    frappe.db.commit()
+    return session_state(session)
+
+
+# Parse and load the lines received since the last call. The last line is
+# left for the next chunk unless it ends the file. Nothing is committed: the
+# caller commits the rows together with the session.
+def load_lines(session, final=False):
+    if not DATASET_TABLES[session['dataset']]:
+        return
+    with open(spool_path(session['upload_id']), 'rb') as f:
+        f.seek(session['parsed'])
+        data = f.read(session['received'] - session['parsed'])
+    end = len(data) if final else data.rfind(b'\n') + 1
+    if not end:
+        return
+    text = data[:end].decode('utf-8-sig' if session['parsed'] == 0 else 'utf-8')
+    rows = [row for row in csv.reader(io.StringIO(text, newline='')) if row]
+    if session['header'] is None and rows:
+        session['header'] = json.dumps(rows.pop(0))
+    first_line = session['line_count'] + 2  # below the header, 1-based
+    written, errors = ingest_rows(session['dataset'], json.loads(session['header'] or '[]'), rows, first_line,
+        session['created'])
+    preview = json.loads(session['error_preview'] or '[]')
+    preview.extend(errors[:ERROR_PREVIEW - len(preview)])
+    update_session(
+        session, parsed=session['parsed'] + end, line_count=session['line_count'] + len(rows),
+        row_count=session['row_count'] + written, header=session['header'],
+        parse_errors=session['parse_errors'] + len(errors), error_preview=json.dumps(preview) if preview else None,
+    )
+
+
+# Load parsed CSV rows into the dataset's staging table. Returns the number
+# of rows written and the unparsable cells.
+def ingest_rows(dataset, header, rows, first_line, timestamp):
+    table = DATASET_TABLES[dataset]
+    staging = table + STAGING_SUFFIX
+    if not rows:
+        return 0, []
+    if dataset not in ('Annual', 'Quarterly'):
+        return bulk_insert_csv_rows(dataset, rows, target=staging, commit=False)['rows'], []
+
+    import pandas as pd
+    from gdp_forecasting.gdp_forecasting.dataset_parser import (
+        check_headers, iter_rows, parse_annual_frame, parse_quarterly_frame
+    )
+    header = check_headers(header)
+    width = len(header)
+    frame = pd.DataFrame([(row + [''] * width)[:width] for row in rows], columns=header)
+    parse = parse_annual_frame if dataset == 'Annual' else parse_quarterly_frame
+    parsed, errors = parse(frame, first_line)
+    stats = bulk_insert(staging, iter_rows(parsed, timestamp), columns=TABLE_COLUMNS[table],
+        update_columns=upsert_columns(table), commit=False)
+    return stats['rows'], errors
+
+
+def parse_ids(upload_ids):
+    if isinstance(upload_ids, str):
+        return json.loads(upload_ids) if upload_ids.strip().startswith('[') else [upload_ids]
+    return list(upload_ids or [])
+
+
+# Finish the uploads in `upload_ids`: at most one Annual or Quarterly dataset
+# and any of the base datasets. Base datasets not uploaded are loaded from
+# base_datasets/ as in upload_file, and the response has its layout.
+@frappe.whitelist()
+def complete_upload(upload_ids, upload_mode='replace', profile=None):
+    from gdp_forecasting.gdp_forecasting.gdp_forecasting import upload_base_datasets
+
+    sessions = [lock_session(upload_id) for upload_id in parse_ids(upload_ids)]
+    datasets = [session for session in sessions if session['dataset'] in ('Annual', 'Quarterly')]
+    if len(datasets) > 1:
+        frappe.throw(_("Upload one Annual or Quarterly dataset at a time"))
+    for session in sessions:
+        if session['received'] != session['file_size']:
+            frappe.throw(_("{0} is incomplete: {1} of {2} bytes received").format(
+                session['file_name'], session['received'], session['file_size']))
+
+    dataset_type = datasets[0]['dataset'] if datasets else None
+    base = {session['dataset']: session for session in sessions if session['dataset'] in BASE_DATASET_ARGUMENTS}
+    with run_log('upload', dataset_type or 'Base datasets', profile=profile, upload_mode=upload_mode,
+            chunked=1) as fields:
+        ingest_stats = None
+        if datasets:
+            ingest_stats = complete_dataset(datasets[0], upload_mode)
+            fields['rows'] = ingest_stats.get('rows')
+        for session in base.values():
+            load_lines(session, final=True)
+        with span('base datasets') as base_fields:
+            base_datasets = upload_base_datasets(
+                use_existing_gdp_file=1, use_existing_workforce_file=1, use_existing_annual_growth_file=1,
+                use_existing_quarterly_growth_file=1,
+                staged=[dataset for dataset in base if DATASET_TABLES[dataset]],
+                **{argument: spool_path(base[dataset]['upload_id']) if dataset in base else None
+                    for dataset, argument in BASE_DATASET_ARGUMENTS.items()}
+            )
+            base_fields.update(loaded=len(base_datasets['loaded']), skipped=len(base_datasets['skipped']))
+    for session in sessions:
+        close_session(session, 'Completed')
+    frappe.db.commit()
+    return {"status": "success", "ingest": ingest_stats, "base_datasets": base_datasets}
+
+
+# Replace the dataset with its staging table (or apply the difference, for an
+# incremental upload) and snapshot it
+def complete_dataset(session, upload_mode):
+    from gdp_forecasting.gdp_forecasting.dataset_snapshot import load_from_db, refresh_snapshot
+    from gdp_forecasting.gdp_forecasting.delta_upload import apply_delta_upload
+    from gdp_forecasting.gdp_forecasting.gdp_forecasting import log_parse_errors, upload_summary
+
+    dataset_type, table = session['dataset'], DATASET_TABLES[session['dataset']]
+    timestamp = get_datetime(session['created'])
+    load_lines(session, final=True)
+    if session['parse_errors']:
+        log_parse_errors(json.loads(session['error_preview'] or '[]'), dataset_type)
+    with span('ingest', mode=upload_mode) as fields:
+        if upload_mode == 'incremental':
+            frame = load_from_db(dataset_type, table + STAGING_SUFFIX)
+            ingest_stats = apply_delta_upload(frame, dataset_type, timestamp)
+            drop_staging([table])
+        else:
+            swap_in([table])
+            seconds = max((datetime.now() - timestamp).total_seconds(), 1e-3)
+            ingest_stats = {
+                'table': table, 'mode': 'replace', 'rows': session['row_count'], 'seconds': round(seconds, 4),
+                'rows_per_second': round(session['row_count'] / seconds, 1),
+            }
+        fields['rows'] = session['row_count']
+    # Forecast runs load the dataset from this snapshot
+    with span('snapshot'):
+        refresh_snapshot(load_from_db(dataset_type), dataset_type, timestamp)
+    frappe.msgprint(f"{dataset_type} data uploaded successfully! {upload_summary(ingest_stats)}",
+        indicator="green", alert=True)
+    return ingest_stats
+
+
+# Upload session for the client to poll or resume
+@frappe.whitelist()
+def get_upload(upload_id):
+    rows = frappe.db.sql(
+        f"SELECT * FROM `{SESSION_TABLE}` WHERE `upload_id` = %s AND `owner` = %s",
+        (upload_id, frappe.session.user), as_dict=True
+    )
+    if not rows:
+        frappe.throw(_("Upload {0} not found").format(upload_id))
+    return session_state(rows[0])
+
+
+# Daily: expire open sessions nobody has sent a chunk to for SESSION_TTL
+def expire_upload_sessions():
+    for session in frappe.db.sql(
+        f"SELECT * FROM `{SESSION_TABLE}` WHERE `status` = 'Open' AND `modified` < %s",
+        (datetime.now() - SESSION_TTL,), as_dict=True
+    ):
+        close_session(session, 'Expired')
+    frappe.db.commit()
@@ -0,0 +1,136 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+import frappe
+from frappe.utils import cint
+from gdp_forecasting.gdp_forecasting import schema
+from gdp_forecasting.gdp_forecasting.base_manifest import open_rows
+from gdp_forecasting.gdp_forecasting.bulk_ingest import bulk_insert_csv_rows
+from gdp_forecasting.gdp_forecasting.gdp_forecasting import GROWTH_RATE_FILES
+from gdp_forecasting.gdp_forecasting.instrumentation import add_task_spans, peak_rss_mb, span
+
+# Concurrent loading of the base datasets. Each table is loaded by a worker
+# thread with its own database connection into a staging copy
+# (`<table>__staging`), at most `gdp_base_ingest_workers` tables at a time.
+# Once every load has succeeded, the staging copies replace the live tables
+# in one multi-table RENAME, which MariaDB applies atomically. If any load
+# fails the staging copies are dropped and the live tables are left as they
+# were. An upload then takes about as long as its largest table rather than
+# the sum of all of them.
+#
+# A growth-rate sheet stages its base table (Annual_GrowthBase /
+# Quarterly_GrowthBase). Its scenario rates are shared with custom scenarios
+# in GrowthScenarios, so they are written on the request connection right
+# after the swap.
+STAGING_SUFFIX = '__staging'
+RETIRED_SUFFIX = '__retired'
+
+
+# Number of tables loaded at once: explicit argument, then the
+# `gdp_base_ingest_workers` site config key. 1 (the default) loads the tables
+# one after another on the request connection.
+def get_ingest_workers(workers=None):
+    if workers is None:
+        workers = frappe.conf.get("gdp_base_ingest_workers") if frappe.conf else None
+    return max(1, cint(workers or 1))
+
+
+# The live table a base dataset is loaded into
+def live_table(table):
+    if table in GROWTH_RATE_FILES:
+        from gdp_forecasting.gdp_forecasting.growth_scenarios import FREQUENCIES
+        return FREQUENCIES[GROWTH_RATE_FILES[table]]['table']
+    return table
+
+
+# Load one base dataset into its staging copy. Runs in a worker thread, with
+# its own site context and connection.
+def load_table(site, sites_path, table, source):
+    started, cpu_started = time.time(), time.thread_time()
+    frappe.init(site=site, sites_path=sites_path)
+    frappe.connect()
+    try:
+        live = live_table(table)
+        staging = live + STAGING_SUFFIX
+        frappe.db.sql(f"DROP TABLE IF EXISTS `{staging}`")
+        frappe.db.sql(schema.create_table_sql(live, name=staging))
+        with open_rows(source) as reader:
+            next(reader)  # Skip header row
+            if table in GROWTH_RATE_FILES:
+                from gdp_forecasting.gdp_forecasting.growth_scenarios import stage_growth_rates
+                stats = stage_growth_rates(GROWTH_RATE_FILES[table], reader, staging)
+            else:
+                stats = bulk_insert_csv_rows(table, reader, target=staging)
+        frappe.db.commit()
+    finally:
+        frappe.destroy()
+    stats['table'] = live
+    # Timed here, as spans can only be recorded from the request thread
+    stats['span'] = {
+        'name': 'task', 'path': 'task', 'parent': None, 'start': started,
+        'wall': round(time.time() - started, 4), 'cpu': round(time.thread_time() - cpu_started, 4),
+        'peak_rss_mb': peak_rss_mb(),
+    }
+    return stats
+
+
+def drop_staging(tables):
+    for table in tables:
+        frappe.db.sql(f"DROP TABLE IF EXISTS `{table}{STAGING_SUFFIX}`")
+
+
+# Replace the live tables with their staging copies in one RENAME
+def swap_in(tables):
+    for table in tables:
+        frappe.db.sql(schema.create_table_sql(table))
+        frappe.db.sql(f"DROP TABLE IF EXISTS `{table}{RETIRED_SUFFIX}`")
+    renames = ", ".join(
+        f"`{table}` TO `{table}{RETIRED_SUFFIX}`, `{table}{STAGING_SUFFIX}` TO `{table}`" for table in tables
+    )
+    frappe.db.sql(f"RENAME TABLE {renames}")
+    for table in tables:
+        frappe.db.sql(f"DROP TABLE `{table}{RETIRED_SUFFIX}`")
+
+
+# Load the base datasets in `sources` ({table: CSV path or bytes}, see
+# base_manifest.source_digest) concurrently and swap them in together.
+# Either every table is replaced or, when a load fails, none is and the
+# first error is raised. Returns {table: stats}.
+def ingest_concurrently(sources, workers=None):
+    workers = min(get_ingest_workers(workers), len(sources))
+    site, sites_path = frappe.local.site, frappe.local.sites_path
+    live = [live_table(table) for table in sources]
+    results, errors = {}, {}
+    with span('load staging tables', tables=len(sources), workers=workers):
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {
+                table: pool.submit(load_table, site, sites_path, table, source)
+                for table, source in sources.items()
+            }
+        for table, future in futures.items():
+            try:
+                results[table] = future.result()
+            except Exception as e:
+                errors[table] = e
+                continue
+            add_task_spans(f"ingest {table}", [results[table].pop('span')], rows=results[table]['rows'])
+
+    if errors:
+        drop_staging(live)
+        frappe.db.commit()
+        frappe.logger("gdp_forecasting").error(
+            f"Base datasets not loaded, failed: {', '.join(f'{table} ({e})' for table, e in errors.items())}"
+        )
+        raise next(iter(errors.values()))
+
+    with span('swap in staging tables', tables=len(live)):
+        try:
+            swap_in(live)
+        except Exception:
+            drop_staging(live)
+            raise
+    for table, stats in results.items():
+        if table in GROWTH_RATE_FILES:
+            from gdp_forecasting.gdp_forecasting.growth_scenarios import replace_uploaded_scenarios
+            replace_uploaded_scenarios(GROWTH_RATE_FILES[table], stats.pop('scenarios'))
+    frappe.db.commit()
+    return results
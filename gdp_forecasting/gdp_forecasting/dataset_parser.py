@@ -0,0 +1,162 @@
+import re
+from collections import namedtuple
+import numpy as np
+import pandas as pd
+
+# Result of parsing an uploaded sheet: a long-form typed DataFrame and the
+# list of cells that could not be parsed as numbers
+ParseResult = namedtuple('ParseResult', ['frame', 'errors'])
+
+YEAR_HEADER = re.compile(r"^\s*(\d{4})\s*$")
+YEAR_QUARTER_HEADER = re.compile(r"^\s*(\d{4})\s*[-_ /]?\s*Q([1-4])\s*$", re.IGNORECASE)
+QUARTER_YEAR_HEADER = re.compile(r"^\s*Q([1-4])\s*[-_ /]?\s*(\d{4})\s*$", re.IGNORECASE)
+
+
+# Read the whole sheet in one pass; every cell is kept as a string so the
+# numeric conversion can be done column-wise afterwards
+def read_sheet(file_path):
+    frame = pd.read_csv(file_path, dtype=str, keep_default_na=False, encoding='utf-8')
+    frame.columns = check_headers(frame.columns)
+    return frame
+
+
+def check_headers(headers):
+    headers = [str(column).strip() for column in headers]
+    if not headers or headers[0] != 'Sector':
+        raise ValueError("CSV file format is incorrect. Expected headers starting with 'Sector'.")
+    return headers
+
+
+# Vectorized "1,234.5" -> 1234.5 conversion. Returns the float array and a mask
+# of cells that were non-empty but not numeric.
+def to_numeric(values):
+    raw = pd.Series(values, dtype=object).astype(str).str.strip()
+    numbers = pd.to_numeric(raw.str.replace(',', '', regex=False), errors='coerce').to_numpy(dtype=np.float64)
+    bad = np.isnan(numbers) & (raw != '').to_numpy()
+    return numbers, bad
+
+
+# Collect diagnostics for the bad cells of a melted block in one go
+def collect_errors(bad, row_numbers, columns, raw_values):
+    positions = np.flatnonzero(bad)
+    return [
+        {'row': int(row_numbers[pos]), 'column': columns[pos], 'value': raw_values[pos]}
+        for pos in positions
+    ]
+
+
+# Melt the value columns of a wide sheet into long form (row-major, so each
+# sector's periods stay contiguous and in header order). `first_row` is the
+# sheet row number of the frame's first row, for the diagnostics.
+def melt_wide(frame, id_columns, value_columns, first_row=2):
+    n_rows, n_values = len(frame), len(value_columns)
+    raw = frame[value_columns].to_numpy(dtype=object).ravel()
+    numbers, bad = to_numeric(raw)
+    row_numbers = np.repeat(np.arange(n_rows) + first_row, n_values)
+    columns = np.tile(np.asarray(value_columns, dtype=object), n_rows)
+    errors = collect_errors(bad, row_numbers, columns, raw)
+
+    keep = ~np.isnan(numbers)
+    ids = {column: np.repeat(frame[column].to_numpy(dtype=object), n_values)[keep] for column in id_columns}
+    column_index = np.tile(np.arange(n_values), n_rows)[keep]
+    return ids, column_index, numbers[keep], errors
+
+
+# Parse an annual sheet. Accepts either the wide layout
+# (Sector, Sub-Sector, 2015, 2016, ...) or the long layout
+# (Sector, Sub-Sector, Year, GDP).
+def parse_annual_file(file_path):
+    return parse_annual_frame(read_sheet(file_path))
+
+
+# Parse rows of an annual sheet read as strings. Row 2 is the first row
+# below the header (see melt_wide).
+def parse_annual_frame(frame, first_row=2):
+    headers = list(frame.columns)
+    sector_column, sub_sector_column = headers[0], headers[1]
+    value_columns = headers[2:]
+
+    if value_columns and all(YEAR_HEADER.match(column) for column in value_columns):
+        ids, column_index, gdp, errors = melt_wide(frame, [sector_column, sub_sector_column], value_columns, first_row)
+        header_years = np.array([int(column) for column in value_columns], dtype=np.int32)
+        result = pd.DataFrame({
+            'sector': ids[sector_column],
+            'sub_sector': ids[sub_sector_column],
+            'year': header_years[column_index],
+            'gdp': gdp,
+        })
+        return ParseResult(result, errors)
+
+    if len(headers) < 4:
+        raise ValueError("CSV file format is incorrect. Expected year columns or 'Sector, Sub-Sector, Year, GDP' columns.")
+
+    year_raw = frame[headers[2]].to_numpy(dtype=object)
+    gdp_raw = frame[headers[3]].to_numpy(dtype=object)
+    years, bad_years = to_numeric(year_raw)
+    gdp, bad_gdp = to_numeric(gdp_raw)
+    row_numbers = np.arange(len(frame)) + first_row
+    errors = (
+        collect_errors(bad_years, row_numbers, [headers[2]] * len(frame), year_raw)
+        + collect_errors(bad_gdp, row_numbers, [headers[3]] * len(frame), gdp_raw)
+    )
+    keep = ~(np.isnan(years) | np.isnan(gdp))
+    result = pd.DataFrame({
+        'sector': frame[sector_column].to_numpy(dtype=object)[keep],
+        'sub_sector': frame[sub_sector_column].to_numpy(dtype=object)[keep],
+        'year': years[keep].astype(np.int32),
+        'gdp': gdp[keep],
+    })
+    return ParseResult(result, errors)
+
+
+# Work out (year, quarter) for every value column of a quarterly sheet.
+# Headers may be labelled ("2015 Q1", "2015-Q1", "Q1 2015"); otherwise the
+# first header must be the start year and columns run Q1..Q4 from there.
+def quarterly_periods(value_columns):
+    periods = []
+    for column in value_columns:
+        match = YEAR_QUARTER_HEADER.match(column)
+        if match:
+            periods.append((int(match.group(1)), int(match.group(2))))
+            continue
+        match = QUARTER_YEAR_HEADER.match(column)
+        if match:
+            periods.append((int(match.group(2)), int(match.group(1))))
+            continue
+        break
+    else:
+        return periods
+
+    match = YEAR_HEADER.match(value_columns[0]) if value_columns else None
+    if not match:
+        raise ValueError("CSV file format is incorrect. Expected quarter columns such as '2015 Q1' or a start year.")
+    start_year = int(match.group(1))
+    return [(start_year + index // 4, index % 4 + 1) for index in range(len(value_columns))]
+
+
+# Parse a wide quarterly sheet (Sector, <period>, <period>, ...)
+def parse_quarterly_file(file_path):
+    return parse_quarterly_frame(read_sheet(file_path))
+
+
+def parse_quarterly_frame(frame, first_row=2):
+    headers = list(frame.columns)
+    value_columns = headers[1:]
+    periods = np.array(quarterly_periods(value_columns), dtype=np.int32).reshape(-1, 2)
+
+    ids, column_index, gdp, errors = melt_wide(frame, [headers[0]], value_columns, first_row)
+    result = pd.DataFrame({
+        'sector': ids[headers[0]],
+        'year': periods[column_index, 0],
+        'quarter': periods[column_index, 1],
+        'gdp': gdp,
+    })
+    return ParseResult(result, errors)
+
+
+# Iterate a parsed frame as tuples of native Python values (the DB driver
+# does not accept numpy scalars)
+def iter_rows(frame, *extra_values):
+    columns = [frame[column].tolist() for column in frame.columns]
+    for row in zip(*columns):
+        yield row + extra_values
@@ -0,0 +1,167 @@
+import json
+import os
+import shutil
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import frappe
+from gdp_forecasting.gdp_forecasting.delta_upload import DATASET_KEYS
+
+# Columnar snapshot of each uploaded dataset, written under the site's
+# private files on every upload so forecast runs can load the data without
+# querying the database:
+#
+#   private/files/gdp_forecasting/snapshots/<annual|quarterly>/
+#       current.json            -> {"version": "20240101120000000000"}
+#       <version>/manifest.json    row count, dtypes, string dictionaries
+#       <version>/<column>.npy     one array per column
+#
+# Numeric columns are memory-mapped read-only, so loading costs no copy.
+# String columns are dictionary-encoded as int32 codes. The version is the
+# upload timestamp. Forecasters read it through forecast_scripts.data_access,
+# which falls back to the database when the snapshot is missing or unreadable.
+SNAPSHOT_FORMAT = 1
+KEEP_VERSIONS = 2
+STRING_COLUMNS = ('sector', 'sub_sector')
+NUMERIC_DTYPES = {'year': np.int32, 'quarter': np.int32, 'gdp': np.float64}
+
+
+def snapshot_root(dataset_type):
+    return frappe.get_site_path('private', 'files', 'gdp_forecasting', 'snapshots', dataset_type.lower())
+
+
+def snapshot_version(timestamp):
+    return timestamp.strftime('%Y%m%d%H%M%S%f')
+
+
+def snapshot_columns(dataset_type):
+    spec = DATASET_KEYS[dataset_type]
+    return spec['keys'] + [spec['value']]
+
+
+# Write the stored state of a dataset after an upload: `frame` is the parsed
+# upload, deduplicated the way the upsert resolves repeated keys (last row
+# wins) and sorted on the table's key
+def write_snapshot(frame, dataset_type, timestamp):
+    keys = DATASET_KEYS[dataset_type]['keys']
+    columns = snapshot_columns(dataset_type)
+    frame = frame[columns].drop_duplicates(subset=keys, keep='last').sort_values(keys, kind='stable')
+
+    root = snapshot_root(dataset_type)
+    version = snapshot_version(timestamp)
+    temp_dir = os.path.join(root, f".{version}.{os.getpid()}.tmp")
+    shutil.rmtree(temp_dir, ignore_errors=True)
+    os.makedirs(temp_dir)
+
+    manifest = {
+        'format': SNAPSHOT_FORMAT,
+        'dataset_type': dataset_type,
+        'version': version,
+        'upload_timestamp': str(timestamp),
+        'rows': len(frame),
+        'columns': {},
+    }
+    for column in columns:
+        if column in STRING_COLUMNS:
+            codes, categories = pd.factorize(frame[column].fillna(''), sort=True)
+            values = codes.astype(np.int32)
+            manifest['columns'][column] = {'dtype': 'category', 'categories': [str(value) for value in categories]}
+        elif column == 'gdp':
+            # Round through single precision to match the FLOAT column, so
+            # the snapshot and the database give the same series
+            values = frame[column].to_numpy(dtype=np.float32).astype(np.float64)
+            manifest['columns'][column] = {'dtype': 'float64'}
+        else:
+            values = frame[column].to_numpy(dtype=NUMERIC_DTYPES[column])
+            manifest['columns'][column] = {'dtype': np.dtype(NUMERIC_DTYPES[column]).name}
+        np.save(os.path.join(temp_dir, f"{column}.npy"), np.ascontiguousarray(values))
+    with open(os.path.join(temp_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f)
+
+    version_dir = os.path.join(root, version)
+    shutil.rmtree(version_dir, ignore_errors=True)
+    os.replace(temp_dir, version_dir)
+    write_pointer(root, version)
+    prune_versions(root, version)
+    return manifest
+
+
+def write_pointer(root, version):
+    temp_path = os.path.join(root, f".current.{os.getpid()}.tmp")
+    with open(temp_path, 'w') as f:
+        json.dump({'version': version}, f)
+    os.replace(temp_path, os.path.join(root, 'current.json'))
+
+
+# Keep the newest versions only. A run still reading an older version keeps
+# working: its memory maps stay valid after the files are unlinked.
+def prune_versions(root, current):
+    versions = sorted(name for name in os.listdir(root) if name.isdigit() and name != current)
+    for name in versions[:max(len(versions) - (KEEP_VERSIONS - 1), 0)]:
+        shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+
+def current_version(dataset_type):
+    try:
+        with open(os.path.join(snapshot_root(dataset_type), 'current.json')) as f:
+            return json.load(f)['version']
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+# Map the current snapshot (or some of its columns) as a DataFrame, or
+# return None if there is none
+def read_snapshot(dataset_type, columns=None):
+    version = current_version(dataset_type)
+    if not version:
+        return None
+    version_dir = os.path.join(snapshot_root(dataset_type), version)
+    try:
+        with open(os.path.join(version_dir, 'manifest.json')) as f:
+            manifest = json.load(f)
+        if manifest.get('format') != SNAPSHOT_FORMAT:
+            return None
+        data = {}
+        for column in columns or snapshot_columns(dataset_type):
+            values = np.load(os.path.join(version_dir, f"{column}.npy"), mmap_mode='r')
+            if len(values) != manifest['rows']:
+                return None
+            spec = manifest['columns'][column]
+            if spec['dtype'] == 'category':
+                # Decoded to plain strings: the sector names are few, and
+                # the loaders filter and group on them as ordinary values
+                values = np.asarray(spec['categories'], dtype=object)[values]
+            data[column] = values
+    except (OSError, ValueError, KeyError):
+        frappe.logger("gdp_forecasting").warning(f"Unreadable {dataset_type} snapshot {version}, using the database")
+        return None
+    return pd.DataFrame(data, copy=False)
+
+
+# Dataset rows from its table, or from `table` (a copy with the same columns)
+def load_from_db(dataset_type, table=None):
+    columns = snapshot_columns(dataset_type)
+    column_sql = ", ".join(f"`{column}`" for column in columns)
+    rows = frappe.db.sql(f"SELECT {column_sql} FROM `{table or DATASET_KEYS[dataset_type]['table']}`")
+    return pd.DataFrame(list(rows), columns=columns)
+
+
+# Write a snapshot after an upload. A failure only costs the next forecast
+# run a database read, so it is logged rather than failing the upload.
+def refresh_snapshot(frame, dataset_type, timestamp):
+    try:
+        return write_snapshot(frame, dataset_type, timestamp)
+    except OSError as e:
+        frappe.log_error(f"Could not write the {dataset_type} dataset snapshot: {e}", "GDP Dataset Snapshot Error")
+
+
+# Snapshot the current table contents, e.g. for data loaded before snapshots
+# existed:
+#   bench --site <site> execute gdp_forecasting.gdp_forecasting.dataset_snapshot.rebuild_snapshots
+def rebuild_snapshots():
+    rows = {}
+    for dataset_type in DATASET_KEYS:
+        frame = load_from_db(dataset_type)
+        if len(frame):
+            rows[dataset_type] = write_snapshot(frame, dataset_type, datetime.now())['rows']
+    return rows
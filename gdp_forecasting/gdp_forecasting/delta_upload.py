@@ -0,0 +1,160 @@
+import time
+import numpy as np
+import pandas as pd
+import frappe
+from gdp_forecasting.gdp_forecasting.bulk_ingest import bulk_insert
+from gdp_forecasting.gdp_forecasting.dataset_parser import iter_rows
+
+# Natural key and value column of each uploadable dataset
+DATASET_KEYS = {
+    'Annual': {'table': 'tabAnnual Dataset', 'keys': ['sector', 'sub_sector', 'year'], 'value': 'gdp'},
+    'Quarterly': {'table': 'tabQuarterly Dataset', 'keys': ['sector', 'year', 'quarter'], 'value': 'gdp'},
+}
+
+CHANGE_LOG_TABLE = 'tabGDP Dataset Change'
+
+# Keys per DELETE ... WHERE (k1, k2, k3) IN (...) statement
+DELETE_BATCH_SIZE = 1000
+
+# GDP columns are single-precision FLOAT, so compare with a relative tolerance
+VALUE_TOLERANCE = 1e-6
+
+
+# Give key and value columns the same dtypes on both sides of the diff
+def normalize_frame(frame, keys, value):
+    dtypes = {key: (np.int64 if key in ('year', 'quarter') else object) for key in keys}
+    dtypes[value] = np.float64
+    return frame[keys + [value]].astype(dtypes)
+
+
+# Load the stored rows of a dataset keyed on its natural key
+def load_stored_rows(dataset_type):
+    spec = DATASET_KEYS[dataset_type]
+    columns = spec['keys'] + [spec['value']]
+    column_sql = ", ".join(f"`{column}`" for column in columns)
+    rows = frappe.db.sql(f"SELECT {column_sql} FROM `{spec['table']}`")
+    return normalize_frame(pd.DataFrame(list(rows), columns=columns), spec['keys'], spec['value'])
+
+
+# Diff an incoming long-form frame against the stored rows. Returns the
+# inserted, updated and deleted rows as DataFrames.
+def diff_dataset(incoming, stored, keys, value):
+    incoming = normalize_frame(incoming, keys, value).drop_duplicates(subset=keys, keep='last')
+
+    # Stored rows may contain duplicate keys from older full reloads; any such
+    # key is rewritten so the table ends up with one row per key
+    stored_counts = stored.groupby(keys, sort=False).size().rename('stored_count').reset_index()
+    stored = stored.drop_duplicates(subset=keys, keep='last').merge(stored_counts, on=keys)
+
+    merged = incoming.merge(
+        stored, on=keys, how='outer', suffixes=('', '_stored'), indicator=True
+    )
+    inserted = merged[merged['_merge'] == 'left_only']
+    deleted = merged[merged['_merge'] == 'right_only']
+    both = merged[merged['_merge'] == 'both']
+
+    new_values = both[value].to_numpy(dtype=np.float64)
+    old_values = both[f'{value}_stored'].to_numpy(dtype=np.float64)
+    changed = ~np.isclose(new_values, old_values, rtol=VALUE_TOLERANCE, atol=0, equal_nan=True)
+    updated = both[changed | (both['stored_count'].to_numpy() > 1)]
+
+    return inserted, updated, deleted
+
+
+# Delete rows by natural key in batches of row-constructor IN lists
+def delete_keys(table, keys, key_rows):
+    key_sql = ", ".join(f"`{key}`" for key in keys)
+    placeholder = "(" + ", ".join(["%s"] * len(keys)) + ")"
+    key_rows = list(key_rows)
+    for start in range(0, len(key_rows), DELETE_BATCH_SIZE):
+        batch = key_rows[start:start + DELETE_BATCH_SIZE]
+        frappe.db.sql(
+            f"DELETE FROM `{table}` WHERE ({key_sql}) IN ({', '.join([placeholder] * len(batch))})",
+            [value for row in batch for value in row]
+        )
+
+
+# Record which natural keys changed in this upload (committed unless
+# commit=False)
+def record_changes(dataset_type, value, changes, timestamp, commit=True):
+    def change_rows():
+        for change_type, frame in changes.items():
+            if frame.empty:
+                continue
+            old_values = frame[f'{value}_stored'].astype(object).where(frame[f'{value}_stored'].notna(), None)
+            new_values = frame[value].astype(object).where(frame[value].notna(), None)
+            sub_sectors = frame['sub_sector'].tolist() if 'sub_sector' in frame else [None] * len(frame)
+            quarters = frame['quarter'].tolist() if 'quarter' in frame else [None] * len(frame)
+            for sector, sub_sector, year, quarter, old_gdp, new_gdp in zip(
+                frame['sector'].tolist(), sub_sectors, frame['year'].astype(int).tolist(),
+                quarters, old_values.tolist(), new_values.tolist()
+            ):
+                yield (dataset_type, change_type, sector, sub_sector, year,
+                       int(quarter) if quarter is not None else None, old_gdp, new_gdp, timestamp)
+
+    return bulk_insert(
+        CHANGE_LOG_TABLE, change_rows(),
+        columns=['dataset_type', 'change_type', 'sector', 'sub_sector', 'year', 'quarter',
+                 'old_gdp', 'new_gdp', 'upload_timestamp'],
+        commit=commit
+    )
+
+
+# Apply only the inserts, updates and deletes needed to make the stored
+# dataset match the incoming frame. The deletes, inserts and change-log rows
+# are committed together, or rolled back together if any of them fails.
+def apply_delta_upload(frame, dataset_type, timestamp):
+    spec = DATASET_KEYS[dataset_type]
+    table, keys, value = spec['table'], spec['keys'], spec['value']
+    started = time.perf_counter()
+
+    inserted, updated, deleted = diff_dataset(frame, load_stored_rows(dataset_type), keys, value)
+
+    written = pd.concat([inserted[keys + [value]], updated[keys + [value]]])
+    # Keep the table's column order for the bulk insert
+    written = written[[column for column in frame.columns if column in written.columns]]
+    try:
+        delete_keys(table, keys, iter_rows(pd.concat([updated[keys], deleted[keys]])))
+        ingest_stats = bulk_insert(table, iter_rows(written, timestamp), commit=False)
+        record_changes(dataset_type, value, {'insert': inserted, 'update': updated, 'delete': deleted}, timestamp,
+            commit=False)
+    except Exception:
+        frappe.db.rollback()
+        raise
+    frappe.db.commit()
+
+    elapsed = time.perf_counter() - started
+    stats = {
+        'table': table,
+        'mode': 'incremental',
+        'inserted': len(inserted),
+        'updated': len(updated),
+        'deleted': len(deleted),
+        'rows': ingest_stats['rows'],
+        'seconds': round(elapsed, 4),
+        'rows_per_second': ingest_stats['rows_per_second'],
+    }
+    frappe.logger("gdp_forecasting").info(
+        f"Incremental upload into {table}: {stats['inserted']} inserted, "
+        f"{stats['updated']} updated, {stats['deleted']} deleted"
+    )
+    return stats
+
+
+# Series touched by the most recent upload (or since a given timestamp), so
+# forecasting can refit only what changed
+@frappe.whitelist()
+def get_changed_sectors(dataset_type, since=None):
+    if not since:
+        since = frappe.db.sql(
+            f"SELECT MAX(upload_timestamp) FROM `{CHANGE_LOG_TABLE}` WHERE dataset_type = %s",
+            (dataset_type,)
+        )[0][0]
+        if not since:
+            return []
+    rows = frappe.db.sql(
+        f"""SELECT DISTINCT sector FROM `{CHANGE_LOG_TABLE}`
+            WHERE dataset_type = %s AND upload_timestamp >= %s""",
+        (dataset_type, since)
+    )
+    return [row[0] for row in rows]
@@ -0,0 +1,102 @@
+import time
+import frappe
+from gdp_forecasting.gdp_forecasting.instrumentation import run_log
+
+# Forecast runs are long (Holt-Winters/ARIMA fits per sector), so they go to
+# the long RQ queue and report progress through the Redis cache
+FORECAST_QUEUE = "long"
+FORECAST_TIMEOUT = 3600
+STATUS_KEY_PREFIX = "gdp_forecast_job"
+STATUS_TTL = 24 * 60 * 60
+
+
+def status_key(job_id):
+    return f"{STATUS_KEY_PREFIX}:{job_id}"
+
+
+def get_job_status(job_id):
+    return frappe.cache().get_value(status_key(job_id))
+
+
+def set_job_status(job_id, **values):
+    status = get_job_status(job_id) or {}
+    status.update(values, job_id=job_id)
+    frappe.cache().set_value(status_key(job_id), status, expires_in_sec=STATUS_TTL)
+    return status
+
+
+# Submit a forecast run and return its job id. The warm forecasting daemon
+# takes it when one is running (see forecast_scripts.forecast_daemon);
+# otherwise it goes to the background queue. `profile` keeps a sampling
+# profile of the run in its run log (see instrumentation).
+def enqueue_forecast(forecast_type, profile=None):
+    from gdp_forecasting.forecast_scripts import forecast_daemon
+
+    job_id = frappe.generate_hash(length=12)
+    set_job_status(
+        job_id,
+        forecast_type=forecast_type,
+        status="queued",
+        queued_at=time.time(),
+        sectors={},
+        completed=0,
+        total=None,
+        runner="daemon",
+        profile=profile,
+    )
+    if forecast_daemon.submit(job_id, forecast_type):
+        return job_id
+    set_job_status(job_id, runner="rq")
+    frappe.enqueue(
+        "gdp_forecasting.gdp_forecasting.forecast_jobs.run_forecast_job",
+        queue=FORECAST_QUEUE,
+        timeout=FORECAST_TIMEOUT,
+        job_name=f"GDP forecast: {forecast_type}",
+        tracking_id=job_id,
+        forecast_type=forecast_type,
+    )
+    return job_id
+
+
+# Per-sector progress callback handed to the forecasters
+def progress_reporter(job_id):
+    def report(sector, completed, total):
+        status = get_job_status(job_id) or {}
+        sectors = status.get("sectors") or {}
+        sectors[sector] = "done"
+        set_job_status(job_id, sectors=sectors, completed=completed, total=total, current_sector=sector)
+    return report
+
+
+# RQ entry point
+def run_forecast_job(tracking_id, forecast_type):
+    from gdp_forecasting.gdp_forecasting.gdp_forecasting import execute_forecast
+    from gdp_forecasting.gdp_forecasting.report.gdp_forecasting.gdp_forecasting import clear_report_cache
+
+    started = time.time()
+    status = set_job_status(tracking_id, status="running", started_at=started)
+    queued_at = status.get("queued_at")
+    try:
+        with run_log("forecast", forecast_type, run_id=tracking_id, profile=status.get("profile"),
+                     runner=status.get("runner"),
+                     queue_seconds=round(started - queued_at, 2) if queued_at else None):
+            execute_forecast(forecast_type, progress_callback=progress_reporter(tracking_id))
+    except Exception as e:
+        frappe.log_error(message=frappe.get_traceback(), title="Forecast Script Error")
+        set_job_status(tracking_id, status="failed", error=str(e), finished_at=time.time(),
+                       elapsed=round(time.time() - started, 2))
+        raise
+    # Cached report pages now show stale forecasts
+    clear_report_cache()
+    set_job_status(tracking_id, status="completed", finished_at=time.time(),
+                   elapsed=round(time.time() - started, 2))
+
+
+@frappe.whitelist()
+def get_forecast_status(job_id):
+    status = get_job_status(job_id)
+    if not status:
+        frappe.throw(f"Unknown forecast job {job_id}.", title="Error")
+    if status.get("status") == "running" and status.get("started_at"):
+        status["elapsed"] = round(time.time() - status["started_at"], 2)
+    return status
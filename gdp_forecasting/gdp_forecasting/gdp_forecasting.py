@@ -3,18 +3,31 @@
 
 import frappe
 from frappe import _
+from frappe.utils import cint
 from datetime import datetime
 import csv
 import os
-import subprocess
 import ast
 from frappe.model.document import Document
+from gdp_forecasting.gdp_forecasting.base_manifest import is_unchanged, load_manifest, open_rows, record_load, source_digest
+from gdp_forecasting.gdp_forecasting.bulk_ingest import bulk_insert, bulk_insert_csv_rows, upsert_columns
+from gdp_forecasting.forecast_scripts import registry
+from gdp_forecasting.gdp_forecasting.instrumentation import run_log, span
 
 class GDPForecasting(Document):
 	pass
 
+# Every upload is recorded in the run log (see instrumentation); `profile`
+# also keeps a sampling profile of it
 @frappe.whitelist()
-def upload_file(file, use_existing, dataset_type):
+def upload_file(file, use_existing, dataset_type, upload_mode='replace', profile=None):
+    with run_log('upload', dataset_type, profile=profile, upload_mode=upload_mode) as fields:
+        result = upload_dataset_files(file, dataset_type, upload_mode)
+        fields['rows'] = result['ingest'].get('rows')
+    return result
+
+
+def upload_dataset_files(file, dataset_type, upload_mode='replace'):
     file_path = ast.literal_eval(file)
     file = frappe.get_site_path('private', "files", file_path[0].split('/')[-1])
 
@@ -22,7 +35,7 @@ def upload_file(file, use_existing, dataset_type):
     if not os.path.exists(file):
         raise FileNotFoundError(f"No such file or directory: '{file}'")
 
-    success = handle_uploaded_file(file, dataset_type)
+    ingest_stats = handle_uploaded_file(file, dataset_type, upload_mode)
     file_paths = [
     '/private/files' + file_path[1] if file_path[1].strip() else None,
     '/private/files' + file_path[2] if file_path[2].strip() else None,
@@ -30,185 +43,147 @@ def upload_file(file, use_existing, dataset_type):
     '/private/files' + file_path[4] if file_path[4].strip() else None
     ]
     print(file_paths)
-    upload_base_datasets(
-            file_paths[0], 
-            file_paths[1], 
-            file_paths[2], 
-            file_paths[3], 
-            use_existing_gdp_file=1, 
-            use_existing_workforce_file=1, 
-            use_existing_annual_growth_file=1, 
-            use_existing_quarterly_growth_file=1)
-    if success:
+    with span('base datasets') as fields:
+        base_datasets = upload_base_datasets(
+                file_paths[0], 
+                file_paths[1], 
+                file_paths[2], 
+                file_paths[3], 
+                use_existing_gdp_file=1, 
+                use_existing_workforce_file=1, 
+                use_existing_annual_growth_file=1, 
+                use_existing_quarterly_growth_file=1)
+        fields.update(loaded=len(base_datasets['loaded']), skipped=len(base_datasets['skipped']))
+    if ingest_stats:
         frappe.msgprint(_("Data uploaded successfully!"), indicator="green", alert=True)
-        return {"status": "success"}
+        return {"status": "success", "ingest": ingest_stats, "base_datasets": base_datasets}
     else:
         frappe.throw(_("Failed to upload data. Please try again."), title="Upload Error")
 
 
-def handle_uploaded_file(file, dataset_type):
-    success = False
+# Short human-readable summary of an ingest for the upload alert
+def upload_summary(ingest_stats):
+    if ingest_stats.get('mode') == 'incremental':
+        return (f"({ingest_stats['inserted']} inserted, {ingest_stats['updated']} updated, "
+                f"{ingest_stats['deleted']} deleted)")
+    return f"({ingest_stats['rows']} rows, {ingest_stats['rows_per_second']} rows/s)"
+
+
+def handle_uploaded_file(file, dataset_type, upload_mode='replace'):
+    # pandas-backed helpers are imported here, not at module level, so the
+    # forecast endpoints in this module stay cheap to import
+    from gdp_forecasting.gdp_forecasting.dataset_parser import iter_rows
+    from gdp_forecasting.gdp_forecasting.delta_upload import apply_delta_upload
+    from gdp_forecasting.gdp_forecasting.dataset_snapshot import refresh_snapshot
+
+    ingest_stats = None
     timestamp = datetime.now()
-    # Check and create the "annual_dataset" table if it does not exist
+    # Tables are created on install and migrated by patches (see schema.py)
     if dataset_type == 'Annual':
-        frappe.db.sql("""
-            CREATE TABLE IF NOT EXISTS `tabAnnual Dataset` (
-                `sector` VARCHAR(255),
-                `sub_sector` VARCHAR(255),
-                `year` INT,
-                `gdp` FLOAT,
-                `upload_timestamp` DATETIME
-            )
-        """)
-
         try:
-            # Clear existing records
-            frappe.db.sql("TRUNCATE TABLE `tabAnnual Dataset`")
+            with span('parse') as fields:
+                processed_data, parse_errors = process_annual_file(file)
+                fields.update(rows=len(processed_data), errors=len(parse_errors))
+            log_parse_errors(parse_errors, dataset_type)
 
-            # Process and insert data
-            processed_data = process_annual_file(file)
-            for sector, sub_sector, year, gdp in processed_data:
-                frappe.db.sql("""
-                INSERT INTO `tabAnnual Dataset` (sector, sub_sector, year, gdp, upload_timestamp)
-                VALUES (%s, %s, %s, %s, %s)
-            """, (sector, sub_sector, year, gdp, timestamp))
-            
-            frappe.db.commit()
-            frappe.msgprint("Annual data uploaded successfully!", indicator="green", alert=True)
-            success = True
+            with span('ingest', mode=upload_mode) as fields:
+                if upload_mode == 'incremental':
+                    # Apply only the changed sector-periods
+                    ingest_stats = apply_delta_upload(processed_data, dataset_type, timestamp)
+                else:
+                    # Clear existing records and insert data; a key repeated in the
+                    # sheet keeps its last value
+                    frappe.db.sql("TRUNCATE TABLE `tabAnnual Dataset`")
+                    ingest_stats = bulk_insert('tabAnnual Dataset', iter_rows(processed_data, timestamp),
+                        update_columns=upsert_columns('tabAnnual Dataset'))
+                fields['rows'] = len(processed_data)
+            # Forecast runs load the dataset from this snapshot
+            with span('snapshot'):
+                refresh_snapshot(processed_data, dataset_type, timestamp)
+            frappe.msgprint(f"Annual data uploaded successfully! {upload_summary(ingest_stats)}",
+                indicator="green", alert=True)
         except Exception as e:
             frappe.log_error(f"Error processing annual file: {e}", "Annual File Upload Error")
             frappe.throw("Failed to upload annual data.")
-            success = False
 
-    # Check and create the "quarterly_dataset" table if it does not exist
     elif dataset_type == 'Quarterly':
-        frappe.db.sql("""
-            CREATE TABLE IF NOT EXISTS `tabQuarterly Dataset` (
-                `sector` VARCHAR(255),
-                `year` INT,
-                `quarter` INT,
-                `gdp` FLOAT,
-                `upload_timestamp` DATETIME
-            )
-        """)
-
         try:
-            # Clear existing records
-            frappe.db.sql("TRUNCATE TABLE `tabQuarterly Dataset`")
-
-            # Process and insert data
-            processed_data = process_quarterly_file(file)
-            for sector, year, quarter, gdp in processed_data:
-                frappe.db.sql("""
-                INSERT INTO `tabQuarterly Dataset` (sector, year, quarter, gdp, upload_timestamp)
-                VALUES (%s, %s, %s, %s, %s)
-            """, (sector, year, quarter, gdp, timestamp))
+            with span('parse') as fields:
+                processed_data, parse_errors = process_quarterly_file(file)
+                fields.update(rows=len(processed_data), errors=len(parse_errors))
+            log_parse_errors(parse_errors, dataset_type)
 
-            frappe.db.commit()
-            frappe.msgprint("Quarterly data uploaded successfully!", indicator="green", alert=True)
-            success = True
+            with span('ingest', mode=upload_mode) as fields:
+                if upload_mode == 'incremental':
+                    # Apply only the changed sector-periods
+                    ingest_stats = apply_delta_upload(processed_data, dataset_type, timestamp)
+                else:
+                    # Clear existing records and insert data; a key repeated in the
+                    # sheet keeps its last value
+                    frappe.db.sql("TRUNCATE TABLE `tabQuarterly Dataset`")
+                    ingest_stats = bulk_insert('tabQuarterly Dataset', iter_rows(processed_data, timestamp),
+                        update_columns=upsert_columns('tabQuarterly Dataset'))
+                fields['rows'] = len(processed_data)
+            # Forecast runs load the dataset from this snapshot
+            with span('snapshot'):
+                refresh_snapshot(processed_data, dataset_type, timestamp)
+            frappe.msgprint(f"Quarterly data uploaded successfully! {upload_summary(ingest_stats)}",
+                indicator="green", alert=True)
         except Exception as e:
             frappe.log_error(f"Error processing quarterly file: {e}", "Quarterly File Upload Error")
             frappe.throw("Failed to upload quarterly data.")
-            success = False
 
-    return success
+    return ingest_stats
 
 
+# Parse an annual sheet into a long-form DataFrame plus bad-cell diagnostics
 def process_annual_file(file_path):
-    processed_data = []
-    with open(file_path, mode='r', encoding='utf-8') as file:
-        reader = csv.reader(file)
-        
-        # Read the header
-        headers = next(reader)
-        
-        # Verify headers
-        if headers[0] != 'Sector':
-            raise ValueError("CSV file format is incorrect. Expected headers starting with 'Sector' and year columns starting from '2015'.")
-        
-        # Process each row
-        for row in reader:
-            sector = row[0]
-            sub_sector = row[1]
-            for year, gdp in zip(headers[2:], row[2:]):
-                try:
-                    year = int(row[2])  # Use the header year for each column
-                    gdp = float(row[3].replace(',', ''))
-                    processed_data.append((sector, sub_sector, year, gdp))
-                except ValueError as err:
-                    print(f"Skipping row due to error: {err}")
-                    continue  # Skip rows with invalid data
+    from gdp_forecasting.gdp_forecasting.dataset_parser import parse_annual_file
+    return parse_annual_file(file_path)
 
-    return processed_data
+# Parse a quarterly sheet; periods are taken from the header row
+def process_quarterly_file(file_path):
+    from gdp_forecasting.gdp_forecasting.dataset_parser import parse_quarterly_file
+    return parse_quarterly_file(file_path)
 
-def process_quarterly_file(file):
-    processed_data = []
-    with open(file, mode='r', encoding='utf-8') as file:
-        reader = csv.reader(file)
-    
-        # Read the header
-        headers = next(reader)
-        
-        # Verify headers
-        if headers[0] != 'Sector':
-            raise ValueError("CSV file format is incorrect. Expected headers starting with 'Sector' and '2015'.")
-        
-        # Parse the data rows
-        for row in reader:
-            sector = row[0]
-            year = 2015  # Start year
-            quarter_index = 1
-            for gdp in row[1:]:
-                try:
-                    gdp = float(gdp.replace(',', ''))
-                    processed_data.append((sector, year, quarter_index, gdp))
-                    quarter_index += 1
-                    if quarter_index > 4:
-                        quarter_index = 1
-                        year += 1
-                except ValueError:
-                    continue  # Skip rows with invalid data
-    
-    return processed_data
+# Record all unparsable cells of an upload as a single error log entry
+def log_parse_errors(errors, dataset_type):
+    if not errors:
+        return
+    preview = "\n".join(
+        f"row {error['row']}, column {error['column']}: {error['value']!r}" for error in errors[:200]
+    )
+    frappe.log_error(
+        f"{len(errors)} cells skipped while parsing the {dataset_type} file:\n{preview}",
+        f"{dataset_type} File Parse Warnings"
+    )
 
-@frappe.whitelist()
-def run_forecast_script(forecast_type):
-    from gdp_forecasting.forecast_scripts.holt_winters_quarterly import main
-    from gdp_forecasting.forecast_scripts.holt_winters_annual import main_annual
-    try:
-        if forecast_type == 'annual_arima':
-            script_path = os.path.join(os.path.dirname(__file__), 'forecast_scripts', 'arima_annual.py')
-        elif forecast_type == 'quarterly_arima':
-            script_path = os.path.join(os.path.dirname(__file__), 'forecast_scripts', 'arima_quarterly.py')
-        elif forecast_type == 'Annual Forecast (Holt-Winters)':
-            main_annual()
-        elif forecast_type == 'Quarterly Forecast (Holt-Winters )':
-            main()
-        else:
-            frappe.throw('Invalid forecast type selected.', title='Error')  # Show error message
-    
-        # Running the forecast script using subprocess
-        # subprocess.run(['python3', script_path], check=True)
-        frappe.msgprint(
-                msg='<span style="color: white;">Forecast script executed successfully.</span>',
-                indicator="green",
-                alert=True)
-        return 'success'
-    except subprocess.CalledProcessError as e:
-        # If subprocess fails, raise error and log to Frappe's error log
-        error_message = f"Error executing the forecast script: {str(e)}"
-        frappe.log_error(message=error_message, title="Forecast Script Error")
-        frappe.throw(f"An error occurred while running the forecast script. Please try again later.", title='Error')
+# Run the selected forecast in the current process. The forecaster's module
+# is imported on first use (see forecast_scripts.registry).
+def execute_forecast(forecast_type, progress_callback=None):
+    if forecast_type not in registry.FORECASTERS:
+        frappe.throw('Invalid forecast type selected.', title='Error')  # Show error message
+    return registry.run_forecaster(forecast_type, progress_callback=progress_callback)
 
-    return 'forecast_success'
+# Queue the selected forecast as a background job; the page polls
+# forecast_jobs.get_forecast_status with the returned job id
+@frappe.whitelist()
+def run_forecast_script(forecast_type, profile=None):
+    from gdp_forecasting.gdp_forecasting.forecast_jobs import enqueue_forecast
+    if forecast_type not in registry.FORECASTERS:
+        frappe.throw('Invalid forecast type selected.', title='Error')
+    job_id = enqueue_forecast(forecast_type, profile=profile)
+    frappe.msgprint(
+            msg='<span style="color: white;">Forecast submitted.</span>',
+            indicator="green",
+            alert=True)
+    return {'status': 'queued', 'job_id': job_id}
 
 @frappe.whitelist()
 def upload_base_datasets(gdp_dataset, workforce_dataset, annual_growth_rates_dataset, 
                           quarterly_growth_rates_dataset, use_existing_gdp_file, 
                           use_existing_workforce_file, use_existing_annual_growth_file, 
-                          use_existing_quarterly_growth_file):
+                          use_existing_quarterly_growth_file, force=0, workers=None, staged=None):
     base_path = frappe.get_app_path('gdp_forecasting', 'base_datasets')
 
     default_gdp_file = os.path.join(base_path, 'gdp.csv')
@@ -220,48 +195,6 @@ def upload_base_datasets(gdp_dataset, workforce_dataset, annual_growth_rates_dat
     workforce_file = workforce_dataset if workforce_dataset else default_workforce_file
     annual_growth_file = annual_growth_rates_dataset if annual_growth_rates_dataset else default_annual_growth_file
     quarterly_growth_file = quarterly_growth_rates_dataset if quarterly_growth_rates_dataset else default_quarterly_growth_file
-    # Open database connection
-    table_creation_commands = {
-            "gdp": """
-                CREATE TABLE IF NOT EXISTS gdp (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
-                    Region VARCHAR(255),
-                    Quarter VARCHAR(50),
-                    Value FLOAT
-                );
-            """,
-            "workforce": """
-                CREATE TABLE IF NOT EXISTS workforce (
-                    id INT PRIMARY KEY,
-                    GOSI_classification VARCHAR(255),
-                    Output_Classification VARCHAR(255),
-                    Quarter VARCHAR(50),
-                    Region VARCHAR(255),
-                    Value FLOAT
-                );
-            """,
-            "Annual_GrowthRates": """
-                CREATE TABLE IF NOT EXISTS Annual_GrowthRates (
-                    Sector VARCHAR(255),
-                    GrowthRate VARCHAR(50),
-                    Year INT,
-                    Value FLOAT
-                );
-            """,
-            "Quarterly_GrowthRates": """
-                CREATE TABLE IF NOT EXISTS Quarterly_GrowthRates (
-                    Sector VARCHAR(255),
-                    GrowthRate VARCHAR(50),
-                    YearQuarter VARCHAR(50),
-                    Value FLOAT
-                );
-            """
-        }
-
-    # Execute table creation commands
-    for command in table_creation_commands.values():
-        frappe.db.sql(command)
-
     # Define tables to truncate and associated CSV files
     tables_and_files = {
         'gdp': gdp_file,
@@ -270,46 +203,70 @@ def upload_base_datasets(gdp_dataset, workforce_dataset, annual_growth_rates_dat
         'Quarterly_GrowthRates': quarterly_growth_file
     }
 
-    # Truncate tables and upload new data
+    # Reload only the tables whose file changed since it was last loaded
+    # (see base_manifest); unchanged ones are skipped. Tables in `staged`
+    # were already streamed into their staging copy by a chunked upload (see
+    # chunked_upload), and only need swapping in.
+    from gdp_forecasting.gdp_forecasting.concurrent_ingest import (
+        drop_staging, get_ingest_workers, ingest_concurrently, swap_in
+    )
+    staged = staged or ()
+    manifest = load_manifest() if not cint(force) else {}
+    changed, sources, skipped = {}, {}, []
     for table, file_obj in tables_and_files.items():
-        frappe.db.sql(f"DELETE FROM `{table}`")
+        digest, source = source_digest(file_obj)
+        if is_unchanged(manifest.get(table), digest):
+            skipped.append(table)
+            if table in staged:
+                drop_staging([table])
+            continue
+        sources[table] = (digest, file_obj)
+        if table not in staged:
+            changed[table] = source
 
-        if isinstance(file_obj, str):  # It's the path to the default file
-            with open(file_obj, 'r') as file:
-                reader = csv.reader(file)
+    loaded = {}
+    swapped = [table for table in staged if table in sources]
+    if swapped:
+        with span('swap in staging tables', tables=len(swapped)):
+            swap_in(swapped)
+        for table in swapped:
+            digest, file_obj = sources[table]
+            loaded[table] = record_load(table, digest, table, file_obj)
+    # With more than one ingest worker (see concurrent_ingest) the tables are
+    # loaded in parallel and replaced together
+    if len(changed) > 1 and get_ingest_workers(workers) > 1:
+        results = ingest_concurrently(changed, workers)
+        for table, stats in results.items():
+            digest, file_obj = sources[table]
+            loaded[table] = record_load(table, digest, stats['table'], file_obj)
+    else:
+        for table, source in changed.items():
+            digest, file_obj = sources[table]
+            with span(f"ingest {table}") as fields, open_rows(source) as reader:
+                if table not in GROWTH_RATE_FILES:
+                    frappe.db.sql(f"DELETE FROM `{table}`")
                 next(reader)  # Skip header row
-                insert_data(table, reader)
-        else:  # It's an uploaded file
-            reader = csv.reader(file_obj.read().decode('utf-8').splitlines())
-            next(reader)  # Skip header row
-            insert_data(table, reader)
+                stats = insert_data(table, reader)
+                fields['rows'] = stats['rows']
+                loaded[table] = record_load(table, digest, stats['table'], file_obj)
+
+    # Rewrite the GDP per worker keys the new gdp / workforce rows changed
+    if 'gdp' in loaded or 'workforce' in loaded:
+        from gdp_forecasting.gdp_forecasting.productivity import refresh_productivity_cube
+        refresh_productivity_cube([table for table in ('gdp', 'workforce') if table in loaded])
+    if skipped:
+        frappe.logger("gdp_forecasting").info(f"Base datasets unchanged, not reloaded: {', '.join(skipped)}")
+    return {'status': 'upload_success', 'loaded': loaded, 'skipped': skipped}
+
 
-    return 'upload_success'
+# Growth-rate sheets and the scenario frequency they define
+GROWTH_RATE_FILES = {'Annual_GrowthRates': 'annual', 'Quarterly_GrowthRates': 'quarterly'}
 
 
+# Bulk load the rows of a base dataset CSV into its table. Growth-rate sheets
+# are stored as base values and scenario rates (see growth_scenarios).
 def insert_data(table, reader):
-    for row in reader:
-        if table == 'gdp':
-            # Insert data for the 'gdp' table
-            frappe.db.sql("""
-                INSERT INTO `gdp` (Region, Quarter, Value)
-                VALUES (%s, %s, %s)
-            """, [row[1], row[2], float(row[3])])
-        elif table == 'workforce':
-            # Insert data for the 'workforce' table
-            frappe.db.sql("""
-                INSERT INTO `workforce` (id, GOSI_classification, Output_Classification, Quarter, Region, Value)
-                VALUES (%s, %s, %s, %s, %s, %s)
-            """, [int(row[0]), row[1], row[2], row[3], row[4], float(row[5])])
-        elif table == 'Annual_GrowthRates':
-            # Insert data for the 'Annual_GrowthRates' table
-            frappe.db.sql("""
-                INSERT INTO `Annual_GrowthRates` (Sector, GrowthRate, Year, Value)
-                VALUES (%s, %s, %s, %s)
-            """, [row[0], row[1], int(row[2]), float(row[3])])
-        elif table == 'Quarterly_GrowthRates':
-            # Insert data for the 'Quarterly_GrowthRates' table
-            frappe.db.sql("""
-                INSERT INTO `Quarterly_GrowthRates` (Sector, GrowthRate, YearQuarter, Value)
-                VALUES (%s, %s, %s, %s)
-            """, [row[0], row[1], row[2], float(row[3])])
\ No newline at end of file
+    if table in GROWTH_RATE_FILES:
+        from gdp_forecasting.gdp_forecasting.growth_scenarios import ingest_growth_rates
+        return ingest_growth_rates(GROWTH_RATE_FILES[table], reader)
+    return bulk_insert_csv_rows(table, reader)
@@ -0,0 +1,356 @@
+import hashlib
+import json
+from collections import defaultdict
+from datetime import datetime
+import numpy as np
+import frappe
+from frappe import _
+from gdp_forecasting.gdp_forecasting.bulk_ingest import CSV_ROW_CONVERTERS, bulk_insert
+from gdp_forecasting.gdp_forecasting.instrumentation import span
+
+# Growth-rate scenarios (LOW, MEDIUM, HIGH, STEADY STATE, ...) are computed
+# on request instead of being stored as one row per sector x scenario x
+# period. Two things are stored:
+#
+#   Annual_GrowthBase / Quarterly_GrowthBase
+#       each sector's actual values, which every scenario shares
+#   GrowthScenarios
+#       each scenario's growth rate per period (per year or per quarter),
+#       for one sector or for every sector (Sector ''), and the last year
+#       its paths run to
+#
+# A scenario path is the sector's actual values followed by its last actual
+# value compounded at the scenario's rate. An uploaded growth-rate sheet is
+# reduced to that form. Its leading periods, where all scenarios agree, are
+# the base. Each scenario's rate is the average compound growth of its
+# remaining values. Custom scenarios added through save_scenario are kept
+# across uploads.
+#
+# Paths for all requested sectors and scenarios are computed at once, as one
+# broadcast power over a sector x scenario x period grid. Results are cached
+# per request until the base or the scenarios change.
+FREQUENCIES = {
+    'annual': {'file': 'Annual_GrowthRates', 'table': 'Annual_GrowthBase', 'periods': ['Year']},
+    'quarterly': {'file': 'Quarterly_GrowthRates', 'table': 'Quarterly_GrowthBase', 'periods': ['Year', 'Quarter']},
+}
+SCENARIO_TABLE = 'GrowthScenarios'
+SCENARIO_COLUMNS = ['Frequency', 'GrowthRate', 'Sector', 'Rate', 'EndYear', 'Custom', 'Modified']
+DEFAULT_END_YEAR = 2030
+CACHE_PREFIX = "gdp_growth_scenarios"
+CACHE_TTL = 60 * 60
+
+
+def check_frequency(frequency):
+    if frequency not in FREQUENCIES:
+        frappe.throw(_("Frequency must be one of {0}").format(", ".join(FREQUENCIES)))
+    return FREQUENCIES[frequency]
+
+
+def base_columns(frequency):
+    return ['Sector'] + FREQUENCIES[frequency]['periods'] + ['Value']
+
+
+# Periods as consecutive integers: the year, or year * 4 + quarter - 1
+def to_ordinal(frequency, year, quarter=None):
+    return int(year) if frequency == 'annual' else int(year) * 4 + int(quarter) - 1
+
+
+def from_ordinal(frequency, ordinal):
+    if frequency == 'annual':
+        return (ordinal,)
+    year, quarter = divmod(ordinal, 4)
+    return year, quarter + 1
+
+
+def end_ordinal(frequency, end_year):
+    return to_ordinal(frequency, end_year, 4)
+
+
+# Base rows and scenario rows for the rows of an uploaded growth-rate sheet,
+# (Sector, GrowthRate, Year[, Quarter], Value). Returns the largest relative
+# gap between a sheet value and its recomputed path, so lossy sheets (rates
+# that change over time) can be spotted in the log.
+def decompose(frequency, rows, modified=None):
+    modified = modified or datetime.now()
+    cells = defaultdict(dict)
+    for row in rows:
+        cells[row[0]][row[1], to_ordinal(frequency, *row[2:-1])] = float(row[-1])
+
+    base, scenarios, max_error = [], [], 0.0
+    for sector, values in cells.items():
+        names = sorted({name for name, ordinal in values})
+        ordinals = sorted({ordinal for name, ordinal in values})
+        grid = np.array([[values.get((name, ordinal), np.nan) for ordinal in ordinals] for name in names])
+        agree = np.all(grid == grid[:1], axis=0)
+        shared = max(len(ordinals) if agree.all() else int(np.argmin(agree)), 1)
+        with np.errstate(invalid='ignore'):
+            history = np.nanmean(grid[:, :shared], axis=0)
+        base.extend(
+            (sector, *from_ordinal(frequency, ordinal), float(value))
+            for ordinal, value in zip(ordinals[:shared], history) if np.isfinite(value)
+        )
+        last = history[-1]
+        end_year = from_ordinal(frequency, ordinals[-1])[0]
+        for name, projected in zip(names, grid[:, shared:]):
+            known = np.flatnonzero(np.isfinite(projected))
+            rate = 0.0
+            if known.size and last > 0 and projected[known[-1]] > 0:
+                rate = (projected[known[-1]] / last) ** (1.0 / (known[-1] + 1)) - 1
+                path = last * (1 + rate) ** (known + 1)
+                max_error = max(max_error, float(np.max(np.abs(path / projected[known] - 1))))
+            scenarios.append((frequency, name, sector, float(rate), end_year, 0, modified))
+    return base, scenarios, max_error
+
+
+# Replace the base and the uploaded (non-custom) scenarios of `frequency`
+# with those of an uploaded growth-rate sheet
+def store_growth_rates(frequency, rows):
+    spec = check_frequency(frequency)
+    with span('decompose', rows=len(rows)) as fields:
+        base, scenarios, max_error = decompose(frequency, rows)
+        fields.update(base_rows=len(base), scenarios=len(scenarios), max_relative_error=round(max_error, 6))
+    frappe.db.sql(f"DELETE FROM `{spec['table']}`")
+    stats = bulk_insert(spec['table'], base, columns=base_columns(frequency))
+    replace_uploaded_scenarios(frequency, scenarios)
+    log_decomposition(spec, rows, base, scenarios, max_error)
+    stats.update(source_rows=len(rows), scenario_rows=len(scenarios), max_relative_error=max_error)
+    return stats
+
+
+def replace_uploaded_scenarios(frequency, scenarios):
+    frappe.db.sql(f"DELETE FROM `{SCENARIO_TABLE}` WHERE `Frequency` = %s AND `Custom` = 0", (frequency,))
+    bulk_insert(SCENARIO_TABLE, scenarios, columns=SCENARIO_COLUMNS,
+        update_columns=['Rate', 'EndYear', 'Custom', 'Modified'])
+    clear_scenario_cache()
+
+
+def log_decomposition(spec, rows, base, scenarios, max_error):
+    frappe.logger("gdp_forecasting").info(
+        f"{spec['file']}: {len(rows)} rows stored as {len(base)} base values and {len(scenarios)} "
+        f"scenario rates (largest relative error {max_error:.2e})"
+    )
+
+
+# Ingest the CSV rows of an Annual_GrowthRates / Quarterly_GrowthRates sheet
+def ingest_growth_rates(frequency, reader):
+    convert = CSV_ROW_CONVERTERS[check_frequency(frequency)['file']]
+    return store_growth_rates(frequency, [convert(row) for row in reader])
+
+
+# Load the base of a growth-rate sheet into `base_table`, a staging copy of
+# the base table (see concurrent_ingest). The scenario rows are returned in
+# the stats, to be stored with replace_uploaded_scenarios once the copy has
+# replaced the base table.
+def stage_growth_rates(frequency, reader, base_table):
+    spec = check_frequency(frequency)
+    convert = CSV_ROW_CONVERTERS[spec['file']]
+    rows = [convert(row) for row in reader]
+    base, scenarios, max_error = decompose(frequency, rows)
+    stats = bulk_insert(base_table, base, columns=base_columns(frequency))
+    log_decomposition(spec, rows, base, scenarios, max_error)
+    stats.update(source_rows=len(rows), scenario_rows=len(scenarios), max_relative_error=max_error,
+        scenarios=scenarios)
+    return stats
+
+
+def in_condition(column, values, params):
+    keys = [f"{column.lower()}_{index}" for index in range(len(values))]
+    params.update(zip(keys, values))
+    return f"`{column}` IN ({', '.join(f'%({key})s' for key in keys)})"
+
+
+def load_base(frequency, sectors=None):
+    spec = FREQUENCIES[frequency]
+    params, where = {}, ""
+    if sectors:
+        where = "WHERE " + in_condition('Sector', sectors, params)
+    return frappe.db.sql(
+        f"""SELECT {', '.join(f'`{column}`' for column in base_columns(frequency))} FROM `{spec['table']}` {where}
+            ORDER BY `Sector`""",
+        params
+    )
+
+
+def load_scenarios(frequency, names=None):
+    params, conditions = {'frequency': frequency}, ["`Frequency` = %(frequency)s"]
+    if names:
+        conditions.append(in_condition('GrowthRate', names, params))
+    return frappe.db.sql(
+        f"""SELECT `GrowthRate`, `Sector`, `Rate`, `EndYear`, `Custom` FROM `{SCENARIO_TABLE}`
+            WHERE {' AND '.join(conditions)} ORDER BY `GrowthRate`, `Sector`""",
+        params
+    )
+
+
+# Scenario paths as flat arrays (sector, scenario, period ordinal, value),
+# ordered by sector (as in `base_rows`), scenario and period. A scenario applies to a sector
+# through its own rate for that sector, else its every-sector rate.
+def compute_paths(frequency, base_rows, scenario_rows):
+    empty = (np.array([], dtype=object), np.array([], dtype=object), np.array([], dtype=np.int64), np.array([]))
+    if not base_rows or not scenario_rows:
+        return empty
+    columns = list(zip(*base_rows))
+    # Sectors numbered in order of appearance (load_base sorts them)
+    sector_index = {}
+    rows = np.fromiter(
+        (sector_index.setdefault(sector, len(sector_index)) for sector in columns[0]),
+        dtype=np.int64, count=len(base_rows)
+    )
+    sectors = np.array(list(sector_index), dtype=object)
+    names = sorted({row[0] for row in scenario_rows})
+    name_index = {name: index for index, name in enumerate(names)}
+
+    ordinals = np.asarray(columns[1], dtype=np.int64)
+    if frequency == 'quarterly':
+        ordinals = ordinals * 4 + np.asarray(columns[2], dtype=np.int64) - 1
+    rates = np.full((len(sectors), len(names)), np.nan)
+    ends = np.zeros((len(sectors), len(names)), dtype=np.int64)
+    # Every-sector rates first (Sector '' sorts first), then per-sector ones
+    for name, sector, rate, end_year, custom in scenario_rows:
+        target = slice(None) if sector == '' else sector_index.get(sector)
+        if target is None:
+            continue
+        rates[target, name_index[name]] = rate
+        ends[target, name_index[name]] = end_ordinal(frequency, end_year)
+
+    first = ordinals.min()
+    length = int(max(ordinals.max(), ends.max()) - first + 1)
+    history = np.full((len(sectors), length), np.nan)
+    history[rows, ordinals - first] = np.asarray(columns[-1], dtype=np.float64)
+    last = np.full(len(sectors), -1, dtype=np.int64)
+    np.maximum.at(last, rows, ordinals - first)
+    last_value = history[np.arange(len(sectors)), last]
+
+    steps = np.arange(length)[None, None, :] - last[:, None, None]
+    with np.errstate(invalid='ignore', over='ignore'):
+        projected = last_value[:, None, None] * (1 + rates[:, :, None]) ** np.maximum(steps, 0)
+    paths = np.where(steps <= 0, history[:, None, :], projected)
+    valid = np.isfinite(paths) & ~np.isnan(rates)[:, :, None] & (steps <= (ends - first - last[:, None])[:, :, None])
+    sector_at, name_at, position = np.nonzero(valid)
+    return (
+        sectors[sector_at], np.array(names, dtype=object)[name_at],
+        position + first, paths[valid],
+    )
+
+
+def path_rows(frequency, sectors, names, ordinals, values, from_year=None, to_year=None):
+    result = []
+    for sector, name, ordinal, value in zip(sectors, names, ordinals.tolist(), values.tolist()):
+        period = from_ordinal(frequency, ordinal)
+        if (from_year and period[0] < from_year) or (to_year and period[0] > to_year):
+            continue
+        row = {'Sector': sector, 'GrowthRate': name, 'Year': period[0], 'Value': value}
+        if frequency == 'quarterly':
+            row.update(Quarter=period[1], YearQuarter=f"{period[0]}-Q{period[1]}")
+        result.append(row)
+    return result
+
+
+def cache_key(*args):
+    digest = hashlib.sha1(json.dumps(args, sort_keys=True, default=str).encode()).hexdigest()
+    return f"{CACHE_PREFIX}:{digest}"
+
+
+# Called whenever the base or a scenario changes
+def clear_scenario_cache():
+    frappe.cache().delete_keys(f"{CACHE_PREFIX}:")
+
+
+# A list argument: a list, a JSON list or a single name
+def parse_list(value):
+    if isinstance(value, str):
+        value = frappe.parse_json(value) if value.lstrip().startswith('[') else [value]
+    return sorted(value) if value else None
+
+
+# Scenario paths, one row per sector, scenario and period, in the layout of
+# the former Annual_GrowthRates / Quarterly_GrowthRates tables
+@frappe.whitelist()
+def get_scenario_paths(frequency='annual', scenarios=None, sectors=None, from_year=None, to_year=None):
+    check_frequency(frequency)
+    scenarios, sectors = parse_list(scenarios), parse_list(sectors)
+    from_year, to_year = (int(year) if year else None for year in (from_year, to_year))
+    key = cache_key(frequency, scenarios, sectors, from_year, to_year)
+    cached = frappe.cache().get_value(key)
+    if cached is None:
+        paths = compute_paths(frequency, load_base(frequency, sectors), load_scenarios(frequency, scenarios))
+        cached = path_rows(frequency, *paths, from_year=from_year, to_year=to_year)
+        frappe.cache().set_value(key, cached, expires_in_sec=CACHE_TTL)
+    return cached
+
+
+# Scenarios of one frequency: every-sector rate, per-sector rates, end year
+# and whether it is custom
+@frappe.whitelist()
+def get_growth_scenarios(frequency='annual'):
+    check_frequency(frequency)
+    result = {}
+    for name, sector, rate, end_year, custom in load_scenarios(frequency):
+        entry = result.setdefault(name, {'rate': None, 'sector_rates': {}, 'end_year': end_year, 'custom': bool(custom)})
+        if sector:
+            entry['sector_rates'][sector] = rate
+        else:
+            entry['rate'] = rate
+        entry['end_year'] = max(entry['end_year'], end_year)
+    return result
+
+
+def check_rate(rate):
+    try:
+        rate = float(rate)
+    except (TypeError, ValueError):
+        frappe.throw(_("Growth rate must be a number, got {0}").format(rate))
+    if not np.isfinite(rate) or rate <= -1:
+        frappe.throw(_("Growth rate must be greater than -1, got {0}").format(rate))
+    return rate
+
+
+def is_uploaded(frequency, name):
+    return any(not row[4] for row in load_scenarios(frequency, [name]))
+
+
+# Define (or redefine) a custom scenario: `rate` per period for every
+# sector and/or `sector_rates` ({sector: rate}) for some sectors. Nothing is
+# projected or written beyond these parameter rows.
+@frappe.whitelist()
+def save_scenario(name, rate=None, frequency='annual', sector_rates=None, end_year=None):
+    check_frequency(frequency)
+    name = (name or "").strip()
+    if not name or len(name) > 50:
+        frappe.throw(_("Scenario name must have 1 to 50 characters"))
+    if is_uploaded(frequency, name):
+        frappe.throw(_("{0} is an uploaded scenario; choose another name").format(name))
+    sector_rates = frappe.parse_json(sector_rates) if isinstance(sector_rates, str) else (sector_rates or {})
+    if rate in (None, "") and not sector_rates:
+        frappe.throw(_("Give a growth rate, sector rates or both"))
+    if not end_year:
+        end_year = frappe.db.sql(
+            f"SELECT MAX(`EndYear`) FROM `{SCENARIO_TABLE}` WHERE `Frequency` = %s", (frequency,)
+        )[0][0] or DEFAULT_END_YEAR
+
+    modified = datetime.now()
+    rows = [(frequency, name, '', check_rate(rate), int(end_year), 1, modified)] if rate not in (None, "") else []
+    rows += [
+        (frequency, name, sector, check_rate(sector_rate), int(end_year), 1, modified)
+        for sector, sector_rate in sector_rates.items() if sector
+    ]
+    frappe.db.sql(
+        f"DELETE FROM `{SCENARIO_TABLE}` WHERE `Frequency` = %s AND `GrowthRate` = %s", (frequency, name)
+    )
+    bulk_insert(SCENARIO_TABLE, rows, columns=SCENARIO_COLUMNS)
+    clear_scenario_cache()
+    return get_growth_scenarios(frequency)[name]
+
+
+@frappe.whitelist()
+def delete_scenario(name, frequency='annual'):
+    check_frequency(frequency)
+    if is_uploaded(frequency, name):
+        frappe.throw(_("{0} is an uploaded scenario and is replaced by the next upload").format(name))
+    frappe.db.sql(
+        f"DELETE FROM `{SCENARIO_TABLE}` WHERE `Frequency` = %s AND `GrowthRate` = %s AND `Custom` = 1",
+        (frequency, name)
+    )
+    frappe.db.commit()
+    clear_scenario_cache()
+    return {'deleted': name}
@@ -0,0 +1,258 @@
+import io
+import json
+import os
+import sys
+import time
+import traceback
+from contextlib import contextmanager
+from datetime import datetime
+import frappe
+
+# Structured timing for upload and forecast runs. A run (run_log) collects
+# spans: named, nested stages with wall and CPU time, the process's peak RSS
+# and any counters the stage adds (rows, optimizer iterations, ...):
+#
+#   with run_log('forecast', forecast_type, run_id=job_id):
+#       with span('pivot') as fields:
+#           ...
+#           fields['rows'] = len(pivot_df)
+#
+# When the run ends it is saved to `tabGDP Forecast Run Log` (see the GDP
+# Forecast Run Log report in the workspace). Outside a run, span() and note()
+# do nothing, so the instrumented code works the same when called directly.
+# Set `gdp_forecast_profile` in site config (or pass profile=1) to also keep
+# a sampling profile of the run; it uses pyinstrument when installed and
+# falls back to cProfile.
+#
+# Only the standard library is imported here: upload and forecast endpoints
+# import this module.
+RUN_LOG_TABLE = 'tabGDP Forecast Run Log'
+PROFILE_INTERVAL = 0.001
+PROFILE_MAX_CHARS = 200000
+
+# The run in progress in this process (in a fitting worker: the pool task in
+# progress, see run_task)
+_run = None
+
+
+class RunLog:
+    def __init__(self, run_type=None, name=None, run_id=None):
+        self.run_type = run_type
+        self.name = name
+        self.run_id = run_id or frappe.generate_hash(length=12)
+        self.started_at = time.time()
+        self.spans = []
+        self.open = []
+        self.fields = {}
+
+
+def peak_rss_mb(who=None):
+    try:
+        import resource
+    except ImportError:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_SELF if who is None else who)
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return round(usage.ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def active():
+    return _run is not None
+
+
+# Spans the current run has recorded so far (finished ones only)
+def recorded_spans():
+    return list(_run.spans) if _run is not None else []
+
+
+# Time a stage of the current run. Yields a dict the stage can add fields to
+# (rows, sectors, ...). Stages nest: a span opened inside another is recorded
+# with the outer one as its parent.
+@contextmanager
+def span(name, **fields):
+    run = _run
+    if run is None:
+        yield fields
+        return
+    parent = run.open[-1]['path'] if run.open else None
+    entry = {'name': name, 'path': f"{parent} > {name}" if parent else name, 'parent': parent}
+    run.open.append(entry)
+    started, cpu_started = time.time(), time.process_time()
+    try:
+        yield fields
+    finally:
+        run.open.pop()
+        entry.update(
+            start=round(started - run.started_at, 4),
+            wall=round(time.time() - started, 4),
+            cpu=round(time.process_time() - cpu_started, 4),
+            peak_rss_mb=peak_rss_mb(),
+            **fields,
+        )
+        run.spans.append(entry)
+
+
+# Add counters to the innermost open span (summed if already present)
+def note(**counters):
+    if _run is None or not _run.open:
+        return
+    entry = _run.open[-1]
+    for key, value in counters.items():
+        if value is not None:
+            entry[key] = entry.get(key, 0) + value
+
+
+# Iteration count of a fitted statsmodels / pmdarima model, if the optimizer
+# reported one
+def optimizer_iterations(result):
+    retvals = getattr(result, 'mle_retvals', None)
+    if retvals is None and hasattr(result, 'arima_res_'):
+        retvals = getattr(result.arima_res_, 'mle_retvals', None)
+    if isinstance(retvals, dict):
+        for key in ('nit', 'iterations'):
+            if retvals.get(key) is not None:
+                return int(retvals[key])
+    return None
+
+
+# Run one pool task with its own run, so spans and counters recorded inside
+# a worker process travel back with the result (see parallel_fit)
+def run_task(fit_fn, args):
+    global _run
+    _run = RunLog(run_id='task')
+    try:
+        with span('task'):
+            result = fit_fn(*args)
+    finally:
+        task, _run = _run, None
+    for entry in task.spans:
+        entry['start'] = round(entry['start'] + task.started_at, 4)
+    return result, task.spans
+
+
+# Record the spans of a finished pool task under the open span, the task's
+# root span renamed to `name`
+def add_task_spans(name, spans, **fields):
+    run = _run
+    if run is None:
+        return
+    parent = run.open[-1]['path'] if run.open else None
+    prefix = f"{parent} > {name}" if parent else name
+    for entry in spans:
+        entry = dict(entry, start=round(entry['start'] - run.started_at, 4))
+        if entry['parent'] is None:
+            entry.update(name=name, path=prefix, parent=parent, **fields)
+        else:
+            entry['path'] = prefix + entry['path'][len('task'):]
+            entry['parent'] = prefix + entry['parent'][len('task'):]
+        run.spans.append(entry)
+
+
+def profiling_enabled(profile=None):
+    if profile is None:
+        profile = frappe.conf.get('gdp_forecast_profile') if frappe.conf else None
+    return bool(profile) and str(profile).lower() not in ('0', 'false', 'no')
+
+
+class Profiler:
+    def __init__(self):
+        try:
+            from pyinstrument import Profiler as SamplingProfiler
+            self.profiler, self.kind = SamplingProfiler(interval=PROFILE_INTERVAL), 'pyinstrument'
+        except ImportError:
+            import cProfile
+            self.profiler, self.kind = cProfile.Profile(), 'cProfile'
+
+    def start(self):
+        if self.kind == 'pyinstrument':
+            self.profiler.start()
+        else:
+            self.profiler.enable()
+
+    def stop(self):
+        if self.kind == 'pyinstrument':
+            self.profiler.stop()
+            return self.profiler.output_text(unicode=False, color=False)
+        import pstats
+        self.profiler.disable()
+        output = io.StringIO()
+        pstats.Stats(self.profiler, stream=output).sort_stats('cumulative').print_stats(60)
+        return f"cProfile (pyinstrument is not installed)\n{output.getvalue()}"
+
+
+# Record one upload or forecast run. Nested runs (an upload inside a forecast
+# job, say) are recorded as a span of the outer run.
+@contextmanager
+def run_log(run_type, name, run_id=None, profile=None, **fields):
+    global _run
+    if _run is not None:
+        with span(f"{run_type} {name}", **fields) as span_fields:
+            yield span_fields
+        return
+
+    run = RunLog(run_type, name, run_id)
+    run.fields.update(fields)
+    profiler = Profiler() if profiling_enabled(profile) else None
+    if profiler:
+        profiler.start()
+    cpu_started = time.process_time()
+    _run = run
+    status, error, profile_text = 'Completed', None, None
+    try:
+        yield run.fields
+    except Exception:
+        status, error = 'Failed', traceback.format_exc(limit=5)
+        raise
+    finally:
+        _run = None
+        wall, cpu = time.time() - run.started_at, time.process_time() - cpu_started
+        if profiler:
+            profile_text = profiler.stop()
+        save_run(run, status, error, wall, cpu, profile_text)
+
+
+def save_run(run, status, error, wall, cpu, profile_text):
+    # Parents before their children when both start at the same time
+    run.spans.sort(key=lambda entry: (entry['start'], entry['path'].count(' > ')))
+    rows = run.fields.pop('rows', None)
+    try:
+        # A failed run's uncommitted writes are discarded before its entry
+        # is committed, so they cannot be committed along with it
+        if status == 'Failed':
+            frappe.db.rollback()
+        frappe.db.sql(f"""
+            INSERT INTO `{RUN_LOG_TABLE}` (`run_id`, `run_type`, `name`, `status`, `started_at`, `wall_seconds`,
+                `cpu_seconds`, `peak_rss_mb`, `children_peak_rss_mb`, `row_count`, `pid`, `fields`, `spans`, `error`, `profile`)
+            VALUES (%(run_id)s, %(run_type)s, %(name)s, %(status)s, %(started_at)s, %(wall)s, %(cpu)s,
+                %(peak_rss_mb)s, %(children_peak_rss_mb)s, %(row_count)s, %(pid)s, %(fields)s, %(spans)s, %(error)s, %(profile)s)
+        """, {
+            'run_id': run.run_id,
+            'run_type': run.run_type,
+            'name': run.name,
+            'status': status,
+            'started_at': datetime.fromtimestamp(run.started_at),
+            'wall': round(wall, 4),
+            'cpu': round(cpu, 4),
+            'peak_rss_mb': peak_rss_mb(),
+            'children_peak_rss_mb': children_peak_rss_mb(),
+            'row_count': rows,
+            'pid': os.getpid(),
+            'fields': json.dumps(run.fields, default=str),
+            'spans': json.dumps(run.spans, default=str),
+            'error': error,
+            'profile': profile_text[:PROFILE_MAX_CHARS] if profile_text else None,
+        })
+        # Committed straight away so a failed run keeps its entry too
+        frappe.db.commit()
+    except Exception as e:
+        # Losing a log entry must never fail the run it describes
+        frappe.logger("gdp_forecasting").warning(f"Could not save the {run.run_type} run log: {e}")
+
+
+# Largest peak RSS of the finished child processes (the fitting pool)
+def children_peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    return peak_rss_mb(resource.RUSAGE_CHILDREN)
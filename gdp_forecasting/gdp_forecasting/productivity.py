@@ -0,0 +1,142 @@
+from collections import defaultdict
+from datetime import datetime
+import frappe
+from gdp_forecasting.gdp_forecasting.bulk_ingest import bulk_insert
+from gdp_forecasting.gdp_forecasting.instrumentation import span
+
+# GDP per worker by region x quarter x output classification, materialized
+# from the gdp and workforce tables into `gdp_per_worker`. gdp has one value
+# per region and quarter (its latest revision: gdp.csv repeats revised
+# quarters, and the row loaded last, with the highest id, wins), so:
+#
+#   Output_Classification ''    the region's GDP, workforce and GDP per worker
+#   Output_Classification <c>   the classification's workforce and its share
+#                               of the region's workforce
+#
+# The two sources name the country differently (gdp 'Saudi Arabia',
+# workforce 'KSA'); REGION_ALIASES maps both to one name. The cube is
+# refreshed after every base dataset upload. Only keys whose values changed
+# are rewritten, and keys that disappeared are deleted. When only gdp was
+# loaded, the classification rows (which depend on workforce alone) are left
+# alone. Reads go through the
+# primary key (region, period, classification) or the classification index.
+CUBE_TABLE = 'gdp_per_worker'
+KEY_COLUMNS = ['Region', 'YearNumber', 'QuarterNumber', 'Output_Classification']
+VALUE_COLUMNS = ['GDP', 'Workforce', 'GDP_per_Worker', 'Workforce_Share']
+REGION_ALIASES = {'KSA': 'Saudi Arabia'}
+UNCLASSIFIED = 'Unclassified'
+# Values are recomputed from the same sums, so only rounding noise is ignored
+VALUE_TOLERANCE = 1e-9
+
+
+def region_name(region):
+    return REGION_ALIASES.get(region, region)
+
+
+def ratio(numerator, denominator):
+    return numerator / denominator if numerator is not None and denominator else None
+
+
+# Cube rows computed from the source tables: {key: values}. Without
+# `classifications`, only the region totals.
+def compute_cube(classifications=True):
+    gdp, workforce, classified = defaultdict(float), defaultdict(float), defaultdict(float)
+    for region, year, quarter, value in frappe.db.sql("""
+        SELECT latest.`Region`, latest.`YearNumber`, latest.`QuarterNumber`, latest.`Value`
+        FROM `gdp` latest
+        JOIN (
+            SELECT MAX(`id`) AS `id` FROM `gdp`
+            WHERE `Value` IS NOT NULL
+            GROUP BY `Region`, `YearNumber`, `QuarterNumber`
+        ) revision ON revision.`id` = latest.`id`
+    """):
+        gdp[region_name(region), int(year), int(quarter)] += float(value)
+    classification_column = ", `Output_Classification`" if classifications else ", ''"
+    group_by = ", `Output_Classification`" if classifications else ""
+    for region, year, quarter, classification, value in frappe.db.sql(f"""
+        SELECT `Region`, `YearNumber`, `QuarterNumber`{classification_column}, SUM(`Value`) FROM `workforce`
+        WHERE `Value` IS NOT NULL
+        GROUP BY `Region`, `YearNumber`, `QuarterNumber`{group_by}
+    """):
+        period = (region_name(region), int(year), int(quarter))
+        workforce[period] += float(value)
+        if classifications:
+            classified[period + ((classification or '').strip() or UNCLASSIFIED,)] += float(value)
+
+    cube = {}
+    for period in set(gdp) | set(workforce):
+        region_gdp, region_workforce = gdp.get(period), workforce.get(period)
+        cube[period + ('',)] = (
+            region_gdp, region_workforce, ratio(region_gdp, region_workforce), 1.0 if region_workforce else None
+        )
+    for key, value in classified.items():
+        cube[key] = (None, value, None, ratio(value, workforce[key[:3]]))
+    return cube
+
+
+def load_cube(classifications=True):
+    columns = ", ".join(f"`{column}`" for column in KEY_COLUMNS + VALUE_COLUMNS)
+    where = "" if classifications else "WHERE `Output_Classification` = ''"
+    return {
+        (row[0], int(row[1]), int(row[2]), row[3]): tuple(row[4:])
+        for row in frappe.db.sql(f"SELECT {columns} FROM `{CUBE_TABLE}` {where}")
+    }
+
+
+def same_values(new, old):
+    return old is not None and all(
+        a == b or (a is not None and b is not None and abs(a - b) <= VALUE_TOLERANCE * max(abs(a), abs(b)))
+        for a, b in zip(new, old)
+    )
+
+
+# Bring the cube in line with the gdp and workforce tables, rewriting only
+# the keys that changed. `tables` are the source tables that were loaded
+# (default: both).
+def refresh_productivity_cube(tables=None):
+    from gdp_forecasting.gdp_forecasting.delta_upload import delete_keys
+
+    classifications = tables is None or 'workforce' in tables
+    with span('refresh productivity cube', classifications=classifications) as fields:
+        cube, stored = compute_cube(classifications), load_cube(classifications)
+        changed = [key for key, values in cube.items() if not same_values(values, stored.get(key))]
+        removed = [key for key in stored if key not in cube]
+        delete_keys(CUBE_TABLE, KEY_COLUMNS, removed)
+        refreshed = datetime.now()
+        bulk_insert(
+            CUBE_TABLE, ((*key, *cube[key], refreshed) for key in changed),
+            columns=KEY_COLUMNS + VALUE_COLUMNS + ['Refreshed'], update_columns=VALUE_COLUMNS + ['Refreshed']
+        )
+        frappe.db.commit()
+        stats = {'keys': len(cube), 'written': len(changed), 'deleted': len(removed)}
+        fields.update(stats)
+    frappe.logger("gdp_forecasting").info(
+        f"Refreshed {CUBE_TABLE}: {stats['written']} keys written, {stats['deleted']} deleted of {stats['keys']}"
+    )
+    return stats
+
+
+# Cube rows by any prefix of the key. With no classification only the
+# region totals are returned; pass '*' for every classification.
+@frappe.whitelist()
+def get_productivity(region=None, year=None, quarter=None, output_classification=None, limit=None):
+    conditions, values = [], {}
+    for column, value in (('Region', region and region_name(region)), ('YearNumber', year), ('QuarterNumber', quarter)):
+        if value not in (None, ""):
+            conditions.append(f"`{column}` = %({column})s")
+            values[column] = value
+    if output_classification != '*':
+        conditions.append("`Output_Classification` = %(classification)s")
+        values['classification'] = output_classification or ''
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    limit_sql = ""
+    if limit:
+        limit_sql = "LIMIT %(limit)s"
+        values['limit'] = int(limit)
+    return frappe.db.sql(f"""
+        SELECT `Region`, `YearNumber`, `QuarterNumber`, `Quarter`, `Output_Classification`,
+            `GDP`, `Workforce`, `GDP_per_Worker`, `Workforce_Share`
+        FROM `{CUBE_TABLE}` {where}
+        ORDER BY `Region`, `YearNumber`, `QuarterNumber`, `Output_Classification`
+        {limit_sql}
+    """, values, as_dict=True)
@@ -0,0 +1,45 @@
+// Copyright (c) 2024, gopal@8848digital.com and contributors
+// For license information, please see license.txt
+/* eslint-disable */
+
+frappe.query_reports["GDP Forecast Run Log"] = {
+	"filters": [
+        {
+            "fieldname": "run_type",
+            "label": __("Run Type"),
+            "fieldtype": "Select",
+            "options": [
+                "",
+                "forecast",
+                "upload"
+            ]
+        },
+        {
+            "fieldname": "run_name",
+            "label": __("Forecast / Dataset"),
+            "fieldtype": "Data"
+        },
+        {
+            "fieldname": "status",
+            "label": __("Status"),
+            "fieldtype": "Select",
+            "options": [
+                "",
+                "Completed",
+                "Failed"
+            ]
+        },
+        {
+            "fieldname": "run_id",
+            "label": __("Run ID"),
+            "fieldtype": "Data",
+            "description": __("Show the stages of one run")
+        },
+        {
+            "fieldname": "limit",
+            "label": __("Runs"),
+            "fieldtype": "Int",
+            "default": 100
+        }
+    ]
+};
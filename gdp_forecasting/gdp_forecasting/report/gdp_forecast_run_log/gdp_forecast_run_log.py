@@ -0,0 +1,82 @@
+# Copyright (c) 2024, gopal@8848digital.com and contributors
+# For license information, please see license.txt
+
+import json
+import frappe
+from frappe import _
+from frappe.utils import escape_html
+from gdp_forecasting.gdp_forecasting.instrumentation import RUN_LOG_TABLE
+
+# Upload and forecast runs recorded by instrumentation.run_log, newest first.
+# With a Run ID filter the report shows that run's stages instead, and its
+# profile when one was kept.
+RUN_COLUMNS = [
+    {"label": _("Started"), "fieldname": "started_at", "fieldtype": "Datetime", "width": 170},
+    {"label": _("Run ID"), "fieldname": "run_id", "fieldtype": "Data", "width": 120},
+    {"label": _("Type"), "fieldname": "run_type", "fieldtype": "Data", "width": 90},
+    {"label": _("Forecast / Dataset"), "fieldname": "name", "fieldtype": "Data", "width": 230},
+    {"label": _("Status"), "fieldname": "status", "fieldtype": "Data", "width": 100},
+    {"label": _("Wall (s)"), "fieldname": "wall_seconds", "fieldtype": "Float", "precision": 3, "width": 100},
+    {"label": _("CPU (s)"), "fieldname": "cpu_seconds", "fieldtype": "Float", "precision": 3, "width": 100},
+    {"label": _("Peak RSS (MB)"), "fieldname": "peak_rss_mb", "fieldtype": "Float", "precision": 1, "width": 120},
+    {"label": _("Pool Peak RSS (MB)"), "fieldname": "children_peak_rss_mb", "fieldtype": "Float", "precision": 1, "width": 140},
+    {"label": _("Rows"), "fieldname": "row_count", "fieldtype": "Int", "width": 90},
+    {"label": _("Details"), "fieldname": "fields", "fieldtype": "Data", "width": 250},
+    {"label": _("Error"), "fieldname": "error", "fieldtype": "Data", "width": 250},
+]
+
+SPAN_COLUMNS = [
+    {"label": _("Stage"), "fieldname": "path", "fieldtype": "Data", "width": 400},
+    {"label": _("Start (s)"), "fieldname": "start", "fieldtype": "Float", "precision": 3, "width": 100},
+    {"label": _("Wall (s)"), "fieldname": "wall", "fieldtype": "Float", "precision": 3, "width": 100},
+    {"label": _("CPU (s)"), "fieldname": "cpu", "fieldtype": "Float", "precision": 3, "width": 100},
+    {"label": _("Peak RSS (MB)"), "fieldname": "peak_rss_mb", "fieldtype": "Float", "precision": 1, "width": 120},
+    {"label": _("Rows"), "fieldname": "rows", "fieldtype": "Int", "width": 90},
+    {"label": _("Iterations"), "fieldname": "iterations", "fieldtype": "Int", "width": 100},
+    {"label": _("Details"), "fieldname": "details", "fieldtype": "Data", "width": 250},
+]
+SPAN_FIELDS = {"name", "path", "parent", "start", "wall", "cpu", "peak_rss_mb", "rows", "iterations"}
+MAX_RUNS = 1000
+
+
+def execute(filters=None):
+    filters = frappe._dict(filters or {})
+    if filters.get("run_id"):
+        return run_spans(filters.run_id)
+
+    conditions, values = [], {}
+    for field, column in (("run_type", "run_type"), ("run_name", "name"), ("status", "status")):
+        if filters.get(field):
+            conditions.append(f"`{column}` = %({field})s")
+            values[field] = filters.get(field)
+    values["limit"] = min(max(int(filters.get("limit") or 100), 1), MAX_RUNS)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    fields = ", ".join(f"`{column['fieldname']}`" for column in RUN_COLUMNS)
+    data = frappe.db.sql(f"""
+        SELECT {fields} FROM `{RUN_LOG_TABLE}` {where}
+        ORDER BY `started_at` DESC
+        LIMIT %(limit)s
+    """, values, as_dict=True)
+    return RUN_COLUMNS, data
+
+
+def run_spans(run_id):
+    runs = frappe.db.sql(f"""
+        SELECT `spans`, `profile` FROM `{RUN_LOG_TABLE}`
+        WHERE `run_id` = %(run_id)s ORDER BY `started_at` DESC LIMIT 1
+    """, {"run_id": run_id}, as_dict=True)
+    if not runs:
+        frappe.throw(_("No run {0} in the run log").format(run_id))
+
+    data = []
+    for entry in json.loads(runs[0].spans or "[]"):
+        row = {field: entry.get(field) for field in SPAN_FIELDS}
+        # Indent each stage under its parent
+        row["path"] = "    " * entry["path"].count(" > ") + entry["name"]
+        details = {key: value for key, value in entry.items() if key not in SPAN_FIELDS}
+        row["details"] = json.dumps(details) if details else None
+        data.append(row)
+    message = None
+    if runs[0].profile:
+        message = f"<pre>{escape_html(runs[0].profile)}</pre>"
+    return SPAN_COLUMNS, data, message
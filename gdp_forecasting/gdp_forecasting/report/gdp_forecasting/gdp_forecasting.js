@@ -13,6 +13,46 @@ frappe.query_reports["GDP Forecasting"] = {
                 "Quarterly"
             ],
             "default": "Annual"
+        },
+        {
+            "fieldname": "sector",
+            "label": __("Sector"),
+            "fieldtype": "Data"
+        },
+        {
+            "fieldname": "from_period",
+            "label": __("From Period"),
+            "fieldtype": "Data",
+            "description": __("Year (2024) or quarter (2024-Q1)")
+        },
+        {
+            "fieldname": "to_period",
+            "label": __("To Period"),
+            "fieldtype": "Data",
+            "description": __("Year (2030) or quarter (2030-Q4)")
+        },
+        {
+            "fieldname": "row_type",
+            "label": __("Rows"),
+            "fieldtype": "Select",
+            "options": [
+                "All",
+                "History",
+                "Forecast"
+            ],
+            "default": "All"
+        },
+        {
+            "fieldname": "page",
+            "label": __("Page"),
+            "fieldtype": "Int",
+            "default": 1
+        },
+        {
+            "fieldname": "page_length",
+            "label": __("Rows per Page"),
+            "fieldtype": "Int",
+            "default": 500
         }
     ]
 };
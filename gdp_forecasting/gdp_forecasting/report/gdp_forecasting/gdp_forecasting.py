@@ -1,27 +1,126 @@
 # Copyright (c) 2024, gopal@8848digital.com and contributors
 # For license information, please see license.txt
 
+import hashlib
+import json
 import frappe
+from frappe import _
+
+# One entry per forecast type: the result table, its numeric period columns
+# (the table's key after the sector) and the columns shown. Forecast rows
+# are flagged with is_forecast by the forecasters; the rest are history.
+REPORT_TABLES = {
+    "Annual": {
+        "table": "tabHolt Winters Annual",
+        "period": ["year"],
+        "columns": [
+            {"label": _("Name"), "fieldname": "name", "fieldtype": "Data", "width": 250},
+            {"label": _("Sector"), "fieldname": "sector", "fieldtype": "Data", "width": 250},
+            {"label": _("Year"), "fieldname": "year", "fieldtype": "Int", "width": 120},
+            {"label": _("GDP"), "fieldname": "gdp", "fieldtype": "Float", "width": 180},
+            {"label": _("RMSE"), "fieldname": "rmse", "fieldtype": "Float", "width": 150},
+        ],
+    },
+    "Quarterly": {
+        "table": "holt_winters_quarterly",
+        "period": ["year", "quarter"],
+        "columns": [
+            {"label": _("Sector"), "fieldname": "sector", "fieldtype": "Data", "width": 250},
+            {"label": _("Year Quarter"), "fieldname": "year_quarter", "fieldtype": "Data", "width": 150},
+            {"label": _("GDP"), "fieldname": "gdp", "fieldtype": "Float", "width": 180},
+            {"label": _("RMSE"), "fieldname": "rmse", "fieldtype": "Float", "width": 150},
+        ],
+    },
+}
+
+DEFAULT_PAGE_LENGTH = 500
+MAX_PAGE_LENGTH = 5000
+CACHE_PREFIX = "gdp_forecast_report"
+CACHE_TTL = 60 * 60
+
 
 def execute(filters=None):
-    columns, data = [], []
+    filters = frappe._dict(filters or {})
+    spec = REPORT_TABLES.get(filters.get("forecast_type"))
+    if not spec:
+        return [], []
+
+    page_length = min(max(int(filters.get("page_length") or DEFAULT_PAGE_LENGTH), 1), MAX_PAGE_LENGTH)
+    page = max(int(filters.get("page") or 1), 1)
+
+    key = cache_key(filters, page, page_length)
+    cached = frappe.cache().get_value(key)
+    if cached is None:
+        cached = fetch_page(spec, filters, page, page_length)
+        frappe.cache().set_value(key, cached, expires_in_sec=CACHE_TTL)
+
+    data, total = cached["data"], cached["total"]
+    first = (page - 1) * page_length + 1 if data else 0
+    message = _("Showing rows {0} to {1} of {2}").format(first, first + len(data) - 1 if data else 0, total)
+    return spec["columns"], data, message
+
+
+# Filters are applied in SQL so only the requested page leaves the database
+def build_conditions(spec, filters):
+    conditions, values = [], {}
+    if filters.get("sector"):
+        conditions.append("sector = %(sector)s")
+        values["sector"] = filters.sector
+    for field, operator in (("from_period", ">="), ("to_period", "<=")):
+        if filters.get(field):
+            condition, bounds = period_condition(spec, field, operator, filters.get(field))
+            conditions.append(condition)
+            values.update(bounds)
+    if filters.get("row_type") == "History":
+        conditions.append("is_forecast = 0")
+    elif filters.get("row_type") == "Forecast":
+        conditions.append("is_forecast = 1")
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    return where, values
+
+
+# Range condition on the period columns. Quarterly bounds ('2024-Q2') are
+# split so the comparison runs on the (year, quarter) key instead of a label.
+def period_condition(spec, field, operator, value):
+    try:
+        if spec["period"] == ["year"]:
+            return f"`year` {operator} %({field})s", {field: int(value)}
+        year, quarter = (int(part) for part in str(value).upper().split("-Q"))
+    except ValueError:
+        example = "2024" if spec["period"] == ["year"] else "2024-Q1"
+        frappe.throw(_("Period must look like {0}, got {1}").format(example, value))
+    year_key, quarter_key = f"{field}_year", f"{field}_quarter"
+    condition = (
+        f"(`year` {operator[0]} %({year_key})s OR "
+        f"(`year` = %({year_key})s AND `quarter` {operator} %({quarter_key})s))"
+    )
+    return condition, {year_key: year, quarter_key: quarter}
+
 
-    if filters and filters.get("forecast_type"):
-        forecast_type = filters["forecast_type"]
-        
-        table_name = None
-        if forecast_type == "Annual":
-            table_name = "tabHolt Winters Annual"
-        elif forecast_type == "Quarterly":
-            table_name = "holt_winters_quarterly"
+def fetch_page(spec, filters, page, page_length):
+    where, values = build_conditions(spec, filters)
+    fields = ", ".join(f"`{column['fieldname']}`" for column in spec["columns"])
+    order_by = ", ".join(f"`{column}`" for column in ["sector"] + spec["period"])
+    values.update(limit=page_length, offset=(page - 1) * page_length)
+    data = frappe.db.sql(f"""
+        SELECT {fields} FROM `{spec['table']}` {where}
+        ORDER BY {order_by}
+        LIMIT %(limit)s OFFSET %(offset)s
+    """, values, as_dict=True)
+    total = frappe.db.sql(f"SELECT COUNT(*) FROM `{spec['table']}` {where}", values)[0][0]
+    return {"data": data, "total": total}
 
-        if table_name:
-            column_query = f"DESCRIBE `{table_name}`"
-            columns_result = frappe.db.sql(column_query, as_dict=True)
 
-            columns = [{"label": column['Field'], "fieldname": column['Field'], "fieldtype": 'Data', "width": 250} for column in columns_result[1:]]
+def cache_key(filters, page, page_length):
+    relevant = {
+        field: filters.get(field)
+        for field in ("forecast_type", "sector", "from_period", "to_period", "row_type")
+    }
+    relevant.update(page=page, page_length=page_length)
+    digest = hashlib.sha1(json.dumps(relevant, sort_keys=True, default=str).encode()).hexdigest()
+    return f"{CACHE_PREFIX}:{digest}"
 
-            data_query = f"SELECT * FROM `{table_name}`"
-            data = frappe.db.sql(data_query, as_dict=True)
 
-    return columns, data
+# Called when a forecast run finishes: every cached page may be stale
+def clear_report_cache():
+    frappe.cache().delete_keys(f"{CACHE_PREFIX}:")
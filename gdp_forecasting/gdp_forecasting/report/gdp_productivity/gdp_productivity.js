@@ -0,0 +1,36 @@
+// Copyright (c) 2024, gopal@8848digital.com and contributors
+// For license information, please see license.txt
+/* eslint-disable */
+
+frappe.query_reports["GDP Productivity"] = {
+	"filters": [
+        {
+            "fieldname": "region",
+            "label": __("Region"),
+            "fieldtype": "Data"
+        },
+        {
+            "fieldname": "year",
+            "label": __("Year"),
+            "fieldtype": "Int"
+        },
+        {
+            "fieldname": "quarter",
+            "label": __("Quarter"),
+            "fieldtype": "Select",
+            "options": [
+                "",
+                "1",
+                "2",
+                "3",
+                "4"
+            ]
+        },
+        {
+            "fieldname": "output_classification",
+            "label": __("Output Classification"),
+            "fieldtype": "Data",
+            "description": __("Empty for region totals, * for every classification")
+        }
+    ]
+};
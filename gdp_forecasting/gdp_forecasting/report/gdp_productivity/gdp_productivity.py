@@ -0,0 +1,31 @@
+# Copyright (c) 2024, gopal@8848digital.com and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe import _
+from gdp_forecasting.gdp_forecasting.productivity import get_productivity
+
+# GDP, workforce and GDP per worker from the materialized cube (see
+# gdp_forecasting.productivity). Region totals by default; filter on an output
+# classification, or '*' for all of them, to see workforce by classification.
+COLUMNS = [
+    {"label": _("Region"), "fieldname": "Region", "fieldtype": "Data", "width": 150},
+    {"label": _("Quarter"), "fieldname": "Quarter", "fieldtype": "Data", "width": 100},
+    {"label": _("Output Classification"), "fieldname": "Output_Classification", "fieldtype": "Data", "width": 300},
+    {"label": _("GDP"), "fieldname": "GDP", "fieldtype": "Float", "width": 150},
+    {"label": _("Workforce"), "fieldname": "Workforce", "fieldtype": "Float", "precision": 0, "width": 130},
+    {"label": _("GDP per Worker"), "fieldname": "GDP_per_Worker", "fieldtype": "Float", "precision": 4, "width": 140},
+    {"label": _("Workforce Share"), "fieldname": "Workforce_Share", "fieldtype": "Percent", "width": 130},
+]
+
+
+def execute(filters=None):
+    filters = frappe._dict(filters or {})
+    data = get_productivity(
+        region=filters.get("region"), year=filters.get("year"), quarter=filters.get("quarter"),
+        output_classification=filters.get("output_classification"),
+    )
+    for row in data:
+        if row["Workforce_Share"] is not None:
+            row["Workforce_Share"] *= 100
+    return COLUMNS, data
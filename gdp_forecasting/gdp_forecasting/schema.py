@@ -0,0 +1,427 @@
+import frappe
+
+# Every table the app manages outside DocTypes. Tables are created on install
+# (after_install) and migrated by the patches in patches.txt; nothing on the
+# request path runs DDL.
+#
+# Quarterly periods are stored as numeric year and quarter columns, which
+# the keys and range filters use. The 'YYYY-Qn' label columns the readers
+# expect are virtual columns computed from them. (gdp and workforce name
+# theirs YearNumber / QuarterNumber, as in gdp.csv: MySQL column names are
+# case-insensitive, so `quarter` would clash with their `Quarter` label.)
+#
+# Natural primary keys are clustered, so sector / period lookups and ordered
+# scans (report pages, forecast loads) read the rows straight off the key.
+
+
+def quarter_label(year_column='year', quarter_column='quarter'):
+    return f"VARCHAR(7) AS (CONCAT(`{year_column}`, '-Q', `{quarter_column}`)) VIRTUAL"
+
+
+TABLES = {
+    'tabAnnual Dataset': {
+        'columns': {
+            'sector': "VARCHAR(255) NOT NULL",
+            'sub_sector': "VARCHAR(255) NOT NULL DEFAULT ''",
+            'year': "SMALLINT NOT NULL",
+            'gdp': "FLOAT",
+            'upload_timestamp': "DATETIME",
+        },
+        'primary_key': ['sector', 'sub_sector', 'year'],
+        'indexes': {'year': ['year']},
+    },
+    'tabQuarterly Dataset': {
+        'columns': {
+            'sector': "VARCHAR(255) NOT NULL",
+            'year': "SMALLINT NOT NULL",
+            'quarter': "TINYINT NOT NULL",
+            'gdp': "FLOAT",
+            'upload_timestamp': "DATETIME",
+        },
+        'primary_key': ['sector', 'year', 'quarter'],
+        'indexes': {'period': ['year', 'quarter']},
+    },
+    # gdp.csv carries revised estimates for the same region and quarter, so
+    # rows keep a surrogate key
+    'gdp': {
+        'columns': {
+            'id': "INT NOT NULL AUTO_INCREMENT",
+            'Region': "VARCHAR(255) NOT NULL",
+            'YearNumber': "SMALLINT NOT NULL",
+            'QuarterNumber': "TINYINT NOT NULL",
+            'Quarter': quarter_label('YearNumber', 'QuarterNumber'),
+            'Value': "FLOAT",
+        },
+        'primary_key': ['id'],
+        'indexes': {'region_period': ['Region', 'YearNumber', 'QuarterNumber', 'Value']},
+    },
+    'workforce': {
+        'columns': {
+            'id': "INT NOT NULL",
+            'GOSI_classification': "VARCHAR(255)",
+            'Output_Classification': "VARCHAR(255)",
+            'YearNumber': "SMALLINT NOT NULL",
+            'QuarterNumber': "TINYINT NOT NULL",
+            'Quarter': quarter_label('YearNumber', 'QuarterNumber'),
+            'Region': "VARCHAR(255)",
+            'Value': "FLOAT",
+        },
+        'primary_key': ['id'],
+        'indexes': {'region_period': ['Region', 'YearNumber', 'QuarterNumber', 'Output_Classification', 'Value']},
+    },
+    # GDP per worker cube built from gdp and workforce (see productivity.py);
+    # Output_Classification '' holds the region totals
+    'gdp_per_worker': {
+        'columns': {
+            'Region': "VARCHAR(255) NOT NULL",
+            'YearNumber': "SMALLINT NOT NULL",
+            'QuarterNumber': "TINYINT NOT NULL",
+            'Quarter': quarter_label('YearNumber', 'QuarterNumber'),
+            'Output_Classification': "VARCHAR(255) NOT NULL DEFAULT ''",
+            'GDP': "DOUBLE",
+            'Workforce': "DOUBLE",
+            'GDP_per_Worker': "DOUBLE",
+            'Workforce_Share': "DOUBLE",
+            'Refreshed': "DATETIME",
+        },
+        'primary_key': ['Region', 'YearNumber', 'QuarterNumber', 'Output_Classification'],
+        'indexes': {'classification_period': ['Output_Classification', 'YearNumber', 'QuarterNumber']},
+    },
+    # Growth-rate scenarios: the shared base values and one rate per
+    # scenario (see growth_scenarios.py); paths are computed on request
+    'Annual_GrowthBase': {
+        'columns': {
+            'Sector': "VARCHAR(255) NOT NULL",
+            'Year': "SMALLINT NOT NULL",
+            'Value': "DOUBLE",
+        },
+        'primary_key': ['Sector', 'Year'],
+        'indexes': {},
+    },
+    'Quarterly_GrowthBase': {
+        'columns': {
+            'Sector': "VARCHAR(255) NOT NULL",
+            'Year': "SMALLINT NOT NULL",
+            'Quarter': "TINYINT NOT NULL",
+            'YearQuarter': quarter_label('Year', 'Quarter'),
+            'Value': "DOUBLE",
+        },
+        'primary_key': ['Sector', 'Year', 'Quarter'],
+        'indexes': {},
+    },
+    'GrowthScenarios': {
+        'columns': {
+            'Frequency': "VARCHAR(10) NOT NULL",
+            'GrowthRate': "VARCHAR(50) NOT NULL",
+            'Sector': "VARCHAR(255) NOT NULL DEFAULT ''",
+            'Rate': "DOUBLE NOT NULL",
+            'EndYear': "SMALLINT NOT NULL",
+            'Custom': "TINYINT NOT NULL DEFAULT 0",
+            'Modified': "DATETIME",
+        },
+        'primary_key': ['Frequency', 'GrowthRate', 'Sector'],
+        'indexes': {},
+    },
+    'tabHolt Winters Annual': {
+        'columns': {
+            'name': "VARCHAR(255) NOT NULL",
+            'sector': "VARCHAR(255) NOT NULL",
+            'year': "SMALLINT NOT NULL",
+            'gdp': "FLOAT",
+            'rmse': "FLOAT",
+            'is_forecast': "TINYINT NOT NULL DEFAULT 0",
+        },
+        'primary_key': ['sector', 'year'],
+        'unique': {'name': ['name']},
+        'indexes': {'year': ['year']},
+    },
+    'holt_winters_quarterly': {
+        'columns': {
+            'sector': "VARCHAR(255) NOT NULL",
+            'year': "SMALLINT NOT NULL",
+            'quarter': "TINYINT NOT NULL",
+            'year_quarter': quarter_label(),
+            'gdp': "FLOAT",
+            'rmse': "FLOAT",
+            'is_forecast': "TINYINT NOT NULL DEFAULT 0",
+        },
+        'primary_key': ['sector', 'year', 'quarter'],
+        'indexes': {'period': ['year', 'quarter']},
+    },
+    'arima_annual': {
+        'columns': {
+            'sector': "VARCHAR(255) NOT NULL",
+            'year': "SMALLINT NOT NULL",
+            'gdp': "FLOAT",
+            'rmse': "FLOAT",
+        },
+        'primary_key': ['sector', 'year'],
+        'indexes': {},
+    },
+    'arima_quarterly': {
+        'columns': {
+            'sector': "VARCHAR(255) NOT NULL",
+            'year': "SMALLINT NOT NULL",
+            'quarter': "TINYINT NOT NULL",
+            'year_quarter': quarter_label(),
+            'gdp': "FLOAT",
+            'rmse': "FLOAT",
+        },
+        'primary_key': ['sector', 'year', 'quarter'],
+        'indexes': {},
+    },
+    # Reconciled hierarchical forecasts: one row per method, node and period.
+    # level 0 is the total (sector 'Total'); lower levels leave the finer
+    # columns empty.
+    'hierarchical_annual': {
+        'columns': {
+            'method': "VARCHAR(20) NOT NULL",
+            'level': "TINYINT NOT NULL",
+            'sector': "VARCHAR(255) NOT NULL",
+            'sub_sector': "VARCHAR(255) NOT NULL DEFAULT ''",
+            'year': "SMALLINT NOT NULL",
+            'base_gdp': "FLOAT",
+            'gdp': "FLOAT",
+            'rmse': "FLOAT",
+        },
+        'primary_key': ['method', 'level', 'sector', 'sub_sector', 'year'],
+        'indexes': {},
+    },
+    'hierarchical_quarterly': {
+        'columns': {
+            'method': "VARCHAR(20) NOT NULL",
+            'level': "TINYINT NOT NULL",
+            'sector': "VARCHAR(255) NOT NULL",
+            'year': "SMALLINT NOT NULL",
+            'quarter': "TINYINT NOT NULL",
+            'year_quarter': quarter_label(),
+            'base_gdp': "FLOAT",
+            'gdp': "FLOAT",
+            'rmse': "FLOAT",
+        },
+        'primary_key': ['method', 'level', 'sector', 'year', 'quarter'],
+        'indexes': {},
+    },
+    'tabGDP Dataset Change': {
+        'columns': {
+            'id': "INT NOT NULL AUTO_INCREMENT",
+            'dataset_type': "VARCHAR(20)",
+            'change_type': "VARCHAR(10)",
+            'sector': "VARCHAR(255)",
+            'sub_sector': "VARCHAR(255)",
+            'year': "SMALLINT",
+            'quarter': "TINYINT",
+            'old_gdp': "FLOAT",
+            'new_gdp': "FLOAT",
+            'upload_timestamp': "DATETIME",
+        },
+        'primary_key': ['id'],
+        'indexes': {'upload': ['dataset_type', 'upload_timestamp', 'sector']},
+    },
+    'tabHolt Winters Best Params': {
+        'columns': {
+            'sector': "VARCHAR(255) NOT NULL",
+            'trend': "VARCHAR(10)",
+            'seasonal': "VARCHAR(10)",
+            'seasonal_periods': "INT",
+            'rmse': "FLOAT",
+            'candidates_evaluated': "INT",
+            'searched_at': "DATETIME",
+        },
+        'primary_key': ['sector'],
+        'indexes': {},
+    },
+    # Backtest error metrics per forecast type, sector and horizon (see
+    # forecast_scripts/backtest.py)
+    'gdp_backtest_results': {
+        'columns': {
+            'forecast_type': "VARCHAR(64) NOT NULL",
+            'method': "VARCHAR(20) NOT NULL",
+            'sector': "VARCHAR(512) NOT NULL",
+            'horizon': "SMALLINT NOT NULL",
+            'window_type': "VARCHAR(10)",
+            'train_periods': "SMALLINT",
+            'first_origin': "VARCHAR(10)",
+            'last_origin': "VARCHAR(10)",
+            'folds': "SMALLINT",
+            'failed_folds': "SMALLINT",
+            'mae': "DOUBLE",
+            'rmse': "DOUBLE",
+            'mape': "DOUBLE",
+            'run_at': "DATETIME",
+        },
+        'primary_key': ['forecast_type', 'method', 'sector', 'horizon'],
+        'indexes': {},
+    },
+    # Base dataset file last loaded into each base table (see base_manifest.py)
+    'tabGDP Base Dataset Manifest': {
+        'columns': {
+            'base_table': "VARCHAR(64) NOT NULL",
+            'sha256': "CHAR(64) NOT NULL",
+            'row_count': "INT NOT NULL",
+            'target_table': "VARCHAR(64) NOT NULL",
+            'source': "VARCHAR(255)",
+            'loaded_at': "DATETIME",
+        },
+        'primary_key': ['base_table'],
+        'indexes': {},
+    },
+    # Chunked upload sessions (see chunked_upload.py)
+    'tabGDP Upload Session': {
+        'columns': {
+            'upload_id': "VARCHAR(20) NOT NULL",
+            'dataset': "VARCHAR(32) NOT NULL",
+            'file_name': "VARCHAR(255) NOT NULL",
+            'file_size': "BIGINT NOT NULL",
+            'file_modified': "BIGINT NOT NULL DEFAULT 0",
+            'received': "BIGINT NOT NULL DEFAULT 0",
+            'parsed': "BIGINT NOT NULL DEFAULT 0",
+            'line_count': "INT NOT NULL DEFAULT 0",
+            'row_count': "INT NOT NULL DEFAULT 0",
+            'header': "TEXT",
+            'parse_errors': "INT NOT NULL DEFAULT 0",
+            'error_preview': "LONGTEXT",
+            'status': "VARCHAR(16) NOT NULL",
+            'owner': "VARCHAR(140) NOT NULL",
+            'created': "DATETIME",
+            'modified': "DATETIME",
+        },
+        'primary_key': ['upload_id'],
+        'indexes': {
+            'owner_file': ['owner', 'dataset', 'file_name'],
+            'status_modified': ['status', 'modified'],
+        },
+    },
+    # One row per upload or forecast run, written by instrumentation.run_log
+    'tabGDP Forecast Run Log': {
+        'columns': {
+            'id': "INT NOT NULL AUTO_INCREMENT",
+            'run_id': "VARCHAR(20)",
+            'run_type': "VARCHAR(20)",
+            'name': "VARCHAR(140)",
+            'status': "VARCHAR(20)",
+            'started_at': "DATETIME(6)",
+            'wall_seconds': "DOUBLE",
+            'cpu_seconds': "DOUBLE",
+            'peak_rss_mb': "DOUBLE",
+            'children_peak_rss_mb': "DOUBLE",
+            'row_count': "INT",
+            'pid': "INT",
+            'fields': "TEXT",
+            'spans': "LONGTEXT",
+            'error': "TEXT",
+            'profile': "LONGTEXT",
+        },
+        'primary_key': ['id'],
+        'indexes': {'run': ['run_type', 'name', 'started_at'], 'run_id': ['run_id']},
+    },
+}
+
+
+def column_list(columns):
+    return ", ".join(f"`{column}`" for column in columns)
+
+
+def is_virtual(definition):
+    return ' AS (' in definition
+
+
+# Columns a writer supplies (virtual columns are computed)
+def stored_columns(table):
+    return [column for column, definition in TABLES[table]['columns'].items() if not is_virtual(definition)]
+
+
+# Columns to overwrite when an upsert hits an existing key
+def update_columns(table):
+    spec = TABLES[table]
+    return [column for column in stored_columns(table)
+            if column not in spec['primary_key'] and 'AUTO_INCREMENT' not in spec['columns'][column]]
+
+
+def create_table_sql(table, name=None):
+    spec = TABLES[table]
+    lines = [f"`{column}` {definition}" for column, definition in spec['columns'].items()]
+    lines.append(f"PRIMARY KEY ({column_list(spec['primary_key'])})")
+    for index, columns in spec.get('unique', {}).items():
+        lines.append(f"UNIQUE KEY `{index}` ({column_list(columns)})")
+    for index, columns in spec['indexes'].items():
+        lines.append(f"KEY `{index}` ({column_list(columns)})")
+    body = ",\n    ".join(lines)
+    return f"CREATE TABLE IF NOT EXISTS `{name or table}` (\n    {body}\n) ENGINE=InnoDB"
+
+
+# SQL parsing the year and the quarter out of a 'YYYY-Qn' label column
+def year_from_label(column):
+    return f"CAST(SUBSTRING_INDEX(`{column}`, '-', 1) AS UNSIGNED)"
+
+
+def quarter_from_label(column):
+    return f"CAST(SUBSTRING_INDEX(`{column}`, 'Q', -1) AS UNSIGNED)"
+
+
+def table_exists(table):
+    return bool(frappe.db.sql("SHOW TABLES LIKE %s", (table,)))
+
+
+def existing_columns(table):
+    return [row[0] for row in frappe.db.sql(f"SHOW COLUMNS FROM `{table}`")]
+
+
+def existing_indexes(table):
+    return {row[2] for row in frappe.db.sql(f"SHOW INDEX FROM `{table}`")}
+
+
+def existing_primary_key(table):
+    rows = frappe.db.sql(f"SHOW INDEX FROM `{table}` WHERE Key_name = 'PRIMARY'")
+    return [row[4] for row in sorted(rows, key=lambda row: row[3])]
+
+
+# Create every missing table (used on install)
+def create_tables():
+    for table in TABLES:
+        frappe.db.sql(create_table_sql(table))
+
+
+# Add any secondary index the definition has but the table lacks
+def add_missing_indexes(table):
+    spec = TABLES[table]
+    present = existing_indexes(table)
+    for kind, indexes in (('UNIQUE KEY', spec.get('unique', {})), ('KEY', spec['indexes'])):
+        for index, columns in indexes.items():
+            if index not in present:
+                frappe.db.sql(f"ALTER TABLE `{table}` ADD {kind} `{index}` ({column_list(columns)})")
+
+
+# Bring one table to its definition. Tables in an older layout are rebuilt:
+# the old table is renamed aside, the new one created, the rows copied over
+# with `select_expressions` (new column -> SQL over the old table, defaulting
+# to the same column, or to the column default when the old table does not
+# have it) and the old table dropped. Rows that collide on the new primary
+# key are dropped (first row wins). Returns True if rebuilt.
+def migrate_table(table, select_expressions=None, where=None):
+    if not table_exists(table):
+        frappe.db.sql(create_table_sql(table))
+        return False
+    spec = TABLES[table]
+    if (set(existing_columns(table)) == set(spec['columns'])
+            and existing_primary_key(table) == spec['primary_key']):
+        add_missing_indexes(table)
+        return False
+
+    old_table = f"{table}__pre_schema"
+    frappe.db.sql(f"DROP TABLE IF EXISTS `{old_table}`")
+    frappe.db.sql(f"RENAME TABLE `{table}` TO `{old_table}`")
+    frappe.db.sql(create_table_sql(table))
+
+    select_expressions = select_expressions or {}
+    old_columns = {column.lower() for column in existing_columns(old_table)}
+    columns = [column for column in stored_columns(table)
+               if column in select_expressions or column.lower() in old_columns]
+    select_sql = ", ".join(select_expressions.get(column, f"`{column}`") for column in columns)
+    where_sql = f"WHERE {where}" if where else ""
+    frappe.db.sql(f"""
+        INSERT IGNORE INTO `{table}` ({column_list(columns)})
+        SELECT {select_sql} FROM `{old_table}` {where_sql}
+    """)
+    frappe.db.sql(f"DROP TABLE `{old_table}`")
+    return True
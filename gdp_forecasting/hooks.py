@@ -62,7 +62,7 @@ app_license = "MIT"
 # ------------
 
 # before_install = "gdp_forecasting.install.before_install"
-# after_install = "gdp_forecasting.install.after_install"
+after_install = "gdp_forecasting.gdp_forecasting.schema.create_tables"
 
 # Uninstallation
 # ------------
@@ -145,6 +145,13 @@ app_license = "MIT"
 # 	],
 # }
 
+# Expire chunked uploads that were abandoned (see chunked_upload)
+scheduler_events = {
+	"daily": [
+		"gdp_forecasting.gdp_forecasting.chunked_upload.expire_upload_sessions"
+	],
+}
+
 # Testing
 # -------
 
@@ -0,0 +1,28 @@
+import frappe
+from gdp_forecasting.gdp_forecasting.schema import migrate_table
+
+# Add the is_forecast flag to the Holt-Winters result tables. Existing rows
+# are forecasts when they have an RMSE or lie after the sector's last period
+# in the dataset (annual forecasts used to be stored with RMSE 0).
+PERIODS = {
+    'tabHolt Winters Annual': ('tabAnnual Dataset', ['year']),
+    'holt_winters_quarterly': ('tabQuarterly Dataset', ['year', 'quarter']),
+}
+
+
+# Sortable number for a period: year, or year * 10 + quarter
+def period_number(alias, columns):
+    return " * 10 + ".join(f"{alias}.`{column}`" for column in columns)
+
+
+def execute():
+    for table, (dataset, columns) in PERIODS.items():
+        migrate_table(table, {'is_forecast': "0"})
+        frappe.db.sql(f"""
+            UPDATE `{table}` AS result
+            SET `is_forecast` = 1
+            WHERE result.rmse <> 0 OR {period_number('result', columns)} > (
+                SELECT MAX({period_number('dataset', columns)}) FROM `{dataset}` dataset
+                WHERE dataset.sector = result.sector
+            )
+        """)
@@ -0,0 +1,8 @@
+import frappe
+from gdp_forecasting.gdp_forecasting.schema import create_table_sql
+
+# Metrics of the rolling-origin backtests (see forecast_scripts.backtest)
+
+
+def execute():
+    frappe.db.sql(create_table_sql('gdp_backtest_results'))
@@ -0,0 +1,10 @@
+import frappe
+from gdp_forecasting.gdp_forecasting.base_manifest import MANIFEST_TABLE
+from gdp_forecasting.gdp_forecasting.schema import create_table_sql
+
+# Manifest of loaded base dataset files (see gdp_forecasting.base_manifest).
+# It starts empty, so the next upload loads every base table once.
+
+
+def execute():
+    frappe.db.sql(create_table_sql(MANIFEST_TABLE))
@@ -0,0 +1,9 @@
+import frappe
+from gdp_forecasting.gdp_forecasting.schema import create_table_sql
+
+# Result tables of the hierarchical forecasts (see forecast_scripts.hierarchical)
+
+
+def execute():
+    for table in ('hierarchical_annual', 'hierarchical_quarterly'):
+        frappe.db.sql(create_table_sql(table))
@@ -0,0 +1,12 @@
+import frappe
+from gdp_forecasting.gdp_forecasting.productivity import CUBE_TABLE, refresh_productivity_cube
+from gdp_forecasting.gdp_forecasting.schema import create_table_sql, table_exists
+
+# GDP per worker cube (see gdp_forecasting.productivity), filled from the
+# gdp and workforce rows already loaded
+
+
+def execute():
+    frappe.db.sql(create_table_sql(CUBE_TABLE))
+    if table_exists('gdp') and table_exists('workforce'):
+        refresh_productivity_cube()
@@ -0,0 +1,8 @@
+import frappe
+from gdp_forecasting.gdp_forecasting.schema import create_table_sql
+
+# Run log of upload and forecast runs (see gdp_forecasting.instrumentation)
+
+
+def execute():
+    frappe.db.sql(create_table_sql('tabGDP Forecast Run Log'))
@@ -0,0 +1,9 @@
+import frappe
+from gdp_forecasting.gdp_forecasting.chunked_upload import SESSION_TABLE
+from gdp_forecasting.gdp_forecasting.schema import create_table_sql
+
+# Sessions of chunked uploads (see gdp_forecasting.chunked_upload)
+
+
+def execute():
+    frappe.db.sql(create_table_sql(SESSION_TABLE))
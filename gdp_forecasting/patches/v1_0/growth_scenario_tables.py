@@ -0,0 +1,56 @@
+import frappe
+from gdp_forecasting.gdp_forecasting.growth_scenarios import FREQUENCIES, SCENARIO_TABLE, store_growth_rates
+from gdp_forecasting.gdp_forecasting.schema import (
+    create_table_sql, existing_columns, quarter_from_label, table_exists, year_from_label
+)
+
+# Growth-rate scenarios are computed on request (see growth_scenarios.py).
+# Create the base and scenario tables and reduce the rows of the old
+# Annual_GrowthRates / Quarterly_GrowthRates tables to them. The old tables
+# are renamed aside (`<table>__pre_scenarios`), not dropped: a sheet whose
+# rates change over time is only approximated by constant-rate scenarios,
+# and its rows are the only copy of the exact values. Quarterly tables from
+# before the keyed schema still have a 'YYYY-Qn' YearQuarter column instead
+# of Year and Quarter.
+
+# Largest relative gap between an old value and its recomputed scenario path
+# that is accepted without a warning
+MAX_RELATIVE_ERROR = 0.001
+
+
+def old_rows(frequency, table):
+    if frequency == 'annual':
+        periods = "`Year`"
+    elif 'Quarter' in existing_columns(table):
+        periods = "`Year`, `Quarter`"
+    else:
+        periods = f"{year_from_label('YearQuarter')}, {quarter_from_label('YearQuarter')}"
+    return frappe.db.sql(f"""
+        SELECT `Sector`, `GrowthRate`, {periods}, `Value` FROM `{table}`
+        WHERE `Sector` IS NOT NULL AND `GrowthRate` IS NOT NULL AND `Value` IS NOT NULL
+    """)
+
+
+def warn_lossy(table, old_table, max_error):
+    message = (
+        f"{table}: the growth-rate scenarios differ from the stored values by up to {max_error:.2%} "
+        f"(more than {MAX_RELATIVE_ERROR:.2%}). The original rows are kept in `{old_table}`; check the "
+        f"scenarios, or upload the sheet again, before dropping it."
+    )
+    frappe.logger("gdp_forecasting").warning(message)
+    print(f"WARNING: {message}")
+
+
+def execute():
+    for table in [spec['table'] for spec in FREQUENCIES.values()] + [SCENARIO_TABLE]:
+        frappe.db.sql(create_table_sql(table))
+    for frequency, spec in FREQUENCIES.items():
+        if not table_exists(spec['file']):
+            continue
+        rows = old_rows(frequency, spec['file'])
+        max_error = store_growth_rates(frequency, rows)['max_relative_error'] if rows else 0.0
+        old_table = f"{spec['file']}__pre_scenarios"
+        frappe.db.sql(f"DROP TABLE IF EXISTS `{old_table}`")
+        frappe.db.sql(f"RENAME TABLE `{spec['file']}` TO `{old_table}`")
+        if max_error > MAX_RELATIVE_ERROR:
+            warn_lossy(spec['file'], old_table, max_error)
@@ -0,0 +1,42 @@
+import frappe
+from gdp_forecasting.gdp_forecasting.schema import TABLES, migrate_table, quarter_from_label, year_from_label
+
+# Rebuild the dataset and forecast tables created by earlier versions (no
+# keys, VARCHAR 'YYYY-Qn' periods) on the keyed layout in schema.py. Rows with
+# no sector or period cannot be keyed and are dropped; rows repeating a key
+# keep the first copy. Tables already on the new layout only get any missing
+# indexes.
+
+# New column -> SQL over the old table, for columns that changed
+SELECT_EXPRESSIONS = {
+    'tabAnnual Dataset': {'sub_sector': "IFNULL(`sub_sector`, '')"},
+    'gdp': {'YearNumber': year_from_label('Quarter'), 'QuarterNumber': quarter_from_label('Quarter')},
+    'workforce': {'YearNumber': year_from_label('Quarter'), 'QuarterNumber': quarter_from_label('Quarter')},
+    'Quarterly_GrowthRates': {'Year': year_from_label('YearQuarter'), 'Quarter': quarter_from_label('YearQuarter')},
+    'tabHolt Winters Annual': {'name': "IFNULL(`name`, CONCAT(`sector`, '-', `year`))", 'is_forecast': "0"},
+    'holt_winters_quarterly': {
+        'year': year_from_label('year_quarter'), 'quarter': quarter_from_label('year_quarter'), 'is_forecast': "0",
+    },
+    'arima_quarterly': {'year': year_from_label('year_quarter'), 'quarter': quarter_from_label('year_quarter')},
+}
+
+# Old columns that must be present for a row to be kept
+REQUIRED_COLUMNS = {
+    'tabAnnual Dataset': ['sector', 'year'],
+    'tabQuarterly Dataset': ['sector', 'year', 'quarter'],
+    'gdp': ['Region', 'Quarter'],
+    'workforce': ['Quarter'],
+    'Annual_GrowthRates': ['Sector', 'GrowthRate', 'Year'],
+    'Quarterly_GrowthRates': ['Sector', 'GrowthRate', 'YearQuarter'],
+    'tabHolt Winters Annual': ['sector', 'year'],
+    'holt_winters_quarterly': ['sector', 'year_quarter'],
+    'arima_annual': ['sector', 'year'],
+    'arima_quarterly': ['sector', 'year_quarter'],
+}
+
+
+def execute():
+    for table in TABLES:
+        where = " AND ".join(f"`{column}` IS NOT NULL" for column in REQUIRED_COLUMNS.get(table, []))
+        if migrate_table(table, SELECT_EXPRESSIONS.get(table), where or None):
+            frappe.logger("gdp_forecasting").info(f"Rebuilt {table} on the keyed schema")
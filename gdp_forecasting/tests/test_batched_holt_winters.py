@@ -0,0 +1,49 @@
+import warnings
+import numpy as np
+import pytest
+from statsmodels.tools.sm_exceptions import ConvergenceWarning
+from statsmodels.tsa.holtwinters import ExponentialSmoothing
+from gdp_forecasting.forecast_scripts.batched_holt_winters import (
+    compare_with_statsmodels, fit_sectors, is_batched, synthetic_series
+)
+
+# (length, seasonal_periods, forecast steps, tolerance) of the series the
+# forecasters fit (annual: 2010-2023). Annual series are short and their fits
+# are close to flat in the parameters, so equally good fits can forecast a
+# few percent apart seven years out.
+SHAPES = {
+    'quarterly': (36, 4, 8, 0.05),
+    'annual': (14, 3, 7, 0.1),
+}
+MODELS = [('add', 'add'), ('add', None), ('add', 'mul'), ('mul', None), ('mul', 'add'), ('mul', 'mul')]
+
+
+@pytest.fixture(autouse=True)
+def quiet_statsmodels():
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', ConvergenceWarning)
+        yield
+
+
+@pytest.mark.parametrize('shape', SHAPES)
+@pytest.mark.parametrize('trend, seasonal', MODELS)
+def test_batched_models_match_statsmodels(shape, trend, seasonal):
+    length, seasonal_periods, steps, tolerance = SHAPES[shape]
+    assert is_batched(trend, seasonal, seasonal_periods, length)
+    Y = synthetic_series(20, length, seasonal_periods)
+    result = compare_with_statsmodels(Y, steps, trend, seasonal, seasonal_periods, tolerance=tolerance)
+    assert result['within_tolerance'], result
+
+
+# Multiplicative models of series barely longer than their parameters are
+# not batched: fit_sectors gives statsmodels' forecasts for them
+@pytest.mark.parametrize('trend, seasonal', [('mul', 'add'), ('mul', 'mul')])
+def test_short_multiplicative_series_use_statsmodels(trend, seasonal):
+    seasonal_periods, steps = 3, 7
+    Y = synthetic_series(3, 9, seasonal_periods)
+    params = (trend, seasonal, seasonal_periods)
+    assert not is_batched(trend, seasonal, seasonal_periods, Y.shape[1])
+    fitted = fit_sectors({row: values for row, values in enumerate(Y)}, dict.fromkeys(range(len(Y)), params), steps, workers=1)
+    for row, values in enumerate(Y):
+        reference = ExponentialSmoothing(values, trend=trend, seasonal=seasonal, seasonal_periods=seasonal_periods).fit()
+        np.testing.assert_allclose(fitted[row][0], reference.forecast(steps))
@@ -0,0 +1,45 @@
+import pandas as pd
+import pytest
+import frappe
+from gdp_forecasting.gdp_forecasting import delta_upload
+from gdp_forecasting.gdp_forecasting.benchmark import SQLiteDatabase
+
+TIMESTAMP = '2024-01-01 00:00:00'
+
+
+@pytest.fixture
+def db(monkeypatch):
+    db = SQLiteDatabase()
+    monkeypatch.setattr(frappe, 'db', db, raising=False)
+    db.sql("""INSERT INTO `tabAnnual Dataset` (sector, sub_sector, year, gdp)
+        VALUES ('Mining', 'Oil', 2022, 1), ('Mining', 'Oil', 2023, 2)""")
+    db.commit()
+    return db
+
+
+def upload(years, values):
+    frame = pd.DataFrame({'sector': 'Mining', 'sub_sector': 'Oil', 'year': years, 'gdp': values})
+    return delta_upload.apply_delta_upload(frame, 'Annual', TIMESTAMP)
+
+
+def stored_rows(db):
+    return db.sql("SELECT year, gdp FROM `tabAnnual Dataset` ORDER BY year")
+
+
+def test_delta_upload_applies_and_logs_changes(db):
+    stats = upload([2023, 2024], [5.0, 6.0])
+
+    assert (stats['inserted'], stats['updated'], stats['deleted']) == (1, 1, 1)
+    assert stored_rows(db) == ((2023, 5.0), (2024, 6.0))
+    assert db.sql("SELECT change_type, year FROM `tabGDP Dataset Change` ORDER BY year") == (
+        ('delete', 2022), ('update', 2023), ('insert', 2024)
+    )
+
+
+# A failure after the deletes leaves the stored dataset as it was
+def test_failed_delta_upload_is_rolled_back(db):
+    db.sql(f"DROP TABLE `{delta_upload.CHANGE_LOG_TABLE}`")
+
+    with pytest.raises(Exception):
+        upload([2023, 2024], [5.0, 6.0])
+    assert stored_rows(db) == ((2022, 1.0), (2023, 2.0))
@@ -0,0 +1,13 @@
+import pytest
+from gdp_forecasting.forecast_scripts.registry import ENDPOINT_MODULES, HEAVY_LIBRARIES, measure_import
+
+# Cold import of an endpoint module, frappe included, in a fresh interpreter
+IMPORT_BUDGET_SECONDS = 3.0
+
+
+@pytest.mark.parametrize('module', ENDPOINT_MODULES)
+def test_endpoint_import_cost(module):
+    result = measure_import(module)
+    assert 'error' not in result, result.get('error')
+    assert not set(result['heavy_loaded']) & set(HEAVY_LIBRARIES), f"{module} imports {result['heavy_loaded']}"
+    assert result['seconds'] < IMPORT_BUDGET_SECONDS, f"{module} took {result['seconds']:.2f}s to import"
@@ -0,0 +1,24 @@
+import numpy as np
+from gdp_forecasting.forecast_scripts.parallel_fit import map_sectors
+from gdp_forecasting.forecast_scripts.sector_models import evaluate_candidate
+
+
+def candidate_tasks():
+    rng = np.random.default_rng(0)
+    tasks = []
+    for sector in range(6):
+        ts = 100 + np.cumsum(rng.normal(1, 2, 24)) + np.tile([3.0, -1.0, -4.0, 2.0], 6)
+        for candidate in (('add', 'add', 4), ('add', None, 4)):
+            tasks.append(((f"Sector {sector}", candidate), (ts[:20], ts[20:]) + candidate))
+    return tasks
+
+
+# The process pool returns the serial results, in task order
+def test_parallel_fit_matches_serial_run():
+    tasks = candidate_tasks()
+    serial = map_sectors(evaluate_candidate, tasks, workers=1)
+    parallel = map_sectors(evaluate_candidate, tasks, workers=2)
+
+    assert [key for key, _ in serial] == [key for key, _ in tasks]
+    assert [key for key, _ in parallel] == [key for key, _ in tasks]
+    assert parallel == serial
@@ -0,0 +1,23 @@
+import pytest
+import frappe
+from gdp_forecasting.gdp_forecasting.benchmark import SQLiteDatabase
+from gdp_forecasting.gdp_forecasting.instrumentation import RUN_LOG_TABLE, run_log
+
+
+@pytest.fixture
+def db(monkeypatch):
+    db = SQLiteDatabase()
+    monkeypatch.setattr(frappe, 'db', db, raising=False)
+    return db
+
+
+# A failed run's entry is saved without committing the run's partial writes
+def test_failed_run_is_logged_without_its_writes(db):
+    with pytest.raises(ValueError):
+        with run_log('upload', 'Annual'):
+            db.sql("INSERT INTO `tabAnnual Dataset` (sector, sub_sector, year, gdp) VALUES ('Mining', 'Oil', 2023, 1)")
+            raise ValueError("bad row")
+
+    db.rollback()
+    assert db.sql("SELECT COUNT(*) FROM `tabAnnual Dataset`") == ((0,),)
+    assert db.sql(f"SELECT run_type, name, status FROM `{RUN_LOG_TABLE}`") == (('upload', 'Annual', 'Failed'),)
@@ -0,0 +1,124 @@
+import re
+import pytest
+import frappe
+from gdp_forecasting.gdp_forecasting import schema
+from gdp_forecasting.gdp_forecasting.benchmark import SQLiteDatabase
+from gdp_forecasting.patches.v1_0 import add_forecast_flag, keyed_dataset_schema
+
+# The Holt-Winters result tables as the baseline created them
+OLD_TABLES = {
+    'tabHolt Winters Annual': """
+        CREATE TABLE `tabHolt Winters Annual` (
+            `id` INTEGER PRIMARY KEY, `name` VARCHAR(255) UNIQUE, `sector` VARCHAR(255), `year` INT,
+            `gdp` FLOAT, `rmse` FLOAT
+        )""",
+    'holt_winters_quarterly': """
+        CREATE TABLE `holt_winters_quarterly` (
+            `id` INTEGER PRIMARY KEY, `sector` VARCHAR(255), `year_quarter` VARCHAR(50), `gdp` FLOAT, `rmse` FLOAT
+        )""",
+}
+
+
+def substring_index(value, delimiter, count):
+    parts = str(value).split(delimiter)
+    return delimiter.join(parts[:count] if count > 0 else parts[count:])
+
+
+# SQLite stand-in for the MySQL statements and introspection the patches use
+class MigrationDatabase(SQLiteDatabase):
+    def __init__(self):
+        super().__init__()
+        self.connection.create_function('SUBSTRING_INDEX', 3, substring_index)
+        self.connection.create_function('CONCAT', -1, lambda *parts: ''.join(str(part) for part in parts))
+
+    def sql(self, query, values=None, as_dict=False, **kwargs):
+        match = re.match(r"RENAME TABLE `([^`]+)` TO `([^`]+)`", query)
+        if match:
+            # SQLite index names are global: free them for the new table
+            for (index,) in self.connection.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL",
+                (match.group(1),)
+            ).fetchall():
+                self.connection.execute(f"DROP INDEX `{index}`")
+            query = f"ALTER TABLE `{match.group(1)}` RENAME TO `{match.group(2)}`"
+        return super().sql(query, values, as_dict, **kwargs)
+
+    def columns(self, table):
+        return self.connection.execute(f"PRAGMA table_xinfo(`{table}`)").fetchall()
+
+
+@pytest.fixture
+def db(monkeypatch):
+    db = MigrationDatabase()
+    monkeypatch.setattr(frappe, 'db', db, raising=False)
+    monkeypatch.setattr(schema, 'table_exists', lambda table: bool(db.connection.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchall()))
+    monkeypatch.setattr(schema, 'existing_columns', lambda table: [row[1] for row in db.columns(table)])
+    monkeypatch.setattr(schema, 'existing_primary_key', lambda table: [
+        row[1] for row in sorted(db.columns(table), key=lambda row: row[5]) if row[5]])
+    monkeypatch.setattr(schema, 'add_missing_indexes', lambda table: None)
+
+    def create_table_sql(table, name=None):
+        db.create_table(table, name)
+        return "SELECT 1"
+    monkeypatch.setattr(schema, 'create_table_sql', create_table_sql)
+    for table, create in OLD_TABLES.items():
+        db.connection.execute(f"DROP TABLE `{table}`")
+        db.connection.execute(create)
+    return db
+
+
+def fill_old_tables(db):
+    db.sql("INSERT INTO `tabAnnual Dataset` (sector, year, gdp) VALUES ('Mining', 2022, 1), ('Mining', 2023, 2)")
+    db.sql("INSERT INTO `tabQuarterly Dataset` (sector, year, quarter, gdp) VALUES ('Mining', 2023, 4, 1)")
+    db.sql("""INSERT INTO `tabHolt Winters Annual` (name, sector, year, gdp, rmse)
+        VALUES ('Mining-2023', 'Mining', 2023, 2, 0), ('Mining-2024', 'Mining', 2024, 3, 0)""")
+    db.sql("""INSERT INTO `holt_winters_quarterly` (sector, year_quarter, gdp, rmse)
+        VALUES ('Mining', '2023-Q4', 1, 0), ('Mining', '2024-Q1', 2, 0.5)""")
+
+
+def result_rows(db):
+    return {
+        table: db.sql(f"SELECT sector, {period}, gdp, is_forecast FROM `{table}` ORDER BY {period}")
+        for table, period in (('tabHolt Winters Annual', 'year'), ('holt_winters_quarterly', 'year, quarter'))
+    }
+
+
+# A table missing a new column is rebuilt with the column's default
+def test_migrate_table_defaults_columns_missing_from_the_old_table(db):
+    fill_old_tables(db)
+
+    assert schema.migrate_table('tabHolt Winters Annual')
+    assert db.sql("SELECT name, sector, year, gdp, is_forecast FROM `tabHolt Winters Annual` ORDER BY year") == (
+        ('Mining-2023', 'Mining', 2023, 2.0, 0), ('Mining-2024', 'Mining', 2024, 3.0, 0)
+    )
+    assert not schema.table_exists('tabHolt Winters Annual__pre_schema')
+
+
+# Upgrading from the baseline: the keyed layout, then the forecast flag
+def test_upgrade_keeps_results_and_flags_forecasts(db):
+    fill_old_tables(db)
+
+    keyed_dataset_schema.execute()
+    add_forecast_flag.execute()
+
+    assert result_rows(db) == {
+        'tabHolt Winters Annual': (('Mining', 2023, 2.0, 0), ('Mining', 2024, 3.0, 1)),
+        'holt_winters_quarterly': (('Mining', 2023, 4, 1.0, 0), ('Mining', 2024, 1, 2.0, 1)),
+    }
+    for table in OLD_TABLES:
+        assert not schema.table_exists(f"{table}__pre_schema")
+
+
+# Sites already on the keyed layout only gain the column
+def test_forecast_flag_on_keyed_tables(db):
+    for table in OLD_TABLES:
+        db.connection.execute(f"DROP TABLE `{table}`")
+        db.create_table(table)
+        db.connection.execute(f"ALTER TABLE `{table}` DROP COLUMN `is_forecast`")
+    db.sql("INSERT INTO `tabAnnual Dataset` (sector, year, gdp) VALUES ('Mining', 2023, 2)")
+    db.sql("INSERT INTO `tabHolt Winters Annual` (name, sector, year, gdp, rmse) VALUES ('Mining-2030', 'Mining', 2030, 3, 0)")
+
+    add_forecast_flag.execute()
+
+    assert result_rows(db)['tabHolt Winters Annual'] == (('Mining', 2030, 3.0, 1),)
@@ -5,6 +5,46 @@ function selectForecast(forecast) {
     selectedForecast = forecast;
 }
 
+var POLL_INTERVAL_MS = 2000;
+
+function showStatus(text) {
+    document.getElementById('forecast-status').textContent = text;
+}
+
+function pollForecast(jobId) {
+    frappe.call({
+        method: "gdp_forecasting.gdp_forecasting.forecast_jobs.get_forecast_status",
+        args: {
+            job_id: jobId
+        },
+        callback: function(response) {
+            var status = response.message;
+            if (!status) {
+                return;
+            }
+            var elapsed = status.elapsed ? " (" + Math.round(status.elapsed) + "s)" : "";
+            if (status.status === "completed") {
+                showStatus("Forecast completed" + elapsed + ".");
+                setTimeout(function() {
+                    window.location.href = '/app/query-report/GDP%20Forecasting'
+                }, 1000);
+            } else if (status.status === "failed") {
+                showStatus("Forecast failed: " + (status.error || "unknown error"));
+                frappe.msgprint("There was an error while running the forecast.");
+            } else {
+                var progress = status.total ? " " + status.completed + "/" + status.total + " sectors" : "";
+                var sector = status.current_sector ? ", last: " + status.current_sector : "";
+                showStatus("Forecast " + status.status + progress + sector + elapsed);
+                setTimeout(function() { pollForecast(jobId); }, POLL_INTERVAL_MS);
+            }
+        },
+        error: function(err) {
+            frappe.msgprint("Could not fetch the forecast status.");
+            console.error(err);
+        }
+    });
+}
+
 function runFunction() {
     if (!selectedForecast) {
         frappe.msgprint("Please select a forecast type before running.");
@@ -17,10 +57,9 @@ function runFunction() {
             forecast_type: selectedForecast 
         },
         callback: function(response) {
-            if (response.message) {
-                setTimeout(function() {
-                    window.location.href = '/app/query-report/GDP%20Forecasting'
-                }, 1000);
+            if (response.message && response.message.job_id) {
+                showStatus("Forecast queued");
+                pollForecast(response.message.job_id);
             }
         },
         error: function(err) {
@@ -12,83 +12,111 @@
             });
         });
 
-        const fileInput1 = document.getElementById("upload-file-1");
-        const fileNameDisplay1 = document.getElementById("file-name-1");
+        // Files are only sent on Save: the dataset (1) and the base datasets (2-5)
+        const uploads = [
+            { index: 1, dataset: null },
+            { index: 2, dataset: "gdp" },
+            { index: 3, dataset: "workforce" },
+            { index: 4, dataset: "Annual_GrowthRates" },
+            { index: 5, dataset: "Quarterly_GrowthRates" }
+        ];
 
-        fileInput1.addEventListener("change", function() {
-            const fileName = fileInput1.files[0] ? fileInput1.files[0].name : "No file selected";
-            uploadFile(fileInput1.files[0], "file");
-            fileNameDisplay1.textContent = fileName;
+        uploads.forEach(upload => {
+            const fileInput = document.getElementById("upload-file-" + upload.index);
+            const fileNameDisplay = document.getElementById("file-name-" + upload.index);
+            fileInput.addEventListener("change", function() {
+                fileNameDisplay.textContent = fileInput.files[0] ? fileInput.files[0].name : "No file selected";
+            });
         });
 
 
-        document.getElementById('save-button').addEventListener('click', function() {
-            const filePaths = [
-                document.getElementById("file-name-1").textContent, 
-                document.getElementById("file-name-2").textContent, 
-                document.getElementById("file-name-3").textContent, 
-                document.getElementById("file-name-4").textContent,
-                document.getElementById("file-name-5").textContent
-            ];
-
-            const useExisting = document.getElementById("use-existing-5").checked ? "Yes" : "No";
-
-            console.log(filePaths, useExisting, selectedDropdownValue)
+        document.getElementById('save-button').addEventListener('click', async function() {
+            const uploadMode = document.getElementById("incremental-upload").checked ? "incremental" : "replace";
+            const selected = uploads.filter(upload => {
+                const useExisting = document.getElementById("use-existing-" + upload.index);
+                return document.getElementById("upload-file-" + upload.index).files[0]
+                    && !(useExisting && useExisting.checked);
+            });
 
-            frappe.call({
-                method: "gdp_forecasting.gdp_forecasting.gdp_forecasting.upload_file",
-                args: {
-                    file: filePaths,
-                    use_existing: useExisting,
-                    dataset_type: selectedDropdownValue
-                },
-                callback: function(response) {
-                    if (response.message) {
-                        console.log('Success:', response.message);
-                        setTimeout(function() {
-                            window.location.href = "/forecast";
-                        }, 1000);
-                    } else {
-                        console.log('Error in the response');
-                    }
-                },
-                error: function(error) {
-                    console.error('Error during frappe.call:', error);
+            try {
+                const uploadIds = [];
+                for (const upload of selected) {
+                    const file = document.getElementById("upload-file-" + upload.index).files[0];
+                    const display = document.getElementById("file-name-" + upload.index);
+                    const dataset = upload.dataset || selectedDropdownValue;
+                    uploadIds.push(await streamFile(file, dataset, function(received) {
+                        display.textContent = file.name + " (" + Math.floor(100 * received / Math.max(file.size, 1)) + "%)";
+                    }));
                 }
-            });
+                const response = await callMethod("complete_upload", {
+                    upload_ids: JSON.stringify(uploadIds),
+                    upload_mode: uploadMode
+                });
+                console.log('Success:', response);
+                setTimeout(function() {
+                    window.location.href = "/forecast";
+                }, 1000);
+            } catch (error) {
+                // Saving again resumes the unfinished files where they stopped
+                console.error('Error during upload:', error);
+            }
         });
 
     });
 
-    function uploadFile(file, displayId) {
-        
-        let formData = new FormData();
-        formData.append('file', file);
-        formData.append('file_name', file.name);
-        formData.append('file_size', file.size);
-        formData.append('attached_to_field', displayId);
-        formData.append('file_url', "/private/files/" + file.name);
-        formData.append('folder', "Home/Attachments"); 
-        formData.append('is_private', 1);
+    const UPLOAD_METHODS = "gdp_forecasting.gdp_forecasting.chunked_upload.";
+    const CHUNK_RETRIES = 3;
 
-        fetch('/api/method/upload_file', {
+    function callMethod(method, args, chunk) {
+        let formData = new FormData();
+        Object.keys(args).forEach(key => formData.append(key, args[key]));
+        if (chunk) {
+            formData.append('chunk', chunk, 'chunk');
+        }
+        return fetch('/api/method/' + UPLOAD_METHODS + method, {
             method: 'POST',
             body: formData,
             headers: {
                 'X-Frappe-CSRF-Token': frappe.csrf_token
             }
         })
-        .then(response => response.json())
-        .then(data => {
-            if (data.message) {
-                console.log("File uploaded successfully:", data.message.file_url);
-            } else {
-                console.error("Error in response:", data);
+        .then(response => response.json().then(data => {
+            if (!response.ok) {
+                throw data;
             }
-        })
-        .catch(error => {
-            console.error("Error uploading file:", error);
+            return data.message;
+        }));
+    }
+
+    // Send a file in chunks from the offset the server has (0, or where an
+    // interrupted upload of the same file stopped). Returns the upload id.
+    async function streamFile(file, dataset, onProgress) {
+        let state = await callMethod("start_upload", {
+            dataset: dataset,
+            file_name: file.name,
+            file_size: file.size,
+            file_modified: file.lastModified
         });
+        onProgress(state.received);
+        let failures = 0;
+        while (state.received < file.size) {
+            const chunk = file.slice(state.received, state.received + state.chunk_size);
+            try {
+                state = await callMethod("upload_chunk", {
+                    upload_id: state.upload_id,
+                    offset: state.received
+                }, chunk);
+                failures = 0;
+            } catch (error) {
+                if (++failures > CHUNK_RETRIES) {
+                    throw error;
+                }
+                await new Promise(resolve => setTimeout(resolve, 1000 * failures));
+                state = await callMethod("get_upload", { upload_id: state.upload_id });
+            }
+            onProgress(state.received);
+        }
+        return state.upload_id;
     }
 
     new WOW().init();